@@ -6,7 +6,7 @@ from library.models import Paper
 class MyDBSCAN(models.Model):
     step = models.ForeignKey(Step, models.CASCADE, blank=True, null=True)
     dataframe = models.ForeignKey(Paper, models.SET_NULL, blank=True, null=True, related_name="dbscan_dataframe")
-    knn_figure = models.TextField(blank=True)
+    knn_figure = models.CharField(max_length=64, blank=True)  # digest of the figure file, see task_manager.figures
     model = models.ForeignKey(Paper, models.SET_NULL, blank=True, null=True, related_name="dbscan_model")
     class_dict = models.TextField(blank=True)
 
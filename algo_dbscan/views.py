@@ -1,12 +1,10 @@
 import io
 import json
-import pickle
 
 import numpy as np
 import pandas as pd
 from django import forms
 from django.contrib.auth.decorators import permission_required
-from django.core.files.base import ContentFile
 from django.shortcuts import render, redirect
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST
@@ -14,7 +12,10 @@ from sklearn.neighbors import NearestNeighbors
 from sklearn.cluster import DBSCAN
 import matplotlib.pyplot as plt
 
+from library.serialization import dump_paper, load_paper
 import task_manager.views
+from task_manager.columns import flag_columns, replace_columns, unflag_columns
+from task_manager.figures import save_figure
 from task_manager.models import OpenedTask
 from .models import *
 
@@ -108,28 +109,24 @@ def import_data(req):
     algorithm_ = MyDBSCAN.objects.get(step=step)
     try:
         # ---------- Asynchronous Algorithm START   ----------
-        intermediate_paper_handle = ContentFile(pickle.dumps(table))
+        intermediate_paper_handle = dump_paper(table, 2)
         new_paper = Paper(user=req.user, role=2,
                           name=f"DBSCAN #{algorithm_.id} Parsed Data")
-        new_paper.file.save(f"dbscan_{algorithm_.id}_parsed_data.pkl", intermediate_paper_handle)
+        new_paper.file.save(f"dbscan_{algorithm_.id}_parsed_data.joblib", intermediate_paper_handle)
         new_paper.save()
         algorithm_.dataframe = new_paper
         algorithm_.save()
-        for column in Column.objects.filter(algorithm=algorithm_):
-            column.delete()
-        for col in table.columns:
-            new_column = Column(algorithm=algorithm_, name=col)
-            new_column.save()
+        replace_columns(Column, algorithm_, table.columns)
         # ---------- Asynchronous Algorithm END   ----------
     except Exception as e:
         step.status = 4
         step.error_message = str(e)
-        step.save()
+        step.save(update_fields=['status', 'error_message'])
         context = {"color": "danger", "content": "Interrupted.",
                    "refresh": f"/algo_dbscan/{algorithm_.id}"}
         return render(req, "task_manager/hint_widget.html", context)
     step.status = 3
-    step.save()
+    step.save(update_fields=['status'])
     context = {"color": "success", "content": "The file is successfully parsed.",
                "refresh": f"/algo_dbscan/{algorithm_.id}"}
     return render(req, "task_manager/hint_widget.html", context)
@@ -150,24 +147,20 @@ def set_variables(req):
         context = {"color": "danger", "content": "Submission is not valid."}
         return render(req, "task_manager/hint_widget.html", context)
     # ---------- Algorithm Ownership Validator v2 END   ----------
-    for column in variable_picker.cleaned_data['Independent_Variables_X']:
-        column.x_column = True
-        column.save()
+    flag_columns(Column, algorithm_, x_column=variable_picker.cleaned_data['Independent_Variables_X'])
     # K Nearest Neighbour
     columns = [x.name for x in variable_picker.cleaned_data['Independent_Variables_X']]
     try:
-        dataframe = pd.read_pickle(algorithm_.dataframe.file.path)
+        dataframe = load_paper(algorithm_.dataframe)
         neighbor = NearestNeighbors(n_neighbors=2 * len(columns))
         neighbor.fit(dataframe[columns])
         distance, _ = neighbor.kneighbors(dataframe[columns])
         nearest_distance = np.sort(distance, axis=0)[:, -1]
-        f, fig = io.BytesIO(), plt.figure()
+        fig = plt.figure()
         plt.plot(nearest_distance)
         plt.ylabel("Minkowski p=2 Distance of Nearest Neighbor")
         plt.xlabel("Sample Ranking")
-        fig.savefig(f, format='svg')
-        plt.close(fig)
-        algorithm_.knn_figure = f.getvalue().decode(encoding='utf-8')
+        algorithm_.knn_figure = save_figure(fig)
         algorithm_.save()
     except Exception as e:
         context = {'color': 'danger', 'content': f'Errors occurred when calculating K neighbor distances. {e}'}
@@ -190,9 +183,7 @@ def clear_variables(req, algo_id):
     # ---------- Algorithm Ownership Navigator END   ----------
     if algorithm_.step.status == 2:
         return redirect("/task/retrieve?message=Cannot start because this algorithm is busy.&color=warning")
-    for column in Column.objects.filter(algorithm=algorithm_):
-        column.x_column = False
-        column.save()
+    unflag_columns(Column, algorithm_, 'x_column')
     algorithm_.knn_figure = str()
     algorithm_.save()
     return redirect(f"/algo_dbscan/{algorithm_.id}")
@@ -219,18 +210,18 @@ def train_model(req):
         context = {"color": "warning", "content": "Cannot start because this algorithm is busy."}
         return render(req, "task_manager/hint_widget.html", context)
     step.status = 2
-    step.save()
+    step.save(update_fields=['status'])
     try:
         # ---------- Asynchronous Algorithm START ----------
-        dataframe = pd.read_pickle(algorithm_.dataframe.file.path)
+        dataframe = load_paper(algorithm_.dataframe)
         x_col = [x.name for x in Column.objects.filter(algorithm=algorithm_, x_column=True)]
         x = dataframe[x_col].values
         dbscan = DBSCAN(eps=train.cleaned_data['epsilon'], min_samples=2 * len(x_col))
         dataframe['dbscan_class_labels'] = class_labels = dbscan.fit_predict(x)
 
-        intermediate_paper_handle = ContentFile(pickle.dumps(dbscan))
+        intermediate_paper_handle = dump_paper(dbscan, 3)
         new_paper = Paper(user=req.user, role=3, name=f'DBSCAN #{algorithm_.id} Model')
-        new_paper.file.save(f'dbscan_{algorithm_.id}_model.pkl', intermediate_paper_handle)
+        new_paper.file.save(f'dbscan_{algorithm_.id}_model.joblib', intermediate_paper_handle)
         new_paper.save()
         algorithm_.model = new_paper
 
@@ -248,13 +239,13 @@ def train_model(req):
     except Exception as e:
         step.status = 4
         step.error_message = str(e)
-        step.save()
+        step.save(update_fields=['predicted_data', 'status', 'error_message'])
         context = {"color": "danger", "content": "Interrupted.",
                    "refresh": f"/algo_dbscan/{algorithm_.id}"}
         return render(req, "task_manager/hint_widget.html", context)
     algorithm_.save()
     step.status = 3
-    step.save()
+    step.save(update_fields=['predicted_data', 'status'])
     context = {"color": "success", "content": "The model has been trained and evaluated.",
                "refresh": f"/algo_dbscan/{algorithm_.id}"}
     return render(req, "task_manager/hint_widget.html", context)
@@ -0,0 +1,18 @@
+# Generated by Django 4.0.4 on 2026-10-19 17:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('algo_elastic_net', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='myelasticnet',
+            name='coefficient_path',
+            field=models.TextField(blank=True),
+        ),
+    ]
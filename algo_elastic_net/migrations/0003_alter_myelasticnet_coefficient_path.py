@@ -0,0 +1,21 @@
+# Generated by Django 4.0.4 on 2026-10-19 17:40
+
+from django.db import migrations, models
+
+from task_manager.figures import store_inline_figures
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('algo_elastic_net', '0002_myelasticnet_coefficient_path'),
+    ]
+
+    operations = [
+        store_inline_figures('algo_elastic_net', 'MyElasticNet', 'coefficient_path'),
+        migrations.AlterField(
+            model_name='myelasticnet',
+            name='coefficient_path',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+    ]
@@ -1,5 +1,5 @@
 from django.db import models
-from task_manager.models import Step
+from task_manager.models import AlgorithmManager, Step
 from library.models import Paper
 
 
@@ -15,6 +15,9 @@ class MyElasticNet(models.Model):
     coefficients = models.TextField(blank=True)
     l1 = models.FloatField(default=0)
     l2 = models.FloatField(default=0)
+    coefficient_path = models.CharField(max_length=64, blank=True)  # digest of the figure file, see task_manager.figures
+
+    objects = AlgorithmManager('error_measure', 'coefficients')
 
 
 class Column(models.Model):
@@ -1,20 +1,22 @@
 import io
 import json
-import pickle
 
+import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
 from django import forms
 from django.contrib.auth.decorators import permission_required
-from django.core.files.base import ContentFile
 from django.shortcuts import render, redirect
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST
-from sklearn.linear_model import ElasticNet
+from sklearn.linear_model import ElasticNet, ElasticNetCV, enet_path
 from sklearn.metrics import mean_absolute_error, mean_squared_error
 from sklearn.model_selection import KFold, train_test_split
 
+from library.serialization import dump_paper, load_paper
 import task_manager.views
+from task_manager.columns import flag_columns, replace_columns, unflag_columns
+from task_manager.figures import save_figure
 from task_manager.models import OpenedTask
 from .models import *
 
@@ -58,13 +60,19 @@ class Train(PublicAlgorithm):
         help_text='The function to measure the quality of a split.',
         widget=forms.Select({'class': 'form-select'})
     )
+    search = forms.ChoiceField(
+        widget=forms.Select({'class': 'form-select'}),
+        choices=[('manual', 'Use the following L1 and L2'),
+                 ('path', 'Search the regularization path by 5-fold cross validation in training set')],
+        initial='manual',
+    )
     l1 = forms.FloatField(
         min_value=0, widget=forms.NumberInput({'class': 'form-control'}),
-        help_text='parameters, referring to OLS loss function'
+        help_text='parameters, referring to OLS loss function. Ignored when searching the regularization path.'
     )
     l2 = forms.FloatField(
         min_value=0, widget=forms.NumberInput({'class': 'form-control'}),
-        help_text='parameters, referring to OLS loss function'
+        help_text='parameters, referring to OLS loss function. Ignored when searching the regularization path.'
     )
 
 
@@ -92,7 +100,7 @@ def add_elastic_net(req):
 def view_elastic_net(req, algo_id):
     # ---------- Algorithm Ownership Navigator START ----------
     try:
-        algorithm_ = MyElasticNet.objects.get(id=algo_id)
+        algorithm_ = MyElasticNet.objects.with_heavy_fields().get(id=algo_id)
     except MyElasticNet.DoesNotExist:
         return redirect("/task/retrieve?message=This instance doesn't exist.&color=danger")
     if not algorithm_.step.open_permission(req.user):
@@ -137,28 +145,24 @@ def import_data(req):
     algorithm_ = MyElasticNet.objects.get(step=step)
     try:
         # ---------- Asynchronous Algorithm START   ----------
-        intermediate_paper_handle = ContentFile(pickle.dumps(table))
+        intermediate_paper_handle = dump_paper(table, 2)
         new_paper = Paper(user=req.user, role=2,
                           name=f"Elastic Net #{algorithm_.id} Parsed Data")
-        new_paper.file.save(f"elastic_net_{algorithm_.id}_parsed_data.pkl", intermediate_paper_handle)
+        new_paper.file.save(f"elastic_net_{algorithm_.id}_parsed_data.joblib", intermediate_paper_handle)
         new_paper.save()
         algorithm_.dataframe = new_paper
         algorithm_.save()
-        for column in Column.objects.filter(algorithm=algorithm_):
-            column.delete()
-        for col in table.columns:
-            new_column = Column(algorithm=algorithm_, name=col)
-            new_column.save()
+        replace_columns(Column, algorithm_, table.columns)
         # ---------- Asynchronous Algorithm END   ----------
     except Exception as e:
         step.status = 4
         step.error_message = str(e)
-        step.save()
+        step.save(update_fields=['status', 'error_message'])
         context = {"color": "danger", "content": "Interrupted.",
                    "refresh": f"/algo_elastic_net/{algorithm_.id}"}
         return render(req, "task_manager/hint_widget.html", context)
     step.status = 3
-    step.save()
+    step.save(update_fields=['status'])
     context = {"color": "success", "content": "The file is successfully parsed.",
                "refresh": f"/algo_elastic_net/{algorithm_.id}"}
     return render(req, "task_manager/hint_widget.html", context)
@@ -179,12 +183,8 @@ def set_variables(req):
         context = {"color": "danger", "content": "Submission is not valid."}
         return render(req, "task_manager/hint_widget.html", context)
     # ---------- Algorithm Ownership Validator v2 END   ----------
-    for column in variable_picker.cleaned_data['Independent_Variables_X']:
-        column.x_column = True
-        column.save()
-    column = variable_picker.cleaned_data['Dependent_Variable_Y']
-    column.y_column = True
-    column.save()
+    flag_columns(Column, algorithm_, x_column=variable_picker.cleaned_data['Independent_Variables_X'],
+                 y_column=[variable_picker.cleaned_data['Dependent_Variable_Y']])
     context = {"color": "success", "content": "Set variables successfully.",
                "refresh": f"/algo_elastic_net/{algorithm_.id}"}
     return render(req, "task_manager/hint_widget.html", context)
@@ -203,12 +203,57 @@ def clear_variables(req, algo_id):
     # ---------- Algorithm Ownership Navigator END   ----------
     if algorithm_.step.status == 2:
         return redirect("/task/retrieve?message=Cannot start because this algorithm is busy.&color=warning")
-    for column in Column.objects.filter(algorithm=algorithm_):
-        column.x_column = column.y_column = False
-        column.save()
+    unflag_columns(Column, algorithm_, 'x_column', 'y_column')
     return redirect(f"/algo_elastic_net/{algorithm_.id}")
 
 
+def fit_elastic_net(config, x, y):
+    """
+    In path mode, the regularization path is computed for each L1 ratio, with warm starts along decreasing alpha, and
+    the best (alpha, L1 ratio) in 5-fold cross validation is applied. The cross validation estimator is refitted on
+    all samples with the best parameters, so it's returned as the model.
+
+    :return: the fitted model, ElasticNet or ElasticNetCV.
+    """
+    if config['search'] == 'path':
+        mdl = ElasticNetCV(l1_ratio=[.1, .5, .7, .9, .95, .99, 1], cv=5, random_state=config['random_seed'])
+    else:
+        alpha = config['l1'] + config['l2']
+        l1_ratio = 0 if alpha == 0 else config['l1'] / alpha
+        mdl = ElasticNet(alpha=alpha, l1_ratio=l1_ratio, random_state=config['random_seed'])
+    mdl.fit(x, y)
+    return mdl
+
+
+def penalty(mdl):
+    """:return: (alpha, L1 ratio) applied by the model."""
+    if isinstance(mdl, ElasticNetCV):
+        return mdl.alpha_, mdl.l1_ratio_
+    return mdl.alpha, mdl.l1_ratio
+
+
+def coefficient_path_figure(mdl, x, y, x_col):
+    """
+    Draw the coefficients along the regularization path of the L1 ratio of the model, computed with warm starts. For
+    a model searched by cross validation, the path is computed on its grid of alphas at the best L1 ratio.
+    """
+    alpha, l1_ratio = penalty(mdl)
+    grid = {}
+    if isinstance(mdl, ElasticNetCV):
+        grid['alphas'] = np.atleast_2d(mdl.alphas_)[list(mdl.l1_ratio).index(l1_ratio)]
+    # The path is fitted without intercept, so that centered data is equivalent.
+    alphas, coefs, _ = enet_path(x - x.mean(axis=0), y - y.mean(), l1_ratio=max(l1_ratio, 1e-3), **grid)
+    fig = plt.figure()
+    for name, coef in zip(x_col, coefs):
+        plt.plot(np.log(alphas), coef, label=name)
+    if alpha > 0:
+        plt.axvline(np.log(alpha), linestyle='--', lw=1.25, color='k', label='Applied')
+    plt.xlabel("ln(L1 + L2)")
+    plt.ylabel("Coefficient")
+    plt.legend(loc=1)
+    return save_figure(fig)
+
+
 @permission_required("algo_elastic_net.change_myelasticnet")
 @csrf_exempt
 @require_POST
@@ -227,19 +272,16 @@ def train_model(req):
         context = {"color": "warning", "content": "Cannot start because this algorithm is busy."}
         return render(req, "task_manager/hint_widget.html", context)
     step.status = 2
-    step.save()
+    step.save(update_fields=['status'])
     try:
         # ---------- Asynchronous Algorithm START ----------
-        with open(algorithm_.dataframe.file.path, "rb") as f:
-            dataframe = pickle.load(f)
+        dataframe = load_paper(algorithm_.dataframe)
         x_col = [x.name for x in Column.objects.filter(algorithm=algorithm_, x_column=True)]
         y_col = [Column.objects.filter(algorithm=algorithm_, y_column=True).first().name]
         mode = train.cleaned_data['running_mode']
         x, y = dataframe[x_col].values, dataframe[y_col].values
         func_error = mean_absolute_error if train.cleaned_data['criterion'] == 'mae' else mean_squared_error
-        algorithm_.l1, algorithm_.l2 = train.cleaned_data['l1'], train.cleaned_data['l2']
-        a = algorithm_.l1 + algorithm_.l2
-        b = 0 if a == 0 else algorithm_.l1 / a
+        algorithm_.coefficient_path = str()
         if mode == "5_fold":
             k_fold = KFold(n_splits=5, random_state=train.cleaned_data['random_seed'], shuffle=True)
             models_, coefficients_list = [], []
@@ -247,17 +289,17 @@ def train_model(req):
 
             for (train_index, valid_index), k in zip(k_fold.split(x), range(5)):
                 x_train, x_valid, y_train, y_valid = x[train_index], x[valid_index], y[train_index], y[valid_index]
-                mdl = ElasticNet(alpha=a, l1_ratio=b, random_state=train.cleaned_data['random_seed'])
-                mdl.fit(x_train, y_train.ravel())
+                mdl = fit_elastic_net(train.cleaned_data, x_train, y_train.ravel())
                 models_.append(mdl)
                 y_valid_hat = mdl.predict(x_valid)
                 coefficients_list.append(
                     dict(zip(x_col, mdl.coef_)) | {'intercept': mdl.intercept_}
                 )
                 error_measure['value'].append(func_error(y_valid, y_valid_hat))
-            intermediate_paper_handle = ContentFile(pickle.dumps(models_))
+            mdl = models_[int(np.argmin(error_measure['value']))]
+            intermediate_paper_handle = dump_paper(models_, 3)
             new_paper = Paper(user=req.user, role=3, name=f'Elastic Net #{algorithm_.id} Model')
-            new_paper.file.save(f'elastic_net_{algorithm_.id}_model.pkl', intermediate_paper_handle)
+            new_paper.file.save(f'elastic_net_{algorithm_.id}_model.joblib', intermediate_paper_handle)
             new_paper.save()
             algorithm_.model = new_paper
             algorithm_.coefficients = json.dumps(coefficients_list, ensure_ascii=False)
@@ -266,8 +308,8 @@ def train_model(req):
             x_train, x_valid, y_train, y_valid = train_test_split(
                 x, y, train_size=0.8, shuffle=True, random_state=train.cleaned_data['random_seed'])
 
-            mdl = ElasticNet(alpha=a, l1_ratio=b, random_state=train.cleaned_data['random_seed'])
-            mdl.fit(x_train, y_train.ravel())
+            mdl = fit_elastic_net(train.cleaned_data, x_train, y_train.ravel())
+            algorithm_.coefficient_path = coefficient_path_figure(mdl, x_train, y_train.ravel(), x_col)
             y_valid_hat = mdl.predict(x_valid)
             coefficients = dict(zip(x_col, mdl.coef_)) | {'intercept': mdl.intercept_}
             algorithm_.coefficients = json.dumps(coefficients, ensure_ascii=False)
@@ -275,32 +317,35 @@ def train_model(req):
                 {'type': train.cleaned_data['criterion'], 'value': func_error(y_valid, y_valid_hat)},
                 ensure_ascii=False
             )
-            intermediate_paper_handle = ContentFile(pickle.dumps(mdl))
+            intermediate_paper_handle = dump_paper(mdl, 3)
             new_paper = Paper(user=req.user, role=3, name=f'Elastic Net #{algorithm_.id} Model')
-            new_paper.file.save(f'elastic_net_{algorithm_.id}_model.pkl', intermediate_paper_handle)
+            new_paper.file.save(f'elastic_net_{algorithm_.id}_model.joblib', intermediate_paper_handle)
             new_paper.save()
             algorithm_.model = new_paper
 
         else:  # mode == "full_train"
-            mdl = ElasticNet(alpha=a, l1_ratio=b, random_state=train.cleaned_data['random_seed'])
-            mdl.fit(x, y.ravel())
-            intermediate_paper_handle = ContentFile(pickle.dumps(mdl))
+            mdl = fit_elastic_net(train.cleaned_data, x, y.ravel())
+            algorithm_.coefficient_path = coefficient_path_figure(mdl, x, y.ravel(), x_col)
+            intermediate_paper_handle = dump_paper(mdl, 3)
             new_paper = Paper(user=req.user, role=3, name=f'Elastic Net #{algorithm_.id} Model')
-            new_paper.file.save(f'elastic_net_{algorithm_.id}_model.pkl', intermediate_paper_handle)
+            new_paper.file.save(f'elastic_net_{algorithm_.id}_model.joblib', intermediate_paper_handle)
             new_paper.save()
             algorithm_.model = new_paper
+        # In 5-fold mode, the parameters of the fold with the least validation error are displayed.
+        alpha, l1_ratio = penalty(mdl)
+        algorithm_.l1, algorithm_.l2 = alpha * l1_ratio, alpha * (1 - l1_ratio)
         algorithm_.mode = mode
         algorithm_.save()
         # ---------- Asynchronous Algorithm END   ----------
     except Exception as e:
         step.status = 4
         step.error_message = str(e)
-        step.save()
+        step.save(update_fields=['status', 'error_message'])
         context = {"color": "danger", "content": "Interrupted.",
                    "refresh": f"/algo_elastic_net/{algorithm_.id}"}
         return render(req, "task_manager/hint_widget.html", context)
     step.status = 3
-    step.save()
+    step.save(update_fields=['status'])
     context = {"color": "success", "content": "The model has been trained and evaluated.",
                "refresh": f"/algo_elastic_net/{algorithm_.id}"}
     return render(req, "task_manager/hint_widget.html", context)
@@ -325,6 +370,7 @@ def clear_model(req, algo_id):
     algorithm_.mode = str()
     algorithm_.hyper_parameters = str()
     algorithm_.feature_importance = str()
+    algorithm_.coefficient_path = str()
     algorithm_.save()
     return redirect(f"/algo_elastic_net/{algorithm_.id}")
 
@@ -346,10 +392,9 @@ def predict(req):
         context = {"color": "danger", "content": "This step doesn't have a trained model."}
         return render(req, "task_manager/hint_widget.html", context)
     step.status = 2
-    step.save()
+    step.save(update_fields=['status'])
     try:
-        with open(algorithm_.model.file.path, "rb") as f:
-            model = pickle.load(f)
+        model = load_paper(algorithm_.model)
         x_col = [x.name for x in Column.objects.filter(algorithm=algorithm_, x_column=True)]
         y_col = Column.objects.filter(algorithm=algorithm_, y_column=True).first().name
         x = table[x_col].values
@@ -363,7 +408,7 @@ def predict(req):
             table.to_excel(f, index=False)
     except Exception as e:
         step.status = 4
-        step.save()
+        step.save(update_fields=['status'])
         context = {"color": "warning", "content": f"Interrupted. {e}"}
         return render(req, "task_manager/hint_widget.html", context)
     new_paper = Paper(user=req.user, role=4, name=f"Elastic Net #{algorithm_.id} Predict")
@@ -371,7 +416,7 @@ def predict(req):
     new_paper.save()
     step.predicted_data = new_paper
     step.status = 3
-    step.save()
+    step.save(update_fields=['predicted_data', 'status'])
     context = {"color": "success", "content": "Prediction completed.",
                "refresh": f"/algo_elastic_net/{algorithm_.id}"}
     return render(req, "task_manager/hint_widget.html", context=context)
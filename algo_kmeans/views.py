@@ -1,18 +1,18 @@
 import io
 import json
-import pickle
 
 import numpy as np
 import pandas as pd
 from django import forms
 from django.contrib.auth.decorators import permission_required
-from django.core.files.base import ContentFile
 from django.shortcuts import render, redirect
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST
 from sklearn.cluster import KMeans
 
+from library.serialization import dump_paper, load_paper
 import task_manager.views
+from task_manager.columns import flag_columns, replace_columns, unflag_columns
 from task_manager.models import OpenedTask
 from .models import *
 
@@ -110,28 +110,24 @@ def import_data(req):
     algorithm_ = MyKMeans.objects.get(step=step)
     try:
         # ---------- Asynchronous Algorithm START   ----------
-        intermediate_paper_handle = ContentFile(pickle.dumps(table))
+        intermediate_paper_handle = dump_paper(table, 2)
         new_paper = Paper(user=req.user, role=2,
                           name=f"K Means #{algorithm_.id} Parsed Data")
-        new_paper.file.save(f"k_means_{algorithm_.id}_parsed_data.pkl", intermediate_paper_handle)
+        new_paper.file.save(f"k_means_{algorithm_.id}_parsed_data.joblib", intermediate_paper_handle)
         new_paper.save()
         algorithm_.dataframe = new_paper
         algorithm_.save()
-        for column in Column.objects.filter(algorithm=algorithm_):
-            column.delete()
-        for col in table.columns:
-            new_column = Column(algorithm=algorithm_, name=col)
-            new_column.save()
+        replace_columns(Column, algorithm_, table.columns)
         # ---------- Asynchronous Algorithm END   ----------
     except Exception as e:
         step.status = 4
         step.error_message = str(e)
-        step.save()
+        step.save(update_fields=['status', 'error_message'])
         context = {"color": "danger", "content": "Interrupted.",
                    "refresh": f"/algo_kmeans/{algorithm_.id}"}
         return render(req, "task_manager/hint_widget.html", context)
     step.status = 3
-    step.save()
+    step.save(update_fields=['status'])
     context = {"color": "success", "content": "The file is successfully parsed.",
                "refresh": f"/algo_kmeans/{algorithm_.id}"}
     return render(req, "task_manager/hint_widget.html", context)
@@ -152,9 +148,7 @@ def set_variables(req):
         context = {"color": "danger", "content": "Submission is not valid."}
         return render(req, "task_manager/hint_widget.html", context)
     # ---------- Algorithm Ownership Validator v2 END   ----------
-    for column in variable_picker.cleaned_data['Independent_Variables_X']:
-        column.x_column = True
-        column.save()
+    flag_columns(Column, algorithm_, x_column=variable_picker.cleaned_data['Independent_Variables_X'])
     context = {"color": "success", "content": "Set variables successfully.",
                "refresh": f"/algo_kmeans/{algorithm_.id}"}
     return render(req, "task_manager/hint_widget.html", context)
@@ -173,9 +167,7 @@ def clear_variables(req, algo_id):
     # ---------- Algorithm Ownership Navigator END   ----------
     if algorithm_.step.status == 2:
         return redirect("/task/retrieve?message=Cannot start because this algorithm is busy.&color=warning")
-    for column in Column.objects.filter(algorithm=algorithm_):
-        column.x_column = False
-        column.save()
+    unflag_columns(Column, algorithm_, 'x_column')
     algorithm_.save()
     return redirect(f"/algo_kmeans/{algorithm_.id}")
 
@@ -198,18 +190,18 @@ def train_model(req):
         context = {"color": "warning", "content": "Cannot start because this algorithm is busy."}
         return render(req, "task_manager/hint_widget.html", context)
     step.status = 2
-    step.save()
+    step.save(update_fields=['status'])
     try:
         # ---------- Asynchronous Algorithm START ----------
-        dataframe = pd.read_pickle(algorithm_.dataframe.file.path)
+        dataframe = load_paper(algorithm_.dataframe)
         x_col = [x.name for x in Column.objects.filter(algorithm=algorithm_, x_column=True)]
         x = dataframe[x_col].values
         k_means = KMeans(n_clusters=train.cleaned_data['k'], random_state=train.cleaned_data['random_seed'])
         k_means.fit(x)
 
-        intermediate_paper_handle = ContentFile(pickle.dumps(k_means))
+        intermediate_paper_handle = dump_paper(k_means, 3)
         new_paper = Paper(user=req.user, role=3, name=f'K Means #{algorithm_.id} Model')
-        new_paper.file.save(f'k_means_{algorithm_.id}_model.pkl', intermediate_paper_handle)
+        new_paper.file.save(f'k_means_{algorithm_.id}_model.joblib', intermediate_paper_handle)
         new_paper.save()
         algorithm_.model = new_paper
 
@@ -219,13 +211,13 @@ def train_model(req):
     except Exception as e:
         step.status = 4
         step.error_message = str(e)
-        step.save()
+        step.save(update_fields=['status', 'error_message'])
         context = {"color": "danger", "content": "Interrupted.",
                    "refresh": f"/algo_kmeans/{algorithm_.id}"}
         return render(req, "task_manager/hint_widget.html", context)
     algorithm_.save()
     step.status = 3
-    step.save()
+    step.save(update_fields=['status'])
     context = {"color": "success", "content": "The model has been trained and evaluated.",
                "refresh": f"/algo_kmeans/{algorithm_.id}"}
     return render(req, "task_manager/hint_widget.html", context)
@@ -267,10 +259,9 @@ def predict(req):
         context = {"color": "danger", "content": "This step doesn't have a trained model."}
         return render(req, "task_manager/hint_widget.html", context)
     step.status = 2
-    step.save()
+    step.save(update_fields=['status'])
     try:
-        with open(algorithm_.model.file.path, "rb") as f:
-            model = pickle.load(f)
+        model = load_paper(algorithm_.model)
         x_col = [x.name for x in Column.objects.filter(algorithm=algorithm_, x_column=True)]
         x = table[x_col].values
         table['k_means_class_labels'] = model.predict(x)
@@ -279,7 +270,7 @@ def predict(req):
             table.to_excel(f, index=False)
     except Exception as e:
         step.status = 4
-        step.save()
+        step.save(update_fields=['status'])
         context = {"color": "warning", "content": f"Interrupted. {e}"}
         return render(req, "task_manager/hint_widget.html", context)
     new_paper = Paper(user=req.user, role=4, name=f"K Means #{algorithm_.id} Predict")
@@ -287,7 +278,7 @@ def predict(req):
     new_paper.save()
     step.predicted_data = new_paper
     step.status = 3
-    step.save()
+    step.save(update_fields=['predicted_data', 'status'])
     context = {"color": "success", "content": "Prediction completed.",
                "refresh": f"/algo_kmeans/{algorithm_.id}"}
     return render(req, "task_manager/hint_widget.html", context=context)
@@ -0,0 +1,23 @@
+# Generated by Django 4.0.4 on 2026-10-19 17:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('algo_linear_regression', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='column',
+            name='regression_line',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='linearregression',
+            name='summary',
+            field=models.TextField(blank=True),
+        ),
+    ]
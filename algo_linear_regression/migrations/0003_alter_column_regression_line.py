@@ -0,0 +1,21 @@
+# Generated by Django 4.0.4 on 2026-10-19 18:15
+
+from django.db import migrations, models
+
+from task_manager.figures import store_inline_figures
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('algo_linear_regression', '0002_column_regression_line_linearregression_summary'),
+    ]
+
+    operations = [
+        store_inline_figures('algo_linear_regression', 'Column', 'regression_line'),
+        migrations.AlterField(
+            model_name='column',
+            name='regression_line',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+    ]
@@ -1,5 +1,5 @@
 from django.db import models
-from task_manager.models import Step
+from task_manager.models import AlgorithmManager, Step
 from library.models import Paper
 
 
@@ -13,6 +13,10 @@ class LinearRegression(models.Model):
                             blank=True, max_length=10)
     coefficients = models.TextField(blank=True)
     significances = models.TextField(blank=True)
+    # Means, ranges and a sample of the variables at train time, in JSON, to draw regression lines.
+    summary = models.TextField(blank=True)
+
+    objects = AlgorithmManager('coefficients', 'significances', 'summary')
 
 
 class Column(models.Model):
@@ -20,6 +24,7 @@ class Column(models.Model):
     name = models.TextField()
     x_column = models.BooleanField(default=False)
     y_column = models.BooleanField(default=False)
+    regression_line = models.CharField(blank=True, max_length=64)  # Figure cached for the trained model
 
     def __str__(self):
         return self.name
@@ -0,0 +1,170 @@
+import numpy as np
+from scipy import linalg, stats
+
+
+class SufficientStatistics:
+    """
+    XᵀX, Xᵀy, yᵀy, Σy and the number of samples of a block of samples, which determine the OLS fit. Statistics of
+    disjoint blocks add up, so in cross validation the training set of each fold is the total minus the fold.
+    """
+
+    def __init__(self, x, y):
+        y = np.asarray(y, dtype=np.float64).ravel()
+        x = np.asarray(x, dtype=np.float64)
+        self.xx = x.T @ x
+        self.xy = x.T @ y
+        self.yy = y @ y
+        self.sum_y = y.sum()
+        self.n = y.shape[0]
+
+    def __add__(self, other):
+        total = object.__new__(SufficientStatistics)
+        for name in ['xx', 'xy', 'yy', 'sum_y', 'n']:
+            setattr(total, name, getattr(self, name) + getattr(other, name))
+        return total
+
+    def __sub__(self, other):
+        rest = object.__new__(SufficientStatistics)
+        for name in ['xx', 'xy', 'yy', 'sum_y', 'n']:
+            setattr(rest, name, getattr(self, name) - getattr(other, name))
+        return rest
+
+    def fit(self):
+        return OlsResult(self)
+
+
+class OlsResult:
+    """
+    OLS fit with a constant column in X, solved from sufficient statistics. Attributes are named as the results of
+    "statsmodels.OLS(y, x).fit()".
+    """
+
+    def __init__(self, s: SufficientStatistics):
+        rank = design_rank(s.xx, s.n)
+        if rank == s.xx.shape[0]:
+            xx_inv = linalg.cho_solve(linalg.cho_factor(s.xx), np.eye(rank))
+        else:
+            # Variables are collinear, such as one-hot dummies with the constant. Cholesky may still succeed on the
+            # rounding errors, so the pseudo-inverse is taken on the independent directions, as statsmodels does.
+            w, v = np.linalg.eigh(s.xx)
+            v = v[:, np.argsort(w)[::-1][:rank]]
+            xx_inv = v @ np.diag(1 / (v.T @ s.xx @ v).diagonal()) @ v.T
+        self.params = xx_inv @ s.xy
+        self.nobs = s.n
+        self.df_model = rank - 1
+        self.df_resid = s.n - rank
+        self.ssr = max(s.yy - self.params @ s.xy, 0)
+        self.centered_tss = s.yy - s.sum_y ** 2 / s.n
+        self.ess = self.centered_tss - self.ssr
+        self.rsquared = 1 - self.ssr / self.centered_tss
+        self.rsquared_adj = 1 - (s.n - 1) / self.df_resid * (1 - self.rsquared)
+        scale = self.ssr / self.df_resid
+        self.bse = np.sqrt(np.diag(xx_inv) * scale)
+        self.tvalues = self.params / self.bse
+        self.pvalues = 2 * stats.t.sf(np.abs(self.tvalues), self.df_resid)
+        self.fvalue = (self.ess / self.df_model) / scale
+        self.f_pvalue = stats.f.sf(self.fvalue, self.df_model, self.df_resid)
+        self.llf = -s.n / 2 * (np.log(2 * np.pi) + np.log(self.ssr / s.n) + 1)
+
+    def predict(self, x):
+        return x @ self.params
+
+
+def design_rank(xx, n):
+    """
+    Rank of X from XᵀX, with the tolerance of "np.linalg.matrix_rank" on the eigenvalues of XᵀX (rather than the
+    singular values of X, which are their square roots, since rounding errors of XᵀX are relative to its largest
+    eigenvalue). Columns are scaled to unit norm first, so that the rank doesn't depend on the units of variables.
+    """
+    norm = np.sqrt(np.diag(xx))
+    norm[norm == 0] = 1
+    w = np.linalg.eigvalsh(xx / np.outer(norm, norm))
+    return int(np.sum(w > w.max() * max(n, xx.shape[0]) * np.finfo(np.float64).eps))
+
+
+def predict(model, x):
+    """
+    :param model: parameters of OLS, including the constant. Models trained by former versions are "statsmodels"
+        results, which are also supported.
+    :param x: samples with a constant column.
+    """
+    if hasattr(model, 'predict'):
+        return model.predict(x)
+    return x @ model
+
+
+def chunks(dataframe, x_col, y_col, chunk_rows):
+    """
+    Iterate the dataset by blocks of rows, so that only one block is converted to float matrices at a time.
+    :return: generator of (offset of the first row, X with a constant column at first, y)
+    """
+    for start in range(0, dataframe.shape[0], chunk_rows):
+        block = dataframe.iloc[start:start + chunk_rows]
+        x = block[x_col].to_numpy(dtype=np.float64)
+        y = block[y_col].to_numpy(dtype=np.float64).ravel()
+        yield start, np.column_stack([np.ones(x.shape[0]), x]), y
+
+
+def group_statistics(blocks, groups, n_groups):
+    """
+    :param blocks: output of "chunks".
+    :param groups: group index of each row, rows of negative index are skipped.
+    :return: sufficient statistics of each group.
+    """
+    statistics = [None] * n_groups
+    for start, x, y in blocks:
+        g = groups[start:start + x.shape[0]]
+        for k in range(n_groups):
+            s = SufficientStatistics(x[g == k], y[g == k])
+            statistics[k] = s if statistics[k] is None else statistics[k] + s
+    return statistics
+
+
+def group_errors(blocks, groups, params):
+    """
+    :param blocks: output of "chunks".
+    :param groups: group index of each row.
+    :param params: {group index: parameters to predict rows of this group}
+    :return: {group index: (mean absolute error, mean squared error)}
+    """
+    abs_error = {k: 0. for k in params.keys()}
+    squared_error = {k: 0. for k in params.keys()}
+    n = {k: 0 for k in params.keys()}
+    for start, x, y in blocks:
+        g = groups[start:start + x.shape[0]]
+        for k, p in params.items():
+            e = y[g == k] - x[g == k] @ p
+            abs_error[k] += np.abs(e).sum()
+            squared_error[k] += e @ e
+            n[k] += e.shape[0]
+    return {k: (abs_error[k] / n[k], squared_error[k] / n[k]) for k in params.keys()}
+
+
+def summarize_columns(blocks, names, sample_size=100, random_state=None):
+    """
+    Mean, minimum and maximum of each variable, and a uniform sample of rows drawn by reservoir sampling, in one pass.
+    They are what the regression line needs, so that the dataset isn't loaded again to draw it.
+    :param blocks: output of "chunks".
+    :param names: names of X columns (excluding the constant) and y column.
+    :return: {'mean': {name: value}, 'min': {...}, 'max': {...}, 'sample': {name: [values]}}
+    """
+    rng = np.random.default_rng(random_state)
+    total, minimum, maximum, reservoir, n = 0, None, None, None, 0
+    for _, x, y in blocks:
+        block = np.column_stack([x[:, 1:], y])
+        total = total + block.sum(axis=0)
+        minimum = block.min(axis=0) if minimum is None else np.minimum(minimum, block.min(axis=0))
+        maximum = block.max(axis=0) if maximum is None else np.maximum(maximum, block.max(axis=0))
+        fill = min(max(sample_size - n, 0), block.shape[0])
+        reservoir = block[:fill].copy() if reservoir is None else np.vstack([reservoir, block[:fill]])
+        # Row i of the dataset (counting from 0) replaces a random slot with probability sample_size / (i + 1).
+        slots = rng.integers(0, n + np.arange(fill, block.shape[0]) + 1)
+        for i in np.flatnonzero(slots < sample_size):
+            reservoir[slots[i]] = block[fill + i]
+        n += block.shape[0]
+    return {
+        'mean': dict(zip(names, (total / n).tolist())),
+        'min': dict(zip(names, minimum.tolist())),
+        'max': dict(zip(names, maximum.tolist())),
+        'sample': dict(zip(names, reservoir.T.tolist())),
+    }
@@ -1,3 +1,37 @@
-from django.test import TestCase
+import numpy as np
+import statsmodels.api as sm
+from django.test import SimpleTestCase
 
-# Create your tests here.
+from .ols import SufficientStatistics
+
+
+class OlsTestCase(SimpleTestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.n = 500
+        self.dummies = np.eye(3)[rng.integers(0, 3, self.n)]
+        self.x = rng.normal(size=self.n)
+        self.y = self.x * 2 + self.dummies @ [1, 2, 3] + rng.normal(size=self.n)
+
+    def assertMatchesStatsmodels(self, x):
+        result = SufficientStatistics(x, self.y).fit()
+        expected = sm.OLS(self.y, x).fit()
+        np.testing.assert_allclose(result.params, expected.params, atol=1e-8)
+        np.testing.assert_allclose(result.bse, expected.bse, rtol=1e-6)
+        np.testing.assert_allclose(result.pvalues, expected.pvalues, atol=1e-10)
+        self.assertEqual(result.df_model, expected.df_model)
+        self.assertEqual(result.df_resid, expected.df_resid)
+        self.assertAlmostEqual(result.rsquared, expected.rsquared)
+        self.assertAlmostEqual(result.fvalue, expected.fvalue)
+
+    def test_full_rank(self):
+        self.assertMatchesStatsmodels(np.column_stack([np.ones(self.n), self.x * 1e6, self.dummies[:, 1:]]))
+
+    def test_dummies_with_constant(self):
+        # Dummies of all groups add up to the constant column.
+        self.assertMatchesStatsmodels(np.column_stack([np.ones(self.n), self.x, self.dummies]))
+
+    def test_blocks_add_up(self):
+        x = np.column_stack([np.ones(self.n), self.x, self.dummies])
+        total = SufficientStatistics(x[:200], self.y[:200]) + SufficientStatistics(x[200:], self.y[200:])
+        np.testing.assert_allclose(total.fit().params, SufficientStatistics(x, self.y).fit().params)
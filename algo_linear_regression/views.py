@@ -1,6 +1,5 @@
 import io
 import json
-import pickle
 
 import matplotlib.pyplot as plt
 import numpy as np
@@ -8,17 +7,18 @@ import pandas as pd
 import statsmodels.api as linear_regression
 from django import forms
 from django.contrib.auth.decorators import permission_required
-from django.core.files.base import ContentFile
-from django.http import HttpResponse
 from django.shortcuts import render, redirect
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST
-from sklearn.metrics import mean_absolute_error, mean_squared_error
 from sklearn.model_selection import KFold, train_test_split
 
+from library.serialization import dump_paper, load_paper
 import task_manager.views
+from task_manager.columns import flag_columns, replace_columns, unflag_columns
+from task_manager.figures import save_figure
 from task_manager.models import OpenedTask
 from .models import *
+from .ols import chunks, group_errors, group_statistics, predict as predict_ols, summarize_columns
 
 
 class PublicAlgorithm(forms.Form):
@@ -54,6 +54,11 @@ class Train(PublicAlgorithm):
         min_value=1, max_value=9999999, required=False, widget=forms.NumberInput({"class": "form-control"}),
         help_text="Not required. From 1 to 9999999, leave blank if not purpose to fix."
     )
+    chunk_rows = forms.IntegerField(
+        min_value=1000, initial=100000, widget=forms.NumberInput({"class": "form-control"}),
+        help_text="At least 1000. Samples are read in blocks of this many rows when accumulating XᵀX and Xᵀy. "
+                  "Smaller blocks use less memory on large datasets."
+    )
 
 
 class RegressionLineVariable(PublicAlgorithm):
@@ -91,7 +96,7 @@ def add_lr(req):
 def view_lr(req, algo_id):
     # ---------- Algorithm Ownership Navigator START ----------
     try:
-        algorithm_ = LinearRegression.objects.get(id=algo_id)
+        algorithm_ = LinearRegression.objects.with_heavy_fields().get(id=algo_id)
     except LinearRegression.DoesNotExist:
         return redirect("/task/retrieve?message=This instance doesn't exist.&color=danger")
     if not algorithm_.step.open_permission(req.user):
@@ -138,28 +143,24 @@ def import_data(req):
     algorithm_ = LinearRegression.objects.get(step=step)
     try:
         # ---------- Asynchronous Algorithm START   ----------
-        intermediate_paper_handle = ContentFile(pickle.dumps(table))
+        intermediate_paper_handle = dump_paper(table, 2)
         new_paper = Paper(user=req.user, role=2,
                           name=f"Linear Regression #{algorithm_.id} Parsed Data")
-        new_paper.file.save(f"linear_regression_{algorithm_.id}_parsed_data.pkl", intermediate_paper_handle)
+        new_paper.file.save(f"linear_regression_{algorithm_.id}_parsed_data.joblib", intermediate_paper_handle)
         new_paper.save()
         algorithm_.dataframe = new_paper
         algorithm_.save()
-        for column in Column.objects.filter(algorithm=algorithm_):
-            column.delete()
-        for col in table.columns:
-            new_column = Column(algorithm=algorithm_, name=col)
-            new_column.save()
+        replace_columns(Column, algorithm_, table.columns)
         # ---------- Asynchronous Algorithm END   ----------
     except Exception as e:
         step.status = 4
         step.error_message = str(e)
-        step.save()
+        step.save(update_fields=['status', 'error_message'])
         context = {"color": "danger", "content": "Interrupted.",
                    "refresh": f"/algo_linear_regression/{algorithm_.id}"}
         return render(req, "task_manager/hint_widget.html", context)
     step.status = 3
-    step.save()
+    step.save(update_fields=['status'])
     context = {"color": "success", "content": "The file is successfully parsed.",
                "refresh": f"/algo_linear_regression/{algorithm_.id}"}
     return render(req, "task_manager/hint_widget.html", context)
@@ -180,12 +181,9 @@ def set_variables(req):
         context = {"color": "danger", "content": "Submission is not valid."}
         return render(req, "task_manager/hint_widget.html", context)
     # ---------- Algorithm Ownership Validator v2 END   ----------
-    for column in variable_picker.cleaned_data['Independent_Variables_X']:
-        column.x_column = True
-        column.save()
-    column = variable_picker.cleaned_data['Dependent_Variable_Y']
-    column.y_column = True
-    column.save()
+    flag_columns(Column, algorithm_, x_column=variable_picker.cleaned_data['Independent_Variables_X'],
+                 y_column=[variable_picker.cleaned_data['Dependent_Variable_Y']])
+    Column.objects.filter(algorithm=algorithm_).update(regression_line=str())
     context = {"color": "success", "content": "Set variables successfully.",
                "refresh": f"/algo_linear_regression/{algorithm_.id}"}
     return render(req, "task_manager/hint_widget.html", context)
@@ -204,9 +202,8 @@ def clear_variables(req, algo_id):
     # ---------- Algorithm Ownership Navigator END   ----------
     if algorithm_.step.status == 2:
         return redirect("/task/retrieve?message=Cannot start because this algorithm is busy.&color=warning")
-    for column in Column.objects.filter(algorithm=algorithm_):
-        column.x_column = column.y_column = False
-        column.save()
+    unflag_columns(Column, algorithm_, 'x_column', 'y_column')
+    Column.objects.filter(algorithm=algorithm_).update(regression_line=str())
     return redirect(f"/algo_linear_regression/{algorithm_.id}")
 
 
@@ -228,88 +225,77 @@ def train_model(req):
         context = {"color": "warning", "content": "Cannot start because this algorithm is busy."}
         return render(req, "task_manager/hint_widget.html", context)
     step.status = 2
-    step.save()
+    step.save(update_fields=['status'])
     try:
         # ---------- Asynchronous Algorithm START ----------
-        with open(algorithm_.dataframe.file.path, "rb") as f:
-            dataframe = pickle.load(f)
+        dataframe = load_paper(algorithm_.dataframe)
         x_col = [x.name for x in Column.objects.filter(algorithm=algorithm_, x_column=True)]
         y_col = [Column.objects.filter(algorithm=algorithm_, y_column=True).first().name]
         mode = train.cleaned_data['running_mode']
-        x, y = dataframe[x_col].values, dataframe[y_col].values
-
-        if mode == "5_fold":
-            k_fold = KFold(n_splits=5, random_state=train.cleaned_data['random_seed'], shuffle=True)
-            models, coefficients, significances, errors = [], [], [], []
-
-            for train_index, valid_index in k_fold.split(x):
-                x_train, x_valid, y_train, y_valid = x[train_index], x[valid_index], y[train_index], y[valid_index]
-                x_train = linear_regression.add_constant(x_train)
-                x_valid = linear_regression.add_constant(x_valid)
-                mdl = linear_regression.OLS(y_train, x_train).fit()
-                y_valid_hat = mdl.predict(x_valid)
-
-                coef = {}
-                names = ['Constant'] + x_col
-                for name, i in zip(names, range(len(names))):
-                    coef[name] = {
-                        'coef': mdl.params[i], 'std_error': mdl.bse[i], 't': mdl.tvalues[i], 'p': mdl.pvalues[i]
-                    }
-                sig = {
-                    'f': mdl.fvalue, 'p': mdl.f_pvalue, 'R2': mdl.rsquared, 'R2_adj': mdl.rsquared_adj,
-                    'SSR': mdl.ssr, 'SSE': mdl.ess, 'log_likelihood_f': mdl.llf,
-                    'MAE': mean_absolute_error(y_valid, y_valid_hat), 'MSE': mean_squared_error(y_valid, y_valid_hat)
-                }
-                models.append(mdl)
-                coefficients.append(coef)
-                significances.append(sig)
-            models_bin = ContentFile(pickle.dumps(models))
-            algorithm_.coefficients = json.dumps(coefficients, ensure_ascii=False)
-            algorithm_.significances = json.dumps(significances, ensure_ascii=False)
+        chunk_rows = train.cleaned_data['chunk_rows']
+        n = dataframe.shape[0]
 
-        elif mode == "split":
-            x_train, x_valid, y_train, y_valid = train_test_split(x, y, train_size=0.8, shuffle=True,
-                                                                  random_state=train.cleaned_data['random_seed'])
-            x_train = linear_regression.add_constant(x_train)
-            x_valid = linear_regression.add_constant(x_valid)
-            mdl = linear_regression.OLS(y_train, x_train).fit()
-            y_valid_hat = mdl.predict(x_valid)
+        def blocks():
+            return chunks(dataframe, x_col, y_col, chunk_rows)
 
+        def summarize(mdl, errors):
             coef = {}
             names = ['Constant'] + x_col
-            for x, i in zip(names, range(len(names))):
-                coef[x] = {
+            for name, i in zip(names, range(len(names))):
+                coef[name] = {
                     'coef': mdl.params[i], 'std_error': mdl.bse[i], 't': mdl.tvalues[i], 'p': mdl.pvalues[i]
                 }
             sig = {
                 'f': mdl.fvalue, 'p': mdl.f_pvalue, 'R2': mdl.rsquared, 'R2_adj': mdl.rsquared_adj,
-                'SSR': mdl.ssr, 'SSE': mdl.ess, 'log_likelihood_f': mdl.llf,
-                'MAE': mean_absolute_error(y_valid, y_valid_hat), 'MSE': mean_squared_error(y_valid, y_valid_hat)
+                'SSR': mdl.ssr, 'SSE': mdl.ess, 'log_likelihood_f': mdl.llf, 'MAE': errors[0], 'MSE': errors[1]
             }
-            models_bin = ContentFile(pickle.dumps(mdl))
+            return coef, sig
+
+        # Rows are assigned to groups (folds, or training and validation set) by index, and XᵀX and Xᵀy of each
+        # group are accumulated over blocks of rows, so the design matrix is never built as a whole.
+        groups = np.zeros(n, dtype=int)
+        if mode == "5_fold":
+            k_fold = KFold(n_splits=5, random_state=train.cleaned_data['random_seed'], shuffle=True)
+            for k, (_, valid_index) in enumerate(k_fold.split(np.arange(n))):
+                groups[valid_index] = k
+            # The training set of each fold is the total minus the fold.
+            fold_statistics = group_statistics(blocks(), groups, 5)
+            total_statistics = sum(fold_statistics[1:], fold_statistics[0])
+            fold_models = [(total_statistics - valid_statistics).fit() for valid_statistics in fold_statistics]
+            errors = group_errors(blocks(), groups, {k: mdl.params for k, mdl in enumerate(fold_models)})
+            models, coefficients, significances = [], [], []
+            for k, mdl in enumerate(fold_models):
+                coef, sig = summarize(mdl, errors[k])
+                models.append(mdl.params)
+                coefficients.append(coef)
+                significances.append(sig)
+            models_bin = dump_paper(models, 3)
+            algorithm_.coefficients = json.dumps(coefficients, ensure_ascii=False)
+            algorithm_.significances = json.dumps(significances, ensure_ascii=False)
+
+        elif mode == "split":
+            _, valid_index = train_test_split(np.arange(n), train_size=0.8, shuffle=True,
+                                              random_state=train.cleaned_data['random_seed'])
+            groups[valid_index] = 1
+            mdl = group_statistics(blocks(), groups, 1)[0].fit()
+            coef, sig = summarize(mdl, group_errors(blocks(), groups, {1: mdl.params})[1])
+            models_bin = dump_paper(mdl.params, 3)
             algorithm_.coefficients = json.dumps(coef, ensure_ascii=False)
             algorithm_.significances = json.dumps(sig, ensure_ascii=False)
 
         else:  # mode == "full_train"
-            x = linear_regression.add_constant(x)
-            mdl = linear_regression.OLS(y, x).fit()
-            coef = {}
-            names = ['Constant'] + x_col
-            for x, i in zip(names, range(len(names))):
-                coef[x] = {
-                    'coef': mdl.params[i], 'std_error': mdl.bse[i], 't': mdl.tvalues[i], 'p': mdl.pvalues[i]
-                }
-            sig = {
-                'f': mdl.fvalue, 'p': mdl.f_pvalue, 'R2': mdl.rsquared, 'R2_adj': mdl.rsquared_adj,
-                'SSR': mdl.ssr, 'SSE': mdl.ess, 'log_likelihood_f': mdl.llf,
-                'MAE': np.nan, 'MSE': np.nan
-            }
-            models_bin = ContentFile(pickle.dumps(mdl))
+            mdl = group_statistics(blocks(), groups, 1)[0].fit()
+            coef, sig = summarize(mdl, (np.nan, np.nan))
+            models_bin = dump_paper(mdl.params, 3)
             algorithm_.coefficients = json.dumps(coef, ensure_ascii=False)
             algorithm_.significances = json.dumps(sig, ensure_ascii=False)
 
+        algorithm_.summary = json.dumps(summarize_columns(blocks(), x_col + y_col,
+                                                          random_state=train.cleaned_data['random_seed']))
+        Column.objects.filter(algorithm=algorithm_).update(regression_line=str())
+
         models_paper = Paper(user=req.user, role=3, name=f"Linear Regression #{algorithm_.id} Model")
-        models_paper.file.save(f"linear_regression_{algorithm_.id}_model_{mode}.pkl", models_bin)
+        models_paper.file.save(f"linear_regression_{algorithm_.id}_model_{mode}.joblib", models_bin)
         models_paper.save()
         algorithm_.model = models_paper
         algorithm_.mode = mode
@@ -318,12 +304,12 @@ def train_model(req):
     except Exception as e:
         step.status = 4
         step.error_message = str(e)
-        step.save()
+        step.save(update_fields=['status', 'error_message'])
         context = {"color": "danger", "content": "Interrupted.",
                    "refresh": f"/algo_linear_regression/{algorithm_.id}"}
         return render(req, "task_manager/hint_widget.html", context)
     step.status = 3
-    step.save()
+    step.save(update_fields=['status'])
     context = {"color": "success", "content": "The model has been trained and evaluated.",
                "refresh": f"/algo_linear_regression/{algorithm_.id}"}
     return render(req, "task_manager/hint_widget.html", context)
@@ -345,8 +331,10 @@ def clear_model(req, algo_id):
     algorithm_.mode = str()
     algorithm_.significances = str()
     algorithm_.coefficients = str()
+    algorithm_.summary = str()
     algorithm_.model = None
     algorithm_.save()
+    Column.objects.filter(algorithm=algorithm_).update(regression_line=str())
     return redirect(f"/algo_linear_regression/{algorithm_.id}")
 
 
@@ -368,35 +356,44 @@ def regression_line(req):
     if algorithm_.step.status == 2:
         context = {"color": "warning", "content": "Cannot start because this algorithm is busy."}
         return render(req, "task_manager/hint_widget.html", context)
+    column = rlv.cleaned_data['variable']
+    if column.regression_line:
+        return render(req, "algo_linear_regression/regression_line_figure.html", {"column": column})
     try:
-        x_col = rlv.cleaned_data['variable'].name
+        x_col = column.name
         other_cols = [j.name for j in Column.objects.filter(algorithm=algorithm_, x_column=True).exclude(name=x_col)]
         y_col = Column.objects.filter(algorithm=algorithm_, y_column=True).first().name
-        dataframe = pd.read_pickle(algorithm_.dataframe.file.path)
-        f, fig = io.StringIO(), plt.figure()
-        x, y = dataframe[x_col].values, dataframe[y_col].values
+        if algorithm_.summary:
+            summary = json.loads(algorithm_.summary)
+        else:  # Models trained by former versions.
+            dataframe = load_paper(algorithm_.dataframe)
+            summary = summarize_columns(chunks(dataframe, [x_col] + other_cols, [y_col], dataframe.shape[0] or 1),
+                                        [x_col] + other_cols + [y_col])
+        mean = summary['mean']
+        fig = plt.figure()
+        x, y = np.array(summary['sample'][x_col]), np.array(summary['sample'][y_col])
+        x_min, x_max = summary['min'][x_col], summary['max'][x_col]
         coefficients = json.loads(algorithm_.coefficients)
         if algorithm_.mode == '5_fold':
             coef = [coef_each_fold[x_col]['coef'] for coef_each_fold in coefficients]
-            intercept = [np.sum([dataframe[j].mean(axis=0) * coef_each_fold[j]['coef'] for j in other_cols]) +
+            intercept = [np.sum([mean[j] * coef_each_fold[j]['coef'] for j in other_cols]) +
                          coef_each_fold['Constant']['coef'] for coef_each_fold in coefficients]
             slope = np.mean(coef)
             intercept = np.mean(intercept)
         else:
             slope = coefficients[x_col]['coef']
-            intercept = np.sum([dataframe[j].mean(axis=0) * coefficients[j]['coef'] for j in other_cols]) + \
+            intercept = np.sum([mean[j] * coefficients[j]['coef'] for j in other_cols]) + \
                 coefficients['Constant']['coef']
-        plt.plot([x.min(), x.max()], [x.min() * slope + intercept, x.max() * slope + intercept], "r")
-        sampling = np.random.choice(x.shape[0], 100)
-        plt.scatter(x[sampling], y[sampling])
+        plt.plot([x_min, x_max], [x_min * slope + intercept, x_max * slope + intercept], "r")
+        plt.scatter(x, y)
         plt.xlabel(x_col), plt.ylabel(y_col)
-        plt.legend(["regression line", "100 sampled data"])
-        fig.savefig(f, format='svg')
-        plt.close(fig)
+        plt.legend(["regression line", f"{x.shape[0]} sampled data"])
+        column.regression_line = save_figure(fig)
+        column.save(update_fields=['regression_line'])
     except Exception as e:
         context = {"color": "warning", "content": f"Interrupted. {e}"}
         return render(req, "task_manager/hint_widget.html", context)
-    return HttpResponse(f.getvalue())
+    return render(req, "algo_linear_regression/regression_line_figure.html", {"column": column})
 
 
 @permission_required("algo_linear_regression.view_linearregression")
@@ -415,24 +412,23 @@ def predict(req):
         context = {"color": "danger", "content": "This step doesn't have a trained model."}
         return render(req, "task_manager/hint_widget.html", context)
     step.status = 2
-    step.save()
+    step.save(update_fields=['status'])
     try:
-        with open(algorithm_.model.file.path, "rb") as f:
-            model = pickle.load(f)
+        model = load_paper(algorithm_.model)
         x_col = [x.name for x in Column.objects.filter(algorithm=algorithm_, x_column=True)]
         y_col = Column.objects.filter(algorithm=algorithm_, y_column=True).first().name
         x = linear_regression.add_constant(table[x_col].values)
         if algorithm_.mode == '5_fold':
-            y_hat = [model[i].predict(x) for i in range(5)]
+            y_hat = [predict_ols(model[i], x) for i in range(5)]
             table[y_col] = np.nanmean(y_hat, axis=0)
         else:
-            table[y_col] = model.predict(x)
+            table[y_col] = predict_ols(model, x)
         table_bin = io.BytesIO()
         with pd.ExcelWriter(table_bin) as f:
             table.to_excel(f, index=False)
     except Exception as e:
         step.status = 4
-        step.save()
+        step.save(update_fields=['status'])
         context = {"color": "warning", "content": f"Interrupted. {e}"}
         return render(req, "task_manager/hint_widget.html", context)
     new_paper = Paper(user=req.user, role=4, name=f"Linear Regression #{algorithm_.id} Predict")
@@ -440,7 +436,7 @@ def predict(req):
     new_paper.save()
     step.predicted_data = new_paper
     step.status = 3
-    step.save()
+    step.save(update_fields=['predicted_data', 'status'])
     context = {"color": "success", "content": "Prediction completed.",
                "refresh": f"/algo_linear_regression/{algorithm_.id}"}
     return render(req, "task_manager/hint_widget.html", context=context)
@@ -1,6 +1,6 @@
 from django.db import models
 from library.models import Paper
-from task_manager.models import Step
+from task_manager.models import AlgorithmManager, Step
 
 
 class BayesLogisticRegression(models.Model):
@@ -15,7 +15,9 @@ class BayesLogisticRegression(models.Model):
     class_dict = models.TextField(blank=True)
     training_history = models.TextField(blank=True)
     auc = models.TextField(blank=True)
-    roc_curve = models.TextField(blank=True)
+    roc_curve = models.CharField(max_length=64, blank=True)  # digest of the figure file, see task_manager.figures
+
+    objects = AlgorithmManager('training_history', 'auc', 'hyper_parameters')
 
 
 class Column(models.Model):
@@ -1,22 +1,23 @@
 import io
 import json
-import pickle
 
 import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
 from django import forms
 from django.contrib.auth.decorators import permission_required
-from django.core.files.base import ContentFile
 from django.shortcuts import render, redirect
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST
 from sklearn.linear_model import LogisticRegression
-from sklearn.metrics import roc_auc_score, roc_curve
 from sklearn.model_selection import train_test_split, KFold
 
+from library.serialization import dump_paper, load_paper
 import task_manager.views
 from bayes_opt import BayesianOptimization
+from task_manager.columns import flag_columns, replace_columns, unflag_columns
+from task_manager.evaluation import mean_roc_auc, roc_auc, roc_curves
+from task_manager.figures import save_figure
 from task_manager.models import OpenedTask
 from .models import *
 
@@ -79,6 +80,17 @@ class Train(PublicAlgorithm):
         help_text='The logarithmic value of regularization parameter, inversely proportional to the strength of '
                   'the regularization.',
     )
+    search = forms.ChoiceField(
+        widget=forms.Select({'class': 'form-select'}),
+        choices=[('bayes', 'Bayesian optimization'),
+                 ('path', 'Regularization path, fitting with warm starts from the strongest regularization')],
+        initial='bayes',
+    )
+    path_length = forms.IntegerField(
+        min_value=2, initial=20, widget=forms.NumberInput({'class': 'form-control'}), required=False,
+        help_text='Number of C values, evenly spaced in ln(C), along the regularization path. With mixing L1 and L2, '
+                  'a path is fitted for each L1 ratio in 0, 0.25, 0.5, 0.75, 1.'
+    )
 
 
 @permission_required(
@@ -107,7 +119,7 @@ def add_logistic_regression(req):
 def view_logistic_regression(req, algo_id):
     # ---------- Algorithm Ownership Navigator START ----------
     try:
-        algorithm_ = BayesLogisticRegression.objects.get(id=algo_id)
+        algorithm_ = BayesLogisticRegression.objects.with_heavy_fields().get(id=algo_id)
     except BayesLogisticRegression.DoesNotExist:
         return redirect("/task/retrieve?message=This instance doesn't exist.&color=danger")
     if not algorithm_.step.open_permission(req.user):
@@ -150,28 +162,24 @@ def import_data(req):
     algorithm_ = BayesLogisticRegression.objects.get(step=step)
     try:
         # ---------- Asynchronous Algorithm START   ----------
-        intermediate_paper_handle = ContentFile(pickle.dumps(table))
+        intermediate_paper_handle = dump_paper(table, 2)
         new_paper = Paper(user=req.user, role=2,
                           name=f"Logistic Regression #{algorithm_.id} Parsed Data")
-        new_paper.file.save(f"lgr_{algorithm_.id}_parsed_data.pkl", intermediate_paper_handle)
+        new_paper.file.save(f"lgr_{algorithm_.id}_parsed_data.joblib", intermediate_paper_handle)
         new_paper.save()
         algorithm_.dataframe = new_paper
         algorithm_.save()
-        for column in Column.objects.filter(algorithm=algorithm_):
-            column.delete()
-        for col in table.columns:
-            new_column = Column(algorithm=algorithm_, name=col)
-            new_column.save()
+        replace_columns(Column, algorithm_, table.columns)
         # ---------- Asynchronous Algorithm END   ----------
     except Exception as e:
         step.status = 4
         step.error_message = str(e)
-        step.save()
+        step.save(update_fields=['status', 'error_message'])
         context = {"color": "danger", "content": "Interrupted.",
                    "refresh": f"/algo_logistic_regression/{algorithm_.id}"}
         return render(req, "task_manager/hint_widget.html", context)
     step.status = 3
-    step.save()
+    step.save(update_fields=['status'])
     context = {"color": "success", "content": "The file is successfully parsed.",
                "refresh": f"/algo_logistic_regression/{algorithm_.id}"}
     return render(req, "task_manager/hint_widget.html", context)
@@ -192,12 +200,8 @@ def set_variables(req):
         context = {"color": "danger", "content": "Submission is not valid."}
         return render(req, "task_manager/hint_widget.html", context)
     # ---------- Algorithm Ownership Validator v2 END   ----------
-    for column in variable_picker.cleaned_data['Independent_Variables_X']:
-        column.x_column = True
-        column.save()
-    column = variable_picker.cleaned_data['Dependent_Variable_Y']
-    column.y_column = True
-    column.save()
+    flag_columns(Column, algorithm_, x_column=variable_picker.cleaned_data['Independent_Variables_X'],
+                 y_column=[variable_picker.cleaned_data['Dependent_Variable_Y']])
     context = {"color": "success", "content": "Set variables successfully.",
                "refresh": f"/algo_logistic_regression/{algorithm_.id}"}
     return render(req, "task_manager/hint_widget.html", context)
@@ -216,9 +220,7 @@ def clear_variables(req, algo_id):
     # ---------- Algorithm Ownership Navigator END   ----------
     if algorithm_.step.status == 2:
         return redirect("/task/retrieve?message=Cannot start because this algorithm is busy.&color=warning")
-    for column in Column.objects.filter(algorithm=algorithm_):
-        column.x_column = column.y_column = False
-        column.save()
+    unflag_columns(Column, algorithm_, 'x_column', 'y_column')
     return redirect(f"/algo_logistic_regression/{algorithm_.id}")
 
 
@@ -229,6 +231,32 @@ def one_hot(labels):
     return class_dict_, labels_1h
 
 
+def regularization_path(config, x, y, y_1h):
+    """
+    Fit the models along the regularization path, from the strongest regularization to the weakest, each starting
+    from the coefficients of the previous one. The objective is the same as Bayesian search.
+
+    :return: the best trial, and the history of trials, in the format of "BayesianOptimization".
+    """
+    ln_c_path = np.linspace(config['min_ln_c'], config['max_ln_c'], config['path_length'])
+    l1_ratios = np.linspace(0, 1, 5) if config['regularization'] == 'elasticnet' else [None]
+    history, best = {}, None
+    for l1_ratio in l1_ratios:
+        lgr = LogisticRegression(penalty=config['regularization'], solver='saga', l1_ratio=l1_ratio,
+                                 warm_start=True, random_state=config['random_seed'])
+        for ln_c in ln_c_path:
+            lgr.set_params(C=np.exp(ln_c))
+            lgr.fit(x, y)
+            y_hat = lgr.predict_proba(x)
+            auc_in_path = mean_roc_auc(y_1h, y_hat)
+            trial = {'target': float(auc_in_path),
+                     'params': {'c': float(ln_c), 'l1_ratio': None if l1_ratio is None else float(l1_ratio)}}
+            history[len(history)] = trial
+            if best is None or trial['target'] > best['target']:
+                best = trial
+    return best, history
+
+
 @permission_required("algo_logistic_regression.change_bayeslogisticregression")
 @csrf_exempt
 @require_POST
@@ -248,19 +276,21 @@ def train_model(req):
         return render(req, "task_manager/hint_widget.html", context)
 
     if train.cleaned_data['regularization'] != 'none':
+        if train.cleaned_data['search'] == 'path':
+            search_config = train.cleaned_data['path_length']
+        else:
+            search_config = train.cleaned_data['bayes_init_try_times'] and train.cleaned_data['bayes_iteration_times']
         if not (
-            train.cleaned_data['bayes_init_try_times'] and train.cleaned_data['bayes_iteration_times'] and
-            train.cleaned_data['min_ln_c'] and train.cleaned_data['max_ln_c'] and
+            search_config and train.cleaned_data['min_ln_c'] and train.cleaned_data['max_ln_c'] and
             0 < train.cleaned_data['min_ln_c'] < train.cleaned_data['max_ln_c']
         ):
             context = {"color": "danger", "content": "Submission is not valid."}
             return render(req, "task_manager/hint_widget.html", context)
     step.status = 2
-    step.save()
+    step.save(update_fields=['status'])
     try:
         # ---------- Asynchronous Algorithm START ----------
-        with open(algorithm_.dataframe.file.path, "rb") as f:
-            dataframe = pickle.load(f)
+        dataframe = load_paper(algorithm_.dataframe)
         x_col = [x.name for x in Column.objects.filter(algorithm=algorithm_, x_column=True)]
         y_col = Column.objects.filter(algorithm=algorithm_, y_column=True).first().name
         mode = train.cleaned_data['running_mode']
@@ -282,7 +312,9 @@ def train_model(req):
                 x_train, x_valid, y_train, y_valid = x[train_index], x[valid_index], y[train_index], y[valid_index]
                 y_1h_train, y_1h_valid = y_1h[train_index], y_1h[valid_index]
 
-                if train.cleaned_data['regularization'] != 'none':
+                if train.cleaned_data['regularization'] != 'none' and train.cleaned_data['search'] == 'path':
+                    best, history = regularization_path(train.cleaned_data, x_train, y_train, y_1h_train)
+                elif train.cleaned_data['regularization'] != 'none':
                     def bayes_lgr_5_fold(c, l1_ratio):
                         lgr = LogisticRegression(
                             penalty=train.cleaned_data['regularization'],
@@ -291,19 +323,19 @@ def train_model(req):
                         )
                         lgr.fit(x_train, y_train)
                         y_train_hat = lgr.predict_proba(x_train)
-                        auc_in_bayes = np.mean([roc_auc_score(y_1h_train[:, i], y_train_hat[:, i])
-                                                for i in range(y_1h.shape[1])])
+                        auc_in_bayes = mean_roc_auc(y_1h_train, y_train_hat)
                         return auc_in_bayes
                     optimizer = BayesianOptimization(f=bayes_lgr_5_fold, pbounds=hyper_parameters,
                                                      random_state=train.cleaned_data['random_seed'])
                     optimizer.maximize(init_points=train.cleaned_data['bayes_init_try_times'],
                                        n_iter=train.cleaned_data['bayes_iteration_times'])
-                    history = {i: res for i, res in enumerate(optimizer.res)}
+                    best, history = optimizer.max, {i: res for i, res in enumerate(optimizer.res)}
+                if train.cleaned_data['regularization'] != 'none':
                     histories.append(history)
                     mdl = LogisticRegression(
                         penalty=train.cleaned_data['regularization'],
-                        solver='saga', C=np.exp(optimizer.max['params']['c']),
-                        l1_ratio=optimizer.max['params']['l1_ratio'],
+                        solver='saga', C=np.exp(best['params']['c']),
+                        l1_ratio=best['params']['l1_ratio'],
                         random_state=train.cleaned_data['random_seed'],
                     )
                 else:
@@ -311,25 +343,24 @@ def train_model(req):
                 mdl.fit(x_train, y_train)
                 models_.append(mdl)
                 y_valid_hat = mdl.predict_proba(x_valid)
+                fold_auc = roc_auc(y_1h_valid, y_valid_hat)
+                tpr_poly_[:, k, :] = roc_curves(y_1h_valid, y_valid_hat, fpr_poly_)
                 for name, i in class_dict.items():
-                    auc[name][k] = roc_auc_score(y_1h_valid[:, i], y_valid_hat[:, i])
-                    auc[name][k] = round(float(auc[name][k]), 3)
-                    fpr, tpr, _ = roc_curve(y_1h_valid[:, i], y_valid_hat[:, i])
-                    tpr_poly_[i, k, :] = np.interp(fpr_poly_, fpr, tpr)
+                    auc[name][k] = round(float(fold_auc[i]), 3)
                 hyper_parameters_list.append({
                     'penalty': mdl.penalty, 'solver': mdl.solver, 'c': mdl.C,
                     'l1_ratio': mdl.l1_ratio
                 })
-            f, fig = io.StringIO(), plt.figure()
+            fig = plt.figure()
             for name, i in class_dict.items():
                 mean_roc = np.mean(tpr_poly_, axis=1)[i]
                 mean_auc = np.mean(auc[name])
                 range_auc = np.maximum(np.max(auc[name]) - mean_auc, mean_auc - np.min(auc[name]))
                 plt.plot(fpr_poly_, mean_roc, label=f'{name} (AUC = {mean_auc.round(3)} ± {range_auc.round(3)})')
 
-            intermediate_paper_handle = ContentFile(pickle.dumps(models_))
+            intermediate_paper_handle = dump_paper(models_, 3)
             new_paper = Paper(user=req.user, role=3, name=f'Logistic Regression #{algorithm_.id} Model')
-            new_paper.file.save(f'lgr_{algorithm_.id}_model.pkl', intermediate_paper_handle)
+            new_paper.file.save(f'lgr_{algorithm_.id}_model.joblib', intermediate_paper_handle)
             new_paper.save()
             algorithm_.model = new_paper
             algorithm_.training_history = json.dumps(histories, ensure_ascii=False)
@@ -339,15 +370,15 @@ def train_model(req):
             plt.ylabel("True Positive Rate")
             plt.xlabel("False Positive Rate")
             plt.legend(loc=4)
-            fig.savefig(f, format='svg')
-            plt.close(fig)
-            algorithm_.roc_curve = f.getvalue()
+            algorithm_.roc_curve = save_figure(fig)
             algorithm_.hyper_parameters = json.dumps(hyper_parameters_list, ensure_ascii=False)
 
         elif mode == 'split':
             x_train, x_valid, y_train, y_valid, y_1h_train, y_1h_valid = train_test_split(
                 x, y, y_1h, train_size=0.8, shuffle=True, random_state=train.cleaned_data['random_seed'])
-            if train.cleaned_data['regularization'] != 'none':
+            if train.cleaned_data['regularization'] != 'none' and train.cleaned_data['search'] == 'path':
+                best, history = regularization_path(train.cleaned_data, x_train, y_train, y_1h_train)
+            elif train.cleaned_data['regularization'] != 'none':
                 def bayes_lgr_split(c, l1_ratio):
                     lgr = LogisticRegression(
                         penalty=train.cleaned_data['regularization'],
@@ -356,20 +387,20 @@ def train_model(req):
                     )
                     lgr.fit(x_train, y_train)
                     y_train_hat = lgr.predict_proba(x_train)
-                    auc_in_bayes = np.mean([roc_auc_score(y_1h_train[:, i], y_train_hat[:, i])
-                                            for i in range(y_1h.shape[1])])
+                    auc_in_bayes = mean_roc_auc(y_1h_train, y_train_hat)
                     return auc_in_bayes
 
                 optimizer = BayesianOptimization(f=bayes_lgr_split, pbounds=hyper_parameters,
                                                  random_state=train.cleaned_data['random_seed'])
                 optimizer.maximize(init_points=train.cleaned_data['bayes_init_try_times'],
                                    n_iter=train.cleaned_data['bayes_iteration_times'])
-                history = {i: res for i, res in enumerate(optimizer.res)}
+                best, history = optimizer.max, {i: res for i, res in enumerate(optimizer.res)}
+            if train.cleaned_data['regularization'] != 'none':
                 algorithm_.training_history = json.dumps(history, ensure_ascii=False)
                 mdl = LogisticRegression(
                     penalty=train.cleaned_data['regularization'],
-                    solver='saga', C=np.exp(optimizer.max['params']['c']),
-                    l1_ratio=optimizer.max['params']['l1_ratio'],
+                    solver='saga', C=np.exp(best['params']['c']),
+                    l1_ratio=best['params']['l1_ratio'],
                     random_state=train.cleaned_data['random_seed'],
                 )
             else:
@@ -382,18 +413,17 @@ def train_model(req):
             }
             algorithm_.hyper_parameters = json.dumps(hyper_parameters, ensure_ascii=False)
             auc = {}
-            f, fig = io.StringIO(), plt.figure()
+            fig = plt.figure()
 
+            valid_auc = roc_auc(y_1h_valid, y_valid_hat)
+            tpr_poly_ = roc_curves(y_1h_valid, y_valid_hat, fpr_poly_)
             for name, i in class_dict.items():
-                auc[name] = roc_auc_score(y_1h_valid[:, i], y_valid_hat[:, i])
-                auc[name] = round(float(auc[name]), 3)
-                fpr, tpr, _ = roc_curve(y_1h_valid[:, i], y_valid_hat[:, i])
-                tpr_poly_ = np.interp(fpr_poly_, fpr, tpr)
-                plt.plot(fpr_poly_, tpr_poly_, label=f'{name} (AUC = {auc[name].__round__(3)})')
+                auc[name] = round(float(valid_auc[i]), 3)
+                plt.plot(fpr_poly_, tpr_poly_[i], label=f'{name} (AUC = {auc[name].__round__(3)})')
 
-            intermediate_paper_handle = ContentFile(pickle.dumps(mdl))
+            intermediate_paper_handle = dump_paper(mdl, 3)
             new_paper = Paper(user=req.user, role=3, name=f'Logistic Regression #{algorithm_.id} Model')
-            new_paper.file.save(f'lgr_{algorithm_.id}_model.pkl', intermediate_paper_handle)
+            new_paper.file.save(f'lgr_{algorithm_.id}_model.joblib', intermediate_paper_handle)
             new_paper.save()
             algorithm_.model = new_paper
             algorithm_.auc = json.dumps(auc, ensure_ascii=False)
@@ -402,11 +432,11 @@ def train_model(req):
             plt.ylabel("True Positive Rate")
             plt.xlabel("False Positive Rate")
             plt.legend(loc=4)
-            fig.savefig(f, format='svg')
-            plt.close(fig)
-            algorithm_.roc_curve = f.getvalue()
+            algorithm_.roc_curve = save_figure(fig)
         else:
-            if train.cleaned_data['regularization'] != 'none':
+            if train.cleaned_data['regularization'] != 'none' and train.cleaned_data['search'] == 'path':
+                best, history = regularization_path(train.cleaned_data, x, y, y_1h)
+            elif train.cleaned_data['regularization'] != 'none':
                 def bayes_lgr_full_train(c, l1_ratio):
                     lgr = LogisticRegression(
                         penalty=train.cleaned_data['regularization'],
@@ -415,20 +445,20 @@ def train_model(req):
                     )
                     lgr.fit(x, y)
                     y_hat = lgr.predict_proba(x)
-                    auc_in_bayes = np.mean([roc_auc_score(y_1h[:, i], y_hat[:, i])
-                                            for i in range(y_1h.shape[1])])
+                    auc_in_bayes = mean_roc_auc(y_1h, y_hat)
                     return auc_in_bayes
 
                 optimizer = BayesianOptimization(f=bayes_lgr_full_train, pbounds=hyper_parameters,
                                                  random_state=train.cleaned_data['random_seed'])
                 optimizer.maximize(init_points=train.cleaned_data['bayes_init_try_times'],
                                    n_iter=train.cleaned_data['bayes_iteration_times'])
-                history = {i: res for i, res in enumerate(optimizer.res)}
+                best, history = optimizer.max, {i: res for i, res in enumerate(optimizer.res)}
+            if train.cleaned_data['regularization'] != 'none':
                 algorithm_.training_history = json.dumps(history, ensure_ascii=False)
                 mdl = LogisticRegression(
                     penalty=train.cleaned_data['regularization'],
-                    solver='saga', C=np.exp(optimizer.max['params']['c']),
-                    l1_ratio=optimizer.max['params']['l1_ratio'],
+                    solver='saga', C=np.exp(best['params']['c']),
+                    l1_ratio=best['params']['l1_ratio'],
                     random_state=train.cleaned_data['random_seed'],
                 )
             else:
@@ -439,9 +469,9 @@ def train_model(req):
                 'l1_ratio': mdl.l1_ratio
             }
             algorithm_.hyper_parameters = json.dumps(hyper_parameters, ensure_ascii=False)
-            intermediate_paper_handle = ContentFile(pickle.dumps(mdl))
+            intermediate_paper_handle = dump_paper(mdl, 3)
             new_paper = Paper(user=req.user, role=3, name=f'Logistic Regression #{algorithm_.id} Model')
-            new_paper.file.save(f'lgr_{algorithm_.id}_model.pkl', intermediate_paper_handle)
+            new_paper.file.save(f'lgr_{algorithm_.id}_model.joblib', intermediate_paper_handle)
             new_paper.save()
             algorithm_.model = new_paper
 
@@ -452,12 +482,12 @@ def train_model(req):
     except Exception as e:
         step.status = 4
         step.error_message = str(e)
-        step.save()
+        step.save(update_fields=['status', 'error_message'])
         context = {"color": "danger", "content": "Interrupted.",
                    "refresh": f"/algo_logistic_regression/{algorithm_.id}"}
         return render(req, "task_manager/hint_widget.html", context)
     step.status = 3
-    step.save()
+    step.save(update_fields=['status'])
     context = {"color": "success", "content": "The model has been trained and evaluated.",
                "refresh": f"/algo_logistic_regression/{algorithm_.id}"}
     return render(req, "task_manager/hint_widget.html", context)
@@ -509,10 +539,9 @@ def predict(req):
         context = {"color": "danger", "content": "This step doesn't have a trained model."}
         return render(req, "task_manager/hint_widget.html", context)
     step.status = 2
-    step.save()
+    step.save(update_fields=['status'])
     try:
-        with open(algorithm_.model.file.path, "rb") as f:
-            model = pickle.load(f)
+        model = load_paper(algorithm_.model)
         x_col = [x.name for x in Column.objects.filter(algorithm=algorithm_, x_column=True)]
         y_col = Column.objects.filter(algorithm=algorithm_, y_column=True).first().name
         x = table[x_col].values
@@ -527,7 +556,7 @@ def predict(req):
             table.to_excel(f, index=False)
     except Exception as e:
         step.status = 4
-        step.save()
+        step.save(update_fields=['status'])
         context = {"color": "warning", "content": f"Interrupted. {e}"}
         return render(req, "task_manager/hint_widget.html", context)
     new_paper = Paper(user=req.user, role=4, name=f"Logistic Regression #{algorithm_.id} Predict")
@@ -535,7 +564,7 @@ def predict(req):
     new_paper.save()
     step.predicted_data = new_paper
     step.status = 3
-    step.save()
+    step.save(update_fields=['predicted_data', 'status'])
     context = {"color": "success", "content": "Prediction completed.",
                "refresh": f"/algo_logistic_regression/{algorithm_.id}"}
     return render(req, "task_manager/hint_widget.html", context=context)
@@ -1,6 +1,6 @@
 from django.db import models
 from library.models import Paper
-from task_manager.models import Step
+from task_manager.models import AlgorithmManager, Step
 
 
 class MyOneClassSVM(models.Model):
@@ -18,6 +18,8 @@ class MyOneClassSVM(models.Model):
     support_vectors = models.ForeignKey(Paper, models.SET_NULL, blank=True, null=True,
                                         related_name="ocs_support_vectors")
 
+    objects = AlgorithmManager('hyper_parameters', 'confusion_matrix')
+
 
 class Column(models.Model):
     algorithm = models.ForeignKey(MyOneClassSVM, models.CASCADE)
@@ -1,20 +1,23 @@
 import io
 import json
-import pickle
 
 import numpy as np
 import pandas as pd
 from django import forms
 from django.contrib.auth.decorators import permission_required
-from django.core.files.base import ContentFile
 from django.shortcuts import render, redirect
 from django.utils.datastructures import MultiValueDictKeyError
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST
 from sklearn.model_selection import KFold, train_test_split
+from sklearn.linear_model import SGDOneClassSVM
+from sklearn.pipeline import Pipeline
 from sklearn.svm import OneClassSVM
 
+from library.serialization import dump_paper, load_paper
 import task_manager.views
+from task_manager.columns import flag_columns, replace_columns, unflag_columns
+from task_manager.kernels import FeatureMapCache, kernel_modes
 from task_manager.models import OpenedTask
 from .models import *
 
@@ -75,6 +78,33 @@ class Train(PublicAlgorithm):
                   '(Integer no smaller than 2)',
         required=False, min_value=2,
     )
+    kernel_mode = forms.ChoiceField(
+        widget=forms.Select({'class': 'form-select'}), choices=kernel_modes, initial='exact',
+        help_text='Approximate modes map samples to features approximating the kernel function and train a linear '
+                  'one-class SVM with SGD, whose time cost is linear in the number of samples.'
+    )
+    n_components = forms.IntegerField(
+        min_value=16, initial=256, widget=forms.NumberInput({'class': 'form-control'}),
+        help_text='Number of features to approximate the kernel function. Required only in approximate modes.'
+    )
+
+
+def fit_one_class_svm(config, x_train):
+    """
+    :return: the fitted model, and its hyper-parameters.
+    """
+    degree = config['degree'] or 3
+    if config['kernel_mode'] == 'exact':
+        mdl = OneClassSVM(kernel=config['kernel'], nu=config['nu'], degree=degree, max_iter=5000)
+        mdl.fit(x_train)
+        return mdl, {'degree': mdl.degree, 'kernel': mdl.kernel, 'nu': mdl.nu}
+    cache = FeatureMapCache(x_train, config['kernel'], config['kernel_mode'], config['n_components'],
+                            config['random_seed'])
+    feature_map, z = cache.design(degree)
+    svm = SGDOneClassSVM(nu=config['nu'], random_state=config['random_seed'])
+    svm.fit(z)
+    mdl = Pipeline([('features', feature_map), ('svm', svm)])
+    return mdl, {'degree': degree, 'kernel': config['kernel'], 'nu': config['nu'], 'approximation': cache.describe()}
 
 
 @permission_required(
@@ -103,7 +133,7 @@ def add_one_class_svm(req):
 def view_one_class_svm(req, algo_id):
     # ---------- Algorithm Ownership Navigator START ----------
     try:
-        algorithm_ = MyOneClassSVM.objects.get(id=algo_id)
+        algorithm_ = MyOneClassSVM.objects.with_heavy_fields().get(id=algo_id)
     except MyOneClassSVM.DoesNotExist:
         return redirect("/task/retrieve?message=This instance doesn't exist.&color=danger")
     if not algorithm_.step.open_permission(req.user):
@@ -153,28 +183,24 @@ def import_data(req):
     algorithm_ = MyOneClassSVM.objects.get(step=step)
     try:
         # ---------- Asynchronous Algorithm START   ----------
-        intermediate_paper_handle = ContentFile(pickle.dumps(table))
+        intermediate_paper_handle = dump_paper(table, 2)
         new_paper = Paper(user=req.user, role=2,
                           name=f"One-class SVM #{algorithm_.id} Parsed Data")
-        new_paper.file.save(f"one_class_svm_{algorithm_.id}_parsed_data.pkl", intermediate_paper_handle)
+        new_paper.file.save(f"one_class_svm_{algorithm_.id}_parsed_data.joblib", intermediate_paper_handle)
         new_paper.save()
         algorithm_.dataframe = new_paper
         algorithm_.save()
-        for column in Column.objects.filter(algorithm=algorithm_):
-            column.delete()
-        for col in table.columns:
-            new_column = Column(algorithm=algorithm_, name=col)
-            new_column.save()
+        replace_columns(Column, algorithm_, table.columns)
         # ---------- Asynchronous Algorithm END   ----------
     except Exception as e:
         step.status = 4
         step.error_message = str(e)
-        step.save()
+        step.save(update_fields=['status', 'error_message'])
         context = {"color": "danger", "content": "Interrupted.",
                    "refresh": f"/algo_one_class_svm/{algorithm_.id}"}
         return render(req, "task_manager/hint_widget.html", context)
     step.status = 3
-    step.save()
+    step.save(update_fields=['status'])
     context = {"color": "success", "content": "The file is successfully parsed.",
                "refresh": f"/algo_one_class_svm/{algorithm_.id}"}
     return render(req, "task_manager/hint_widget.html", context)
@@ -195,20 +221,17 @@ def set_variables(req):  # SPECIFIED
         context = {"color": "danger", "content": "Submission is not valid."}
         return render(req, "task_manager/hint_widget.html", context)
     # ---------- Algorithm Ownership Validator v2 END   ----------
-    for column in variable_picker.cleaned_data['Independent_Variables_X']:
-        column.x_column = True
-        column.save()
+    flag_columns(Column, algorithm_, x_column=variable_picker.cleaned_data['Independent_Variables_X'])
     column = variable_picker.cleaned_data['Dependent_Variable_Y']
     try:
-        data = pd.read_pickle(algorithm_.dataframe.file.path)
+        data = load_paper(algorithm_.dataframe)
         data = data[column.name]
         algorithm_.class_list = json.dumps(np.unique(data).tolist())
         algorithm_.save()
     except Exception as e:
         context = {"color": "danger", "content": f"The dependent variable cannot be parsed. {e}"}
         return render(req, "task_manager/hint_widget.html", context)
-    column.y_column = True
-    column.save()
+    flag_columns(Column, algorithm_, y_column=[column])
     context = {"color": "success", "content": "Set variables successfully.",
                "refresh": f"/algo_one_class_svm/{algorithm_.id}"}  # REQUIRED FOR REFRESHING
     return render(req, "task_manager/hint_widget.html", context)
@@ -227,9 +250,7 @@ def clear_variables(req, algo_id):
     # ---------- Algorithm Ownership Navigator END   ----------
     if algorithm_.step.status == 2:
         return redirect("/task/retrieve?message=Cannot start because this algorithm is busy.&color=warning")
-    for column in Column.objects.filter(algorithm=algorithm_):
-        column.x_column = column.y_column = False
-        column.save()
+    unflag_columns(Column, algorithm_, 'x_column', 'y_column')
     algorithm_.class_list = str()
     algorithm_.save()
     return redirect(f"/algo_one_class_svm/{algorithm_.id}")
@@ -250,15 +271,17 @@ def train_model(req):
     if (not train.is_valid()) or (not step.open_permission(req.user)) or train.cleaned_data['nu'] == 0:
         context = {"color": "danger", "content": "Submission is not valid."}
         return render(req, "task_manager/hint_widget.html", context)
+    if train.cleaned_data['kernel_mode'] == 'rff' and train.cleaned_data['kernel'] != 'rbf':
+        context = {"color": "warning", "content": "Random Fourier features only approximate the RBF kernel."}
+        return render(req, "task_manager/hint_widget.html", context)
     if step.status == 2:
         context = {"color": "warning", "content": "Cannot start because this algorithm is busy."}
         return render(req, "task_manager/hint_widget.html", context)
     step.status = 2
-    step.save()
+    step.save(update_fields=['status'])
     try:
         # ---------- Asynchronous Algorithm START ----------
-        with open(algorithm_.dataframe.file.path, "rb") as f:
-            dataframe = pickle.load(f)
+        dataframe = load_paper(algorithm_.dataframe)
         x_col = [x.name for x in Column.objects.filter(algorithm=algorithm_, x_column=True)]
         y_col = Column.objects.filter(algorithm=algorithm_, y_column=True).first().name
         mode = train.cleaned_data['running_mode']
@@ -272,89 +295,80 @@ def train_model(req):
 
             for (train_index, valid_index), k in zip(k_fold.split(x), range(5)):
                 x_train, x_valid, y_train, y_valid = x[train_index], x[valid_index], y[train_index], y[valid_index]
-                x_train = x_train[y_train]
-                if train.cleaned_data['degree']:
-                    mdl = OneClassSVM(kernel=train.cleaned_data['kernel'], nu=train.cleaned_data['nu'],
-                                      degree=train.cleaned_data['degree'], max_iter=5000)
-                else:
-                    mdl = OneClassSVM(kernel=train.cleaned_data['kernel'], nu=train.cleaned_data['nu'], max_iter=5000)
-                mdl.fit(x_train)
+                x_train = x_train[y_train == 1]
+                mdl, hyper_parameters = fit_one_class_svm(train.cleaned_data, x_train)
                 models_.append(mdl)
                 y_valid_hat = mdl.predict(x_valid)
                 c1, c2 = y_valid == 1, y_valid_hat == 1
                 c_mat = [[np.sum(~c1 & ~c2).__int__(), np.sum(~c1 & c2).__int__()],
                          [np.sum(c1 & ~c2).__int__(), np.sum(c1 & c2).__int__()]]
                 confusion_matrix_list.append(c_mat)
-                hyper_parameters_list.append({'degree': mdl.degree, 'kernel': mdl.kernel, 'nu': mdl.nu})
-                support_vectors_list.append(mdl.support_vectors_)
+                hyper_parameters_list.append(hyper_parameters)
+                support_vectors_list.append(getattr(mdl, 'support_vectors_', None))
 
             algorithm_.confusion_matrix = json.dumps(confusion_matrix_list)
             algorithm_.hyper_parameters = json.dumps(hyper_parameters_list, ensure_ascii=False)
 
-            intermediate_paper_handle = ContentFile(pickle.dumps(models_))
+            intermediate_paper_handle = dump_paper(models_, 3)
             new_paper = Paper(user=req.user, role=3, name=f'One-class SVM #{algorithm_.id} Model')
-            new_paper.file.save(f'one_class_svm_{algorithm_.id}_model.pkl', intermediate_paper_handle)
+            new_paper.file.save(f'one_class_svm_{algorithm_.id}_model.joblib', intermediate_paper_handle)
             new_paper.save()
             algorithm_.model = new_paper
 
-            intermediate_paper_handle = ContentFile(pickle.dumps(support_vectors_list))
-            new_paper = Paper(user=req.user, role=2, name=f'One-class SVM #{algorithm_.id} Support Vector')
-            new_paper.file.save(f'one_class_svm_{algorithm_.id}_support_vector.pkl', intermediate_paper_handle)
-            new_paper.save()
-            algorithm_.support_vectors = new_paper
+            if train.cleaned_data['kernel_mode'] == 'exact':
+                intermediate_paper_handle = dump_paper(support_vectors_list, 2)
+                new_paper = Paper(user=req.user, role=2, name=f'One-class SVM #{algorithm_.id} Support Vector')
+                new_paper.file.save(f'one_class_svm_{algorithm_.id}_support_vector.joblib', intermediate_paper_handle)
+                new_paper.save()
+                algorithm_.support_vectors = new_paper
+            else:  # Approximate models don't have support vectors.
+                algorithm_.support_vectors = None
 
         elif mode == "split":
             x_train, x_valid, y_train, y_valid = train_test_split(x, y, train_size=0.8, shuffle=True,
                                                                   random_state=train.cleaned_data['random_seed'])
-            x_train = x_train[y_train]
-            if train.cleaned_data['degree']:
-                mdl = OneClassSVM(kernel=train.cleaned_data['kernel'], nu=train.cleaned_data['nu'],
-                                  degree=train.cleaned_data['degree'], max_iter=5000)
-            else:
-                mdl = OneClassSVM(kernel=train.cleaned_data['kernel'], nu=train.cleaned_data['nu'], max_iter=5000)
-            mdl.fit(x_train)
+            x_train = x_train[y_train == 1]
+            mdl, hyper_parameters = fit_one_class_svm(train.cleaned_data, x_train)
             y_valid_hat = mdl.predict(x_valid)
             c1, c2 = y_valid == 1, y_valid_hat == 1
             c_mat = [[np.sum(~c1 & ~c2).__int__(), np.sum(~c1 & c2).__int__()],
                      [np.sum(c1 & ~c2).__int__(), np.sum(c1 & c2).__int__()]]
-            hyper_parameters = {'degree': mdl.degree, 'kernel': mdl.kernel, 'nu': mdl.nu}
 
             algorithm_.confusion_matrix = json.dumps(c_mat)
             algorithm_.hyper_parameters = json.dumps(hyper_parameters, ensure_ascii=False)
 
-            intermediate_paper_handle = ContentFile(pickle.dumps(mdl.support_vectors_))
-            new_paper = Paper(user=req.user, role=2, name=f'One-class SVM #{algorithm_.id} Support Vector')
-            new_paper.file.save(f'one_class_svm_{algorithm_.id}_support_vector.pkl', intermediate_paper_handle)
-            new_paper.save()
-            algorithm_.support_vectors = new_paper
+            if train.cleaned_data['kernel_mode'] == 'exact':
+                intermediate_paper_handle = dump_paper(mdl.support_vectors_, 2)
+                new_paper = Paper(user=req.user, role=2, name=f'One-class SVM #{algorithm_.id} Support Vector')
+                new_paper.file.save(f'one_class_svm_{algorithm_.id}_support_vector.joblib', intermediate_paper_handle)
+                new_paper.save()
+                algorithm_.support_vectors = new_paper
+            else:  # Approximate models don't have support vectors.
+                algorithm_.support_vectors = None
 
-            intermediate_paper_handle = ContentFile(pickle.dumps(mdl))
+            intermediate_paper_handle = dump_paper(mdl, 3)
             new_paper = Paper(user=req.user, role=3, name=f'One-class SVM #{algorithm_.id} Model')
-            new_paper.file.save(f'one_class_svm_{algorithm_.id}_model.pkl', intermediate_paper_handle)
+            new_paper.file.save(f'one_class_svm_{algorithm_.id}_model.joblib', intermediate_paper_handle)
             new_paper.save()
             algorithm_.model = new_paper
 
         else:  # mode == "full_train"
-            if train.cleaned_data['degree']:
-                mdl = OneClassSVM(kernel=train.cleaned_data['kernel'], nu=train.cleaned_data['nu'],
-                                  degree=train.cleaned_data['degree'], max_iter=5000)
-            else:
-                mdl = OneClassSVM(kernel=train.cleaned_data['kernel'], nu=train.cleaned_data['nu'], max_iter=5000)
-            x_train = x[y]
-            mdl.fit(x_train)
-            hyper_parameters = {'degree': mdl.degree, 'kernel': mdl.kernel, 'nu': mdl.nu}
+            mdl, hyper_parameters = fit_one_class_svm(train.cleaned_data, x[y == 1])
 
             algorithm_.hyper_parameters = json.dumps(hyper_parameters, ensure_ascii=False)
 
-            intermediate_paper_handle = ContentFile(pickle.dumps(mdl.support_vectors_))
-            new_paper = Paper(user=req.user, role=2, name=f'One-class SVM #{algorithm_.id} Support Vector')
-            new_paper.file.save(f'one_class_svm_{algorithm_.id}_support_vector.pkl', intermediate_paper_handle)
-            new_paper.save()
-            algorithm_.support_vectors = new_paper
+            if train.cleaned_data['kernel_mode'] == 'exact':
+                intermediate_paper_handle = dump_paper(mdl.support_vectors_, 2)
+                new_paper = Paper(user=req.user, role=2, name=f'One-class SVM #{algorithm_.id} Support Vector')
+                new_paper.file.save(f'one_class_svm_{algorithm_.id}_support_vector.joblib', intermediate_paper_handle)
+                new_paper.save()
+                algorithm_.support_vectors = new_paper
+            else:  # Approximate models don't have support vectors.
+                algorithm_.support_vectors = None
 
-            intermediate_paper_handle = ContentFile(pickle.dumps(mdl))
+            intermediate_paper_handle = dump_paper(mdl, 3)
             new_paper = Paper(user=req.user, role=3, name=f'One-class SVM #{algorithm_.id} Model')
-            new_paper.file.save(f'one_class_svm_{algorithm_.id}_model.pkl', intermediate_paper_handle)
+            new_paper.file.save(f'one_class_svm_{algorithm_.id}_model.joblib', intermediate_paper_handle)
             new_paper.save()
             algorithm_.model = new_paper
 
@@ -364,12 +378,12 @@ def train_model(req):
     except Exception as e:
         step.status = 4
         step.error_message = str(e)
-        step.save()
+        step.save(update_fields=['status', 'error_message'])
         context = {"color": "danger", "content": "Interrupted.",
                    "refresh": f"/algo_one_class_svm/{algorithm_.id}"}
         return render(req, "task_manager/hint_widget.html", context)
     step.status = 3
-    step.save()
+    step.save(update_fields=['status'])
     context = {"color": "success", "content": "The model has been trained and evaluated.",
                "refresh": f"/algo_one_class_svm/{algorithm_.id}"}
     return render(req, "task_manager/hint_widget.html", context)
@@ -420,10 +434,9 @@ def predict(req):
         context = {"color": "danger", "content": "This step doesn't have a trained model."}
         return render(req, "task_manager/hint_widget.html", context)
     step.status = 2
-    step.save()
+    step.save(update_fields=['status'])
     try:
-        with open(algorithm_.model.file.path, "rb") as f:
-            model = pickle.load(f)
+        model = load_paper(algorithm_.model)
         x_col = [x.name for x in Column.objects.filter(algorithm=algorithm_, x_column=True)]
         y_col = Column.objects.filter(algorithm=algorithm_, y_column=True).first().name
         x = table[x_col].values
@@ -438,7 +451,7 @@ def predict(req):
             table.to_excel(f, index=False)
     except Exception as e:
         step.status = 4
-        step.save()
+        step.save(update_fields=['status'])
         context = {"color": "warning", "content": f"Interrupted. {e}"}
         return render(req, "task_manager/hint_widget.html", context)
     new_paper = Paper(user=req.user, role=4, name=f"One-class SVM #{algorithm_.id} Predict")
@@ -446,7 +459,7 @@ def predict(req):
     new_paper.save()
     step.predicted_data = new_paper
     step.status = 3
-    step.save()
+    step.save(update_fields=['predicted_data', 'status'])
     context = {"color": "success", "content": "Prediction completed.",
                "refresh": f"/algo_one_class_svm/{algorithm_.id}"}
     return render(req, "task_manager/hint_widget.html", context=context)
@@ -0,0 +1,21 @@
+# Generated by Django 4.0.4 on 2026-10-19 17:40
+
+from django.db import migrations, models
+
+from task_manager.figures import store_inline_figures
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('algo_pca', '0001_initial'),
+    ]
+
+    operations = [
+        store_inline_figures('algo_pca', 'MyPCA', 'evr_figure'),
+        migrations.AlterField(
+            model_name='mypca',
+            name='evr_figure',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+    ]
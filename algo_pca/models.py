@@ -7,7 +7,7 @@ class MyPCA(models.Model):
     step = models.ForeignKey(Step, models.CASCADE, blank=True, null=True)
     dataframe = models.ForeignKey(Paper, models.SET_NULL, blank=True, null=True, related_name="pca_dataframe")
     model = models.ForeignKey(Paper, models.SET_NULL, blank=True, null=True, related_name="pca_model")
-    evr_figure = models.TextField(blank=True)
+    evr_figure = models.CharField(max_length=64, blank=True)  # digest of the figure file, see task_manager.figures
 
 
 class Column(models.Model):
@@ -1,19 +1,20 @@
 import io
 import json
-import pickle
 
 import numpy as np
 import pandas as pd
 from django import forms
 from django.contrib.auth.decorators import permission_required
-from django.core.files.base import ContentFile
 from django.shortcuts import render, redirect
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST
 from sklearn.decomposition import PCA
 import matplotlib.pyplot as plt
 
+from library.serialization import dump_paper, load_paper
 import task_manager.views
+from task_manager.columns import flag_columns, replace_columns, unflag_columns
+from task_manager.figures import save_figure
 from task_manager.models import OpenedTask
 from .models import *
 
@@ -103,28 +104,24 @@ def import_data(req):
     algorithm_ = MyPCA.objects.get(step=step)
     try:
         # ---------- Asynchronous Algorithm START   ----------
-        intermediate_paper_handle = ContentFile(pickle.dumps(table))
+        intermediate_paper_handle = dump_paper(table, 2)
         new_paper = Paper(user=req.user, role=2,
                           name=f"DBSCAN #{algorithm_.id} Parsed Data")
-        new_paper.file.save(f"dbscan_{algorithm_.id}_parsed_data.pkl", intermediate_paper_handle)
+        new_paper.file.save(f"dbscan_{algorithm_.id}_parsed_data.joblib", intermediate_paper_handle)
         new_paper.save()
         algorithm_.dataframe = new_paper
         algorithm_.save()
-        for column in Column.objects.filter(algorithm=algorithm_):
-            column.delete()
-        for col in table.columns:
-            new_column = Column(algorithm=algorithm_, name=col)
-            new_column.save()
+        replace_columns(Column, algorithm_, table.columns)
         # ---------- Asynchronous Algorithm END   ----------
     except Exception as e:
         step.status = 4
         step.error_message = str(e)
-        step.save()
+        step.save(update_fields=['status', 'error_message'])
         context = {"color": "danger", "content": "Interrupted.",
                    "refresh": f"/algo_pca/{algorithm_.id}"}
         return render(req, "task_manager/hint_widget.html", context)
     step.status = 3
-    step.save()
+    step.save(update_fields=['status'])
     context = {"color": "success", "content": "The file is successfully parsed.",
                "refresh": f"/algo_pca/{algorithm_.id}"}
     return render(req, "task_manager/hint_widget.html", context)
@@ -145,9 +142,7 @@ def set_variables(req):
         context = {"color": "danger", "content": "Submission is not valid."}
         return render(req, "task_manager/hint_widget.html", context)
     # ---------- Algorithm Ownership Validator v2 END   ----------
-    for column in variable_picker.cleaned_data['Independent_Variables_X']:
-        column.x_column = True
-        column.save()
+    flag_columns(Column, algorithm_, x_column=variable_picker.cleaned_data['Independent_Variables_X'])
     context = {"color": "success", "content": "Set variables successfully.",
                "refresh": f"/algo_pca/{algorithm_.id}"}
     return render(req, "task_manager/hint_widget.html", context)
@@ -166,9 +161,7 @@ def clear_variables(req, algo_id):
     # ---------- Algorithm Ownership Navigator END   ----------
     if algorithm_.step.status == 2:
         return redirect("/task/retrieve?message=Cannot start because this algorithm is busy.&color=warning")
-    for column in Column.objects.filter(algorithm=algorithm_):
-        column.x_column = False
-        column.save()
+    unflag_columns(Column, algorithm_, 'x_column')
     algorithm_.save()
     return redirect(f"/algo_pca/{algorithm_.id}")
 
@@ -191,10 +184,10 @@ def train_model(req):
         context = {"color": "warning", "content": "Cannot start because this algorithm is busy."}
         return render(req, "task_manager/hint_widget.html", context)
     step.status = 2
-    step.save()
+    step.save(update_fields=['status'])
     try:
         # ---------- Asynchronous Algorithm START ----------
-        dataframe = pd.read_pickle(algorithm_.dataframe.file.path)
+        dataframe = load_paper(algorithm_.dataframe)
         x_col = [x.name for x in Column.objects.filter(algorithm=algorithm_, x_column=True)]
         x = dataframe[x_col].values
         if train.cleaned_data['kept_dimensions']:
@@ -203,31 +196,28 @@ def train_model(req):
             pca = PCA()
         pca.fit(x)
         
-        intermediate_paper_handle = ContentFile(pickle.dumps(pca))
+        intermediate_paper_handle = dump_paper(pca, 3)
         new_paper = Paper(user=req.user, role=3, name=f'PCA #{algorithm_.id} Model')
-        new_paper.file.save(f'pca_{algorithm_.id}_model.pkl', intermediate_paper_handle)
+        new_paper.file.save(f'pca_{algorithm_.id}_model.joblib', intermediate_paper_handle)
         new_paper.save()
         algorithm_.model = new_paper
 
-        f, fig = io.BytesIO(), plt.figure()
+        fig = plt.figure()
         plt.plot(range(1, pca.n_components + 1), np.cumsum(pca.explained_variance_ratio_))
         plt.xlabel("Components Ranking")
         plt.ylabel("Explained Variance Ratio")
-        fig.savefig(f, format='svg')
-        plt.close(fig)
-
-        algorithm_.evr_figure = f.getvalue().decode('utf-8')
+        algorithm_.evr_figure = save_figure(fig)
         # ---------- Asynchronous Algorithm END   ----------
     except Exception as e:
         step.status = 4
         step.error_message = str(e)
-        step.save()
+        step.save(update_fields=['status', 'error_message'])
         context = {"color": "danger", "content": "Interrupted.",
                    "refresh": f"/algo_pca/{algorithm_.id}"}
         return render(req, "task_manager/hint_widget.html", context)
     algorithm_.save()
     step.status = 3
-    step.save()
+    step.save(update_fields=['status'])
     context = {"color": "success", "content": "The model has been trained and evaluated.",
                "refresh": f"/algo_pca/{algorithm_.id}"}
     return render(req, "task_manager/hint_widget.html", context)
@@ -269,27 +259,28 @@ def predict(req):
         context = {"color": "danger", "content": "This step doesn't have a trained model."}
         return render(req, "task_manager/hint_widget.html", context)
     step.status = 2
-    step.save()
+    step.save(update_fields=['status'])
     try:
-        with open(algorithm_.model.file.path, "rb") as f:
-            model = pickle.load(f)
+        model = load_paper(algorithm_.model)
         x_col = [x.name for x in Column.objects.filter(algorithm=algorithm_, x_column=True)]
         x = table[x_col].values
         transformed_x = model.transform(x)
         transformed_x = pd.DataFrame(data=transformed_x,
                                      columns=[f'component_{i+1}' for i in range(transformed_x.shape[1])])
-        intermediate_file_handler = ContentFile(pickle.dumps(transformed_x))
+        table_bin = io.BytesIO()
+        with pd.ExcelWriter(table_bin) as f:
+            transformed_x.to_excel(f, index=False)
         new_paper = Paper(user=req.user, role=4, name=f"PCA #{algorithm_.id} Predict")
-        new_paper.file.save(f"pca_{algorithm_.id}_predict.xlsx", intermediate_file_handler)
+        new_paper.file.save(f"pca_{algorithm_.id}_predict.xlsx", table_bin)
         new_paper.save()
     except Exception as e:
         step.status = 4
-        step.save()
+        step.save(update_fields=['status'])
         context = {"color": "warning", "content": f"Interrupted. {e}"}
         return render(req, "task_manager/hint_widget.html", context)
     step.predicted_data = new_paper
     step.status = 3
-    step.save()
+    step.save(update_fields=['predicted_data', 'status'])
     context = {"color": "success", "content": "Prediction completed.",
                "refresh": f"/algo_pca/{algorithm_.id}"}
     return render(req, "task_manager/hint_widget.html", context=context)
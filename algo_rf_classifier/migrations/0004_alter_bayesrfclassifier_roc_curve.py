@@ -0,0 +1,21 @@
+# Generated by Django 4.0.4 on 2026-10-19 17:40
+
+from django.db import migrations, models
+
+from task_manager.figures import store_inline_figures
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('algo_rf_classifier', '0003_auto_20210920_1029'),
+    ]
+
+    operations = [
+        store_inline_figures('algo_rf_classifier', 'BayesRfClassifier', 'roc_curve'),
+        migrations.AlterField(
+            model_name='bayesrfclassifier',
+            name='roc_curve',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+    ]
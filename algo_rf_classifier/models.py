@@ -1,7 +1,7 @@
 from django.db import models
 
 from library.models import Paper
-from task_manager.models import Step
+from task_manager.models import AlgorithmManager, Step
 
 
 class BayesRfClassifier(models.Model):
@@ -17,7 +17,9 @@ class BayesRfClassifier(models.Model):
                             blank=True, max_length=10)
     hyper_parameters = models.TextField(blank=True)
     feature_importance = models.TextField(blank=True)
-    roc_curve = models.TextField(blank=True)
+    roc_curve = models.CharField(max_length=64, blank=True)  # digest of the figure file, see task_manager.figures
+
+    objects = AlgorithmManager('training_history', 'auc', 'hyper_parameters', 'feature_importance')
 
 
 class Column(models.Model):
@@ -1,22 +1,23 @@
 import io
 import json
-import pickle
 
 import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
 from django import forms
 from django.contrib.auth.decorators import permission_required
-from django.core.files.base import ContentFile
 from django.shortcuts import render, redirect
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST
 from sklearn.ensemble import RandomForestClassifier
-from sklearn.metrics import roc_auc_score, roc_curve
 from sklearn.model_selection import KFold, train_test_split
 
+from library.serialization import dump_paper, load_paper
 import task_manager.views
 from bayes_opt import BayesianOptimization
+from task_manager.columns import flag_columns, replace_columns, unflag_columns
+from task_manager.evaluation import mean_roc_auc, roc_auc, roc_curves
+from task_manager.figures import save_figure
 from task_manager.models import OpenedTask
 from .models import *
 
@@ -122,7 +123,7 @@ def add_rf_classifier(req):
 def view_rf_classifier(req, algo_id):
     # ---------- Algorithm Ownership Navigator START ----------
     try:
-        algorithm_ = BayesRfClassifier.objects.get(id=algo_id)
+        algorithm_ = BayesRfClassifier.objects.with_heavy_fields().get(id=algo_id)
     except BayesRfClassifier.DoesNotExist:
         return redirect("/task/retrieve?message=This instance doesn't exist.&color=danger")
     if not algorithm_.step.open_permission(req.user):
@@ -166,28 +167,24 @@ def import_data(req):
     algorithm_ = BayesRfClassifier.objects.get(step=step)
     try:
         # ---------- Asynchronous Algorithm START   ----------
-        intermediate_paper_handle = ContentFile(pickle.dumps(table))
+        intermediate_paper_handle = dump_paper(table, 2)
         new_paper = Paper(user=req.user, role=2,
                           name=f"Random Forest Classifier #{algorithm_.id} Parsed Data")
-        new_paper.file.save(f"rf_classifier_{algorithm_.id}_parsed_data.pkl", intermediate_paper_handle)
+        new_paper.file.save(f"rf_classifier_{algorithm_.id}_parsed_data.joblib", intermediate_paper_handle)
         new_paper.save()
         algorithm_.dataframe = new_paper
         algorithm_.save()
-        for column in Column.objects.filter(algorithm=algorithm_):
-            column.delete()
-        for col in table.columns:
-            new_column = Column(algorithm=algorithm_, name=col)
-            new_column.save()
+        replace_columns(Column, algorithm_, table.columns)
         # ---------- Asynchronous Algorithm END   ----------
     except Exception as e:
         step.status = 4
         step.error_message = str(e)
-        step.save()
+        step.save(update_fields=['status', 'error_message'])
         context = {"color": "danger", "content": "Interrupted.",
                    "refresh": f"/algo_rf_classifier/{algorithm_.id}"}
         return render(req, "task_manager/hint_widget.html", context)
     step.status = 3
-    step.save()
+    step.save(update_fields=['status'])
     context = {"color": "success", "content": "The file is successfully parsed.",
                "refresh": f"/algo_rf_classifier/{algorithm_.id}"}
     return render(req, "task_manager/hint_widget.html", context)
@@ -208,12 +205,8 @@ def set_variables(req):
         context = {"color": "danger", "content": "Submission is not valid."}
         return render(req, "task_manager/hint_widget.html", context)
     # ---------- Algorithm Ownership Validator v2 END   ----------
-    for column in variable_picker.cleaned_data['Independent_Variables_X']:
-        column.x_column = True
-        column.save()
-    column = variable_picker.cleaned_data['Dependent_Variable_Y']
-    column.y_column = True
-    column.save()
+    flag_columns(Column, algorithm_, x_column=variable_picker.cleaned_data['Independent_Variables_X'],
+                 y_column=[variable_picker.cleaned_data['Dependent_Variable_Y']])
     context = {"color": "success", "content": "Set variables successfully.",
                "refresh": f"/algo_rf_classifier/{algorithm_.id}"}
     return render(req, "task_manager/hint_widget.html", context)
@@ -232,9 +225,7 @@ def clear_variables(req, algo_id):
     # ---------- Algorithm Ownership Navigator END   ----------
     if algorithm_.step.status == 2:
         return redirect("/task/retrieve?message=Cannot start because this algorithm is busy.&color=warning")
-    for column in Column.objects.filter(algorithm=algorithm_):
-        column.x_column = column.y_column = False
-        column.save()
+    unflag_columns(Column, algorithm_, 'x_column', 'y_column')
     return redirect(f"/algo_rf_classifier/{algorithm_.id}")
 
 
@@ -273,11 +264,10 @@ def train_model(req):
         context = {"color": "warning", "content": "The interval of 'number of trees' is not valid."}
         return render(req, "task_manager/hint_widget.html", context)
     step.status = 2
-    step.save()
+    step.save(update_fields=['status'])
     try:
         # ---------- Asynchronous Algorithm START ----------
-        with open(algorithm_.dataframe.file.path, "rb") as f:
-            dataframe = pickle.load(f)
+        dataframe = load_paper(algorithm_.dataframe)
         x_col = [x.name for x in Column.objects.filter(algorithm=algorithm_, x_column=True)]
         y_col = Column.objects.filter(algorithm=algorithm_, y_column=True).first().name
         mode = train.cleaned_data['running_mode']
@@ -311,8 +301,7 @@ def train_model(req):
                     )
                     rf.fit(x_train, y_train)
                     y_train_hat = rf.predict_proba(x_train)
-                    auc_in_bayes = np.mean([roc_auc_score(y_1h_train[:, i], y_train_hat[:, i])
-                                            for i in range(y_1h.shape[1])])
+                    auc_in_bayes = mean_roc_auc(y_1h_train, y_train_hat)
                     return auc_in_bayes
 
                 optimizer = BayesianOptimization(f=bayes_rf_5_fold, pbounds=hyper_parameters,
@@ -331,11 +320,10 @@ def train_model(req):
                 mdl.fit(x_train, y_train)
                 models_.append(mdl)
                 y_valid_hat = mdl.predict_proba(x_valid)
+                fold_auc = roc_auc(y_1h_valid, y_valid_hat)
+                tpr_poly_[:, k, :] = roc_curves(y_1h_valid, y_valid_hat, fpr_poly_)
                 for name, i in class_dict.items():
-                    auc[name][k] = roc_auc_score(y_1h_valid[:, i], y_valid_hat[:, i])
-                    auc[name][k] = round(float(auc[name][k]), 3)
-                    fpr, tpr, _ = roc_curve(y_1h_valid[:, i], y_valid_hat[:, i])
-                    tpr_poly_[i, k, :] = np.interp(fpr_poly_, fpr, tpr)
+                    auc[name][k] = round(float(fold_auc[i]), 3)
                 hyper_parameters_list.append(
                     {'max_depth': mdl.max_depth, 'max_leaf_nodes': mdl.max_leaf_nodes,
                      'n_estimators': mdl.n_estimators}
@@ -344,16 +332,16 @@ def train_model(req):
                     {name: weight for name, weight in zip(x_col, mdl.feature_importances_)}
                 )
 
-            f, fig = io.StringIO(), plt.figure()
+            fig = plt.figure()
             for name, i in class_dict.items():
                 mean_roc = np.mean(tpr_poly_, axis=1)[i]
                 mean_auc = np.mean(auc[name])
                 range_auc = np.maximum(np.max(auc[name]) - mean_auc, mean_auc - np.min(auc[name]))
                 plt.plot(fpr_poly_, mean_roc, label=f'{name} (AUC = {mean_auc.round(3)} ± {range_auc.round(3)})')
 
-            intermediate_paper_handle = ContentFile(pickle.dumps(models_))
+            intermediate_paper_handle = dump_paper(models_, 3)
             new_paper = Paper(user=req.user, role=3, name=f'Random Forest Classifier #{algorithm_.id} Model')
-            new_paper.file.save(f'rf_classifier_{algorithm_.id}_model.pkl', intermediate_paper_handle)
+            new_paper.file.save(f'rf_classifier_{algorithm_.id}_model.joblib', intermediate_paper_handle)
             new_paper.save()
             algorithm_.model = new_paper
             algorithm_.training_history = json.dumps(histories, ensure_ascii=False)
@@ -363,9 +351,7 @@ def train_model(req):
             plt.ylabel("True Positive Rate")
             plt.xlabel("False Positive Rate")
             plt.legend(loc=4)
-            fig.savefig(f, format='svg')
-            plt.close(fig)
-            algorithm_.roc_curve = f.getvalue()
+            algorithm_.roc_curve = save_figure(fig)
             algorithm_.hyper_parameters = json.dumps(hyper_parameters_list, ensure_ascii=False)
             algorithm_.feature_importance = json.dumps(feature_importance_list, ensure_ascii=False)
 
@@ -381,8 +367,7 @@ def train_model(req):
                 )
                 rf.fit(x_train, y_train)
                 y_train_hat = rf.predict_proba(x_train)
-                auc_in_bayes = np.mean([roc_auc_score(y_1h_train[:, i], y_train_hat[:, i])
-                                        for i in range(y_1h.shape[1])])
+                auc_in_bayes = mean_roc_auc(y_1h_train, y_train_hat)
                 return auc_in_bayes
 
             optimizer = BayesianOptimization(f=bayes_rf_split, pbounds=hyper_parameters,
@@ -405,18 +390,17 @@ def train_model(req):
             algorithm_.hyper_parameters = json.dumps(hyper_parameters, ensure_ascii=False)
             algorithm_.feature_importance = json.dumps(feature_importance_, ensure_ascii=False)
             auc = {}
-            f, fig = io.StringIO(), plt.figure()
+            fig = plt.figure()
 
+            valid_auc = roc_auc(y_1h_valid, y_valid_hat)
+            tpr_poly_ = roc_curves(y_1h_valid, y_valid_hat, fpr_poly_)
             for name, i in class_dict.items():
-                auc[name] = roc_auc_score(y_1h_valid[:, i], y_valid_hat[:, i])
-                auc[name] = round(float(auc[name]), 3)
-                fpr, tpr, _ = roc_curve(y_1h_valid[:, i], y_valid_hat[:, i])
-                tpr_poly_ = np.interp(fpr_poly_, fpr, tpr)
-                plt.plot(fpr_poly_, tpr_poly_, label=f'{name} (AUC = {auc[name].__round__(3)})')
+                auc[name] = round(float(valid_auc[i]), 3)
+                plt.plot(fpr_poly_, tpr_poly_[i], label=f'{name} (AUC = {auc[name].__round__(3)})')
 
-            intermediate_paper_handle = ContentFile(pickle.dumps(mdl))
+            intermediate_paper_handle = dump_paper(mdl, 3)
             new_paper = Paper(user=req.user, role=3, name=f'Random Forest Classifier #{algorithm_.id} Model')
-            new_paper.file.save(f'rf_classifier_{algorithm_.id}_model.pkl', intermediate_paper_handle)
+            new_paper.file.save(f'rf_classifier_{algorithm_.id}_model.joblib', intermediate_paper_handle)
             new_paper.save()
             algorithm_.model = new_paper
             algorithm_.training_history = json.dumps(history, ensure_ascii=False)
@@ -426,9 +410,7 @@ def train_model(req):
             plt.ylabel("True Positive Rate")
             plt.xlabel("False Positive Rate")
             plt.legend(loc=4)
-            fig.savefig(f, format='svg')
-            plt.close(fig)
-            algorithm_.roc_curve = f.getvalue()
+            algorithm_.roc_curve = save_figure(fig)
 
         else:  # mode == "full_train"
             def bayes_rf_full_train(max_depth, max_leaf_nodes, n_estimators):
@@ -439,8 +421,7 @@ def train_model(req):
                 )
                 rf.fit(x, y)
                 y_hat = rf.predict_proba(x)
-                auc_in_bayes = np.mean([roc_auc_score(y_1h[:, i], y_hat[:, i])
-                                        for i in range(y_1h.shape[1])])
+                auc_in_bayes = mean_roc_auc(y_1h, y_hat)
                 return auc_in_bayes
             optimizer = BayesianOptimization(f=bayes_rf_full_train, pbounds=hyper_parameters,
                                              random_state=train.cleaned_data['random_seed'])
@@ -458,9 +439,9 @@ def train_model(req):
             hyper_parameters = {'max_depth': mdl.max_depth, 'max_leaf_nodes': mdl.max_leaf_nodes,
                                 'n_estimators': mdl.n_estimators}
             algorithm_.hyper_parameters = json.dumps(hyper_parameters, ensure_ascii=False)
-            intermediate_paper_handle = ContentFile(pickle.dumps(mdl))
+            intermediate_paper_handle = dump_paper(mdl, 3)
             new_paper = Paper(user=req.user, role=3, name=f'Random Forest Classifier #{algorithm_.id} Model')
-            new_paper.file.save(f'rf_classifier_{algorithm_.id}_model.pkl', intermediate_paper_handle)
+            new_paper.file.save(f'rf_classifier_{algorithm_.id}_model.joblib', intermediate_paper_handle)
             new_paper.save()
             algorithm_.model = new_paper
             algorithm_.training_history = json.dumps(history, ensure_ascii=False)
@@ -474,13 +455,13 @@ def train_model(req):
     except Exception as e:
         step.status = 4
         step.error_message = str(e)
-        step.save()
+        step.save(update_fields=['status', 'error_message'])
         context = {"color": "danger", "content": "Interrupted.",
                    "refresh": f"/algo_rf_classifier/{algorithm_.id}"}
         raise e
         # return render(req, "task_manager/hint_widget.html", context)
     step.status = 3
-    step.save()
+    step.save(update_fields=['status'])
     context = {"color": "success", "content": "The model has been trained and evaluated.",
                "refresh": f"/algo_rf_classifier/{algorithm_.id}"}
     return render(req, "task_manager/hint_widget.html", context)
@@ -533,10 +514,9 @@ def predict(req):
         context = {"color": "danger", "content": "This step doesn't have a trained model."}
         return render(req, "task_manager/hint_widget.html", context)
     step.status = 2
-    step.save()
+    step.save(update_fields=['status'])
     try:
-        with open(algorithm_.model.file.path, "rb") as f:
-            model = pickle.load(f)
+        model = load_paper(algorithm_.model)
         x_col = [x.name for x in Column.objects.filter(algorithm=algorithm_, x_column=True)]
         y_col = Column.objects.filter(algorithm=algorithm_, y_column=True).first().name
         x = table[x_col].values
@@ -551,7 +531,7 @@ def predict(req):
             table.to_excel(f, index=False)
     except Exception as e:
         step.status = 4
-        step.save()
+        step.save(update_fields=['status'])
         context = {"color": "warning", "content": f"Interrupted. {e}"}
         return render(req, "task_manager/hint_widget.html", context)
     new_paper = Paper(user=req.user, role=4, name=f"Random Forest Classifier #{algorithm_.id} Predict")
@@ -559,7 +539,7 @@ def predict(req):
     new_paper.save()
     step.predicted_data = new_paper
     step.status = 3
-    step.save()
+    step.save(update_fields=['predicted_data', 'status'])
     context = {"color": "success", "content": "Prediction completed.",
                "refresh": f"/algo_rf_classifier/{algorithm_.id}"}
     return render(req, "task_manager/hint_widget.html", context=context)
@@ -1,5 +1,5 @@
 from django.db import models
-from task_manager.models import Step
+from task_manager.models import AlgorithmManager, Step
 from library.models import Paper
 
 
@@ -16,6 +16,8 @@ class BayesRfRegressor(models.Model):
     hyper_parameters = models.TextField(blank=True)
     feature_importance = models.TextField(blank=True)
 
+    objects = AlgorithmManager('training_history', 'error_measure', 'hyper_parameters', 'feature_importance')
+
 
 class Column(models.Model):
     algorithm = models.ForeignKey(BayesRfRegressor, models.CASCADE)
@@ -1,12 +1,10 @@
 import io
 import json
-import pickle
 
 import numpy as np
 import pandas as pd
 from django import forms
 from django.contrib.auth.decorators import permission_required
-from django.core.files.base import ContentFile
 from django.shortcuts import render, redirect
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST
@@ -14,8 +12,10 @@ from sklearn.ensemble import RandomForestRegressor
 from sklearn.metrics import mean_absolute_error, mean_squared_error
 from sklearn.model_selection import KFold, train_test_split
 
+from library.serialization import dump_paper, load_paper
 import task_manager.views
 from bayes_opt import BayesianOptimization
+from task_manager.columns import flag_columns, replace_columns, unflag_columns
 from task_manager.models import OpenedTask
 from .models import *
 
@@ -119,7 +119,7 @@ def add_rf_regressor(req):
 def view_rf_regressor(req, algo_id):
     # ---------- Algorithm Ownership Navigator START ----------
     try:
-        algorithm_ = BayesRfRegressor.objects.get(id=algo_id)
+        algorithm_ = BayesRfRegressor.objects.with_heavy_fields().get(id=algo_id)
     except BayesRfRegressor.DoesNotExist:
         return redirect("/task/retrieve?message=This instance doesn't exist.&color=danger")
     if not algorithm_.step.open_permission(req.user):
@@ -164,28 +164,24 @@ def import_data(req):
     algorithm_ = BayesRfRegressor.objects.get(step=step)
     try:
         # ---------- Asynchronous Algorithm START   ----------
-        intermediate_paper_handle = ContentFile(pickle.dumps(table))
+        intermediate_paper_handle = dump_paper(table, 2)
         new_paper = Paper(user=req.user, role=2,
                           name=f"Random Forest Regression #{algorithm_.id} Parsed Data")
-        new_paper.file.save(f"rf_regressor_{algorithm_.id}_parsed_data.pkl", intermediate_paper_handle)
+        new_paper.file.save(f"rf_regressor_{algorithm_.id}_parsed_data.joblib", intermediate_paper_handle)
         new_paper.save()
         algorithm_.dataframe = new_paper
         algorithm_.save()
-        for column in Column.objects.filter(algorithm=algorithm_):
-            column.delete()
-        for col in table.columns:
-            new_column = Column(algorithm=algorithm_, name=col)
-            new_column.save()
+        replace_columns(Column, algorithm_, table.columns)
         # ---------- Asynchronous Algorithm END   ----------
     except Exception as e:
         step.status = 4
         step.error_message = str(e)
-        step.save()
+        step.save(update_fields=['status', 'error_message'])
         context = {"color": "danger", "content": "Interrupted.",
                    "refresh": f"/algo_rf_regressor/{algorithm_.id}"}
         return render(req, "task_manager/hint_widget.html", context)
     step.status = 3
-    step.save()
+    step.save(update_fields=['status'])
     context = {"color": "success", "content": "The file is successfully parsed.",
                "refresh": f"/algo_rf_regressor/{algorithm_.id}"}
     return render(req, "task_manager/hint_widget.html", context)
@@ -206,12 +202,8 @@ def set_variables(req):
         context = {"color": "danger", "content": "Submission is not valid."}
         return render(req, "task_manager/hint_widget.html", context)
     # ---------- Algorithm Ownership Validator v2 END   ----------
-    for column in variable_picker.cleaned_data['Independent_Variables_X']:
-        column.x_column = True
-        column.save()
-    column = variable_picker.cleaned_data['Dependent_Variable_Y']
-    column.y_column = True
-    column.save()
+    flag_columns(Column, algorithm_, x_column=variable_picker.cleaned_data['Independent_Variables_X'],
+                 y_column=[variable_picker.cleaned_data['Dependent_Variable_Y']])
     context = {"color": "success", "content": "Set variables successfully.",
                "refresh": f"/algo_rf_regressor/{algorithm_.id}"}
     return render(req, "task_manager/hint_widget.html", context)
@@ -230,9 +222,7 @@ def clear_variables(req, algo_id):
     # ---------- Algorithm Ownership Navigator END   ----------
     if algorithm_.step.status == 2:
         return redirect("/task/retrieve?message=Cannot start because this algorithm is busy.&color=warning")
-    for column in Column.objects.filter(algorithm=algorithm_):
-        column.x_column = column.y_column = False
-        column.save()
+    unflag_columns(Column, algorithm_, 'x_column', 'y_column')
     return redirect(f"/algo_rf_regressor/{algorithm_.id}")
 
 
@@ -263,11 +253,10 @@ def train_model(req):
         context = {"color": "warning", "content": "The interval of 'number of trees' is not valid."}
         return render(req, "task_manager/hint_widget.html", context)
     step.status = 2
-    step.save()
+    step.save(update_fields=['status'])
     try:
         # ---------- Asynchronous Algorithm START ----------
-        with open(algorithm_.dataframe.file.path, "rb") as f:
-            dataframe = pickle.load(f)
+        dataframe = load_paper(algorithm_.dataframe)
         x_col = [x.name for x in Column.objects.filter(algorithm=algorithm_, x_column=True)]
         y_col = [Column.objects.filter(algorithm=algorithm_, y_column=True).first().name]
         mode = train.cleaned_data['running_mode']
@@ -327,9 +316,9 @@ def train_model(req):
                     {name: weight for name, weight in zip(x_col, mdl.feature_importances_)}
                 )
                 error_measure['value'].append(func_error(y_valid, y_valid_hat))
-            intermediate_paper_handle = ContentFile(pickle.dumps(models_))
+            intermediate_paper_handle = dump_paper(models_, 3)
             new_paper = Paper(user=req.user, role=3, name=f'Random Forest Regression #{algorithm_.id} Model')
-            new_paper.file.save(f'rf_regressor_{algorithm_.id}_model.pkl', intermediate_paper_handle)
+            new_paper.file.save(f'rf_regressor_{algorithm_.id}_model.joblib', intermediate_paper_handle)
             new_paper.save()
             algorithm_.model = new_paper
             algorithm_.training_history = json.dumps(histories, ensure_ascii=False)
@@ -373,9 +362,9 @@ def train_model(req):
                 {'type': train.cleaned_data['criterion'], 'value': func_error(y_valid, y_valid_hat)},
                 ensure_ascii=False
             )
-            intermediate_paper_handle = ContentFile(pickle.dumps(mdl))
+            intermediate_paper_handle = dump_paper(mdl, 3)
             new_paper = Paper(user=req.user, role=3, name=f'Random Forest Regression #{algorithm_.id} Model')
-            new_paper.file.save(f'rf_regressor_{algorithm_.id}_model.pkl', intermediate_paper_handle)
+            new_paper.file.save(f'rf_regressor_{algorithm_.id}_model.joblib', intermediate_paper_handle)
             new_paper.save()
             algorithm_.model = new_paper
             algorithm_.training_history = json.dumps(history, ensure_ascii=False)
@@ -406,9 +395,9 @@ def train_model(req):
             hyper_parameters = {'max_depth': mdl.max_depth, 'max_leaf_nodes': mdl.max_leaf_nodes,
                                 'n_estimators': mdl.n_estimators}
             algorithm_.hyper_parameters = json.dumps(hyper_parameters, ensure_ascii=False)
-            intermediate_paper_handle = ContentFile(pickle.dumps(mdl))
+            intermediate_paper_handle = dump_paper(mdl, 3)
             new_paper = Paper(user=req.user, role=3, name=f'Random Forest Regression #{algorithm_.id} Model')
-            new_paper.file.save(f'rf_regressor_{algorithm_.id}_model.pkl', intermediate_paper_handle)
+            new_paper.file.save(f'rf_regressor_{algorithm_.id}_model.joblib', intermediate_paper_handle)
             new_paper.save()
             algorithm_.model = new_paper
             algorithm_.training_history = json.dumps(history, ensure_ascii=False)
@@ -420,12 +409,12 @@ def train_model(req):
     except Exception as e:
         step.status = 4
         step.error_message = str(e)
-        step.save()
+        step.save(update_fields=['status', 'error_message'])
         context = {"color": "danger", "content": "Interrupted.",
                    "refresh": f"/algo_rf_regressor/{algorithm_.id}"}
         return render(req, "task_manager/hint_widget.html", context)
     step.status = 3
-    step.save()
+    step.save(update_fields=['status'])
     context = {"color": "success", "content": "The model has been trained and evaluated.",
                "refresh": f"/algo_rf_regressor/{algorithm_.id}"}
     return render(req, "task_manager/hint_widget.html", context)
@@ -471,10 +460,9 @@ def predict(req):
         context = {"color": "danger", "content": "This step doesn't have a trained model."}
         return render(req, "task_manager/hint_widget.html", context)
     step.status = 2
-    step.save()
+    step.save(update_fields=['status'])
     try:
-        with open(algorithm_.model.file.path, "rb") as f:
-            model = pickle.load(f)
+        model = load_paper(algorithm_.model)
         x_col = [x.name for x in Column.objects.filter(algorithm=algorithm_, x_column=True)]
         y_col = Column.objects.filter(algorithm=algorithm_, y_column=True).first().name
         x = table[x_col].values
@@ -488,7 +476,7 @@ def predict(req):
             table.to_excel(f, index=False)
     except Exception as e:
         step.status = 4
-        step.save()
+        step.save(update_fields=['status'])
         context = {"color": "warning", "content": f"Interrupted. {e}"}
         return render(req, "task_manager/hint_widget.html", context)
     new_paper = Paper(user=req.user, role=4, name=f"Random Forest Regression #{algorithm_.id} Predict")
@@ -496,7 +484,7 @@ def predict(req):
     new_paper.save()
     step.predicted_data = new_paper
     step.status = 3
-    step.save()
+    step.save(update_fields=['predicted_data', 'status'])
     context = {"color": "success", "content": "Prediction completed.",
                "refresh": f"/algo_rf_regressor/{algorithm_.id}"}
     return render(req, "task_manager/hint_widget.html", context=context)
@@ -0,0 +1,21 @@
+# Generated by Django 4.0.4 on 2026-10-19 17:40
+
+from django.db import migrations, models
+
+from task_manager.figures import store_inline_figures
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('algo_svm_classifier', '0002_remove_bayessvmclassifier_feature_importance'),
+    ]
+
+    operations = [
+        store_inline_figures('algo_svm_classifier', 'BayesSvmClassifier', 'roc_curve'),
+        migrations.AlterField(
+            model_name='bayessvmclassifier',
+            name='roc_curve',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+    ]
@@ -1,22 +1,25 @@
 import io
 import json
-import pickle
 
 import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
 from django import forms
 from django.contrib.auth.decorators import permission_required
-from django.core.files.base import ContentFile
 from django.shortcuts import render, redirect
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST
-from sklearn.svm import SVC
-from sklearn.metrics import roc_auc_score, roc_curve
+from sklearn.pipeline import Pipeline
+from sklearn.svm import SVC, LinearSVC
 from sklearn.model_selection import train_test_split
 
+from library.serialization import dump_paper, load_paper
 import task_manager.views
 from bayes_opt import BayesianOptimization
+from task_manager.columns import flag_columns, replace_columns, unflag_columns
+from task_manager.evaluation import mean_roc_auc, roc_auc, roc_curves
+from task_manager.figures import save_figure
+from task_manager.kernels import kernel_modes, search_cache
 from task_manager.models import OpenedTask
 from .models import *
 
@@ -93,6 +96,20 @@ class Train(PublicAlgorithm):
                   '(Integer no smaller than 2)',
         required=False, min_value=2,
     )
+    kernel_mode = forms.ChoiceField(
+        widget=forms.Select({'class': 'form-select'}), choices=kernel_modes, initial='exact',
+        help_text='Approximate modes map samples to features approximating the kernel function and train a linear '
+                  'SVM, whose time cost is linear in the number of samples.'
+    )
+    n_components = forms.IntegerField(
+        min_value=16, initial=256, widget=forms.NumberInput({'class': 'form-control'}),
+        help_text='Number of features to approximate the kernel function. Required only in approximate modes.'
+    )
+    kernel_cache_mb = forms.IntegerField(
+        min_value=16, initial=1024, widget=forms.NumberInput({'class': 'form-control'}),
+        help_text='Memory (MB) to cache kernel matrices. The kernel matrix is computed once and shared by all trials '
+                  'of C if it fits in this budget; otherwise, it is the cache size of each trial.'
+    )
 
 
 @permission_required(
@@ -121,7 +138,7 @@ def add_svm_classifier(req):
 def view_svm_classifier(req, algo_id):
     # ---------- Algorithm Ownership Navigator START ----------
     try:
-        algorithm_ = BayesSvmClassifier.objects.get(id=algo_id)
+        algorithm_ = BayesSvmClassifier.objects.with_heavy_fields().get(id=algo_id)
     except BayesSvmClassifier.DoesNotExist:
         return redirect("/task/retrieve?message=This instance doesn't exist.&color=danger")
     if not algorithm_.step.open_permission(req.user):
@@ -165,28 +182,24 @@ def import_data(req):
     algorithm_ = BayesSvmClassifier.objects.get(step=step)
     try:
         # ---------- Asynchronous Algorithm START   ----------
-        intermediate_paper_handle = ContentFile(pickle.dumps(table))
+        intermediate_paper_handle = dump_paper(table, 2)
         new_paper = Paper(user=req.user, role=2,
                           name=f"SVM Classifier #{algorithm_.id} Parsed Data")
-        new_paper.file.save(f"svm_classifier_{algorithm_.id}_parsed_data.pkl", intermediate_paper_handle)
+        new_paper.file.save(f"svm_classifier_{algorithm_.id}_parsed_data.joblib", intermediate_paper_handle)
         new_paper.save()
         algorithm_.dataframe = new_paper
         algorithm_.save()
-        for column in Column.objects.filter(algorithm=algorithm_):
-            column.delete()
-        for col in table.columns:
-            new_column = Column(algorithm=algorithm_, name=col)
-            new_column.save()
+        replace_columns(Column, algorithm_, table.columns)
         # ---------- Asynchronous Algorithm END   ----------
     except Exception as e:
         step.status = 4
         step.error_message = str(e)
-        step.save()
+        step.save(update_fields=['status', 'error_message'])
         context = {"color": "danger", "content": "Interrupted.",
                    "refresh": f"/algo_svm_classifier/{algorithm_.id}"}
         return render(req, "task_manager/hint_widget.html", context)
     step.status = 3
-    step.save()
+    step.save(update_fields=['status'])
     context = {"color": "success", "content": "The file is successfully parsed.",
                "refresh": f"/algo_svm_classifier/{algorithm_.id}"}
     return render(req, "task_manager/hint_widget.html", context)
@@ -207,12 +220,8 @@ def set_variables(req):
         context = {"color": "danger", "content": "Submission is not valid."}
         return render(req, "task_manager/hint_widget.html", context)
     # ---------- Algorithm Ownership Validator v2 END   ----------
-    for column in variable_picker.cleaned_data['Independent_Variables_X']:
-        column.x_column = True
-        column.save()
-    column = variable_picker.cleaned_data['Dependent_Variable_Y']
-    column.y_column = True
-    column.save()
+    flag_columns(Column, algorithm_, x_column=variable_picker.cleaned_data['Independent_Variables_X'],
+                 y_column=[variable_picker.cleaned_data['Dependent_Variable_Y']])
     context = {"color": "success", "content": "Set variables successfully.",
                "refresh": f"/algo_svm_classifier/{algorithm_.id}"}
     return render(req, "task_manager/hint_widget.html", context)
@@ -231,9 +240,7 @@ def clear_variables(req, algo_id):
     # ---------- Algorithm Ownership Navigator END   ----------
     if algorithm_.step.status == 2:
         return redirect("/task/retrieve?message=Cannot start because this algorithm is busy.&color=warning")
-    for column in Column.objects.filter(algorithm=algorithm_):
-        column.x_column = column.y_column = False
-        column.save()
+    unflag_columns(Column, algorithm_, 'x_column', 'y_column')
     return redirect(f"/algo_svm_classifier/{algorithm_.id}")
 
 
@@ -244,6 +251,54 @@ def one_hot(labels):
     return class_dict_, labels_1h
 
 
+def class_scores(mdl, x):
+    """
+    Scores of each class, in the same order as "class_dict". They are probabilities if the model is calibrated,
+    otherwise decision values, which are enough to rank samples for ROC.
+    """
+    if hasattr(mdl, 'predict_proba'):
+        return mdl.predict_proba(x)
+    d = mdl.decision_function(x)
+    return np.column_stack([-d, d]) if d.ndim == 1 else d
+
+
+def svc_trial(config, cache, c, degree, y):
+    """
+    Fit a model of one trial in Bayesian search, on the cached kernel matrix in exact mode, or on the cached features in
+    approximate modes.
+
+    :return: scores of each class of the training set.
+    """
+    if config['kernel_mode'] == 'exact':
+        kernel_params, k = cache.design(degree)
+        svc = SVC(C=c, max_iter=5000, random_state=config['random_seed'], **kernel_params)
+        svc.fit(k, y)
+        return class_scores(svc, k)
+    _, z = cache.design(degree)
+    svc = LinearSVC(C=c, dual=False, max_iter=5000, random_state=config['random_seed'])
+    svc.fit(z, y)
+    return class_scores(svc, z)
+
+
+def fit_svc(config, cache, c, degree, x, y, probability=False):
+    """
+    Fit the model of the best hyper-parameters. It takes the original samples as input, so that predicting doesn't
+    require the training set.
+
+    :return: the model, and its hyper-parameters.
+    """
+    if config['kernel_mode'] == 'exact':
+        mdl = SVC(C=c, kernel=config['kernel'], degree=degree, probability=probability, max_iter=5000,
+                  random_state=config['random_seed'])
+        mdl.fit(x, y)
+        return mdl, {'c': mdl.C, 'degree': mdl.degree, 'kernel': mdl.kernel}
+    feature_map, z = cache.design(degree)
+    svc = LinearSVC(C=c, dual=False, max_iter=5000, random_state=config['random_seed'])
+    svc.fit(z, y)
+    mdl = Pipeline([('features', feature_map), ('svm', svc)])
+    return mdl, {'c': c, 'degree': degree, 'kernel': config['kernel'], 'approximation': cache.describe()}
+
+
 @permission_required("algo_svm_classifier.change_bayessvmclassifier")
 @csrf_exempt
 @require_POST
@@ -272,13 +327,15 @@ def train_model(req):
     if train.cleaned_data['min_ln_c'] >= train.cleaned_data['max_ln_c']:
         context = {"color": "warning", "content": "The interval of ln(C) is not valid."}
         return render(req, "task_manager/hint_widget.html", context)
+    if train.cleaned_data['kernel_mode'] == 'rff' and train.cleaned_data['kernel'] != 'rbf':
+        context = {"color": "warning", "content": "Random Fourier features only approximate the RBF kernel."}
+        return render(req, "task_manager/hint_widget.html", context)
     
     step.status = 2
-    step.save()
+    step.save(update_fields=['status'])
     try:
         # ---------- Asynchronous Algorithm START ----------
-        with open(algorithm_.dataframe.file.path, "rb") as f:
-            dataframe = pickle.load(f)
+        dataframe = load_paper(algorithm_.dataframe)
         x_col = [x.name for x in Column.objects.filter(algorithm=algorithm_, x_column=True)]
         y_col = Column.objects.filter(algorithm=algorithm_, y_column=True).first().name
         mode = train.cleaned_data['running_mode']
@@ -290,69 +347,44 @@ def train_model(req):
             hyper_parameters['degree'] = (train.cleaned_data['min_degree'], train.cleaned_data['max_degree'])
         fpr_poly_ = np.linspace(0, 1, 200)
 
-        # 5-fold cross validation is built in when "probability=True". And, "probability=True" is necessary
-        # if having a need to draw ROC curve.
+        # 5-fold cross validation is built in when "probability=True", which multiplies the cost of fitting. Trials
+        # of Bayesian search rank samples by decision values, which is enough for AUC, and only the final model in
+        # split mode is calibrated to draw ROC curve with probabilities.
         # https://scikit-learn.org/stable/modules/svm.html#scores-and-probabilities
         if mode == "split":
             x_train, x_valid, y_train, y_valid, y_1h_train, y_1h_valid = train_test_split(
                 x, y, y_1h, train_size=0.8, shuffle=True, random_state=train.cleaned_data['random_seed'])
 
-            if train.cleaned_data['kernel'] == 'poly':
-                def bayes_svc_split(c, degree):
-                    svc = SVC(
-                        C=np.exp(c), kernel=train.cleaned_data['kernel'], degree=round(degree),
-                        probability=True, max_iter=5000, random_state=train.cleaned_data['random_seed']
-                    )
-                    svc.fit(x_train, y_train)
-                    y_train_hat = svc.predict_proba(x_train)
-                    auc_in_bayes = np.mean([roc_auc_score(y_1h_train[:, i], y_train_hat[:, i])
-                                            for i in range(y_1h.shape[1])])
-                    return auc_in_bayes
-            else:
-                def bayes_svc_split(c):
-                    svc = SVC(C=np.exp(c), kernel=train.cleaned_data['kernel'], probability=True, max_iter=5000,
-                              random_state=train.cleaned_data['random_seed'])
-                    svc.fit(x_train, y_train)
-                    y_train_hat = svc.predict_proba(x_train)
-                    auc_in_bayes = np.mean([roc_auc_score(y_1h_train[:, i], y_train_hat[:, i])
-                                            for i in range(y_1h.shape[1])])
-                    return auc_in_bayes
+            cache = search_cache(train.cleaned_data, x_train)
+
+            def bayes_svc_split(c, degree=3):
+                y_train_hat = svc_trial(train.cleaned_data, cache, np.exp(c), round(degree), y_train)
+                auc_in_bayes = mean_roc_auc(y_1h_train, y_train_hat)
+                return auc_in_bayes
 
             optimizer = BayesianOptimization(f=bayes_svc_split, pbounds=hyper_parameters,
                                              random_state=train.cleaned_data['random_seed'])
             optimizer.maximize(init_points=train.cleaned_data['bayes_init_try_times'],
                                n_iter=train.cleaned_data['bayes_iteration_times'])
             history = {i: res for i, res in enumerate(optimizer.res)}
-            if train.cleaned_data['kernel'] == 'poly':
-                mdl = SVC(
-                    C=np.exp(optimizer.max['params']['c']), max_iter=5000,
-                    kernel=train.cleaned_data['kernel'],
-                    degree=round(optimizer.max['params']['degree']), probability=True,
-                    random_state=train.cleaned_data['random_seed']
-                )
-            else:
-                mdl = SVC(
-                    C=np.exp(optimizer.max['params']['c']), max_iter=5000,
-                    kernel=train.cleaned_data['kernel'], probability=True,
-                    random_state=train.cleaned_data['random_seed']
-                )
-            mdl.fit(x_train, y_train)
-            y_valid_hat = mdl.predict_proba(x_valid)
-            hyper_parameters = {'c': mdl.C, 'degree': mdl.degree, 'kernel': mdl.kernel}
+            mdl, hyper_parameters = fit_svc(
+                train.cleaned_data, cache, np.exp(optimizer.max['params']['c']),
+                round(optimizer.max['params'].get('degree', 3)), x_train, y_train, probability=True
+            )
+            y_valid_hat = class_scores(mdl, x_valid)
             algorithm_.hyper_parameters = json.dumps(hyper_parameters, ensure_ascii=False)
             auc = {}
-            f, fig = io.StringIO(), plt.figure()
+            fig = plt.figure()
 
+            valid_auc = roc_auc(y_1h_valid, y_valid_hat)
+            tpr_poly_ = roc_curves(y_1h_valid, y_valid_hat, fpr_poly_)
             for name, i in class_dict.items():
-                auc[name] = roc_auc_score(y_1h_valid[:, i], y_valid_hat[:, i])
-                auc[name] = round(float(auc[name]), 3)
-                fpr, tpr, _ = roc_curve(y_1h_valid[:, i], y_valid_hat[:, i])
-                tpr_poly_ = np.interp(fpr_poly_, fpr, tpr)
-                plt.plot(fpr_poly_, tpr_poly_, label=f'{name} (AUC = {auc[name].__round__(3)})')
+                auc[name] = round(float(valid_auc[i]), 3)
+                plt.plot(fpr_poly_, tpr_poly_[i], label=f'{name} (AUC = {auc[name].__round__(3)})')
 
-            intermediate_paper_handle = ContentFile(pickle.dumps(mdl))
+            intermediate_paper_handle = dump_paper(mdl, 3)
             new_paper = Paper(user=req.user, role=3, name=f'SVM Classifier #{algorithm_.id} Model')
-            new_paper.file.save(f'svm_classifier_{algorithm_.id}_model.pkl', intermediate_paper_handle)
+            new_paper.file.save(f'svm_classifier_{algorithm_.id}_model.joblib', intermediate_paper_handle)
             new_paper.save()
             algorithm_.model = new_paper
             algorithm_.training_history = json.dumps(history, ensure_ascii=False)
@@ -362,53 +394,29 @@ def train_model(req):
             plt.ylabel("True Positive Rate")
             plt.xlabel("False Positive Rate")
             plt.legend(loc=4)
-            fig.savefig(f, format='svg')
-            plt.close(fig)
-            algorithm_.roc_curve = f.getvalue()
+            algorithm_.roc_curve = save_figure(fig)
 
         else:  # mode == "full_train"
-            if train.cleaned_data['kernel'] == 'poly':
-                def bayes_svc_full_train(c, degree):
-                    svc = SVC(
-                        C=np.exp(c), kernel=train.cleaned_data['kernel'], degree=round(degree),
-                        probability=True, max_iter=5000, random_state=train.cleaned_data['random_seed']
-                    )
-                    svc.fit(x, y)
-                    y_hat = svc.predict_proba(x)
-                    auc_in_bayes = np.mean([roc_auc_score(y_1h[:, i], y_hat[:, i])
-                                            for i in range(y_1h.shape[1])])
-                    return auc_in_bayes
-            else:
-                def bayes_svc_full_train(c):
-                    svc = SVC(C=np.exp(c), kernel=train.cleaned_data['kernel'], probability=True, max_iter=5000,
-                              random_state=train.cleaned_data['random_seed'])
-                    svc.fit(x, y)
-                    y_hat = svc.predict_proba(x)
-                    auc_in_bayes = np.mean([roc_auc_score(y_1h[:, i], y_hat[:, i])
-                                            for i in range(y_1h.shape[1])])
-                    return auc_in_bayes
+            cache = search_cache(train.cleaned_data, x)
+
+            def bayes_svc_full_train(c, degree=3):
+                y_hat = svc_trial(train.cleaned_data, cache, np.exp(c), round(degree), y)
+                auc_in_bayes = mean_roc_auc(y_1h, y_hat)
+                return auc_in_bayes
+
             optimizer = BayesianOptimization(f=bayes_svc_full_train, pbounds=hyper_parameters,
                                              random_state=train.cleaned_data['random_seed'])
             optimizer.maximize(init_points=train.cleaned_data['bayes_init_try_times'],
                                n_iter=train.cleaned_data['bayes_iteration_times'])
             history = {i: res for i, res in enumerate(optimizer.res)}
-            if train.cleaned_data['kernel'] == 'poly':
-                mdl = SVC(
-                    C=np.exp(optimizer.max['params']['c']), max_iter=5000,
-                    kernel=train.cleaned_data['kernel'], random_state=train.cleaned_data['random_seed'],
-                    degree=round(optimizer.max['params']['degree']),
-                )
-            else:
-                mdl = SVC(
-                    C=np.exp(optimizer.max['params']['c']), max_iter=5000,
-                    kernel=train.cleaned_data['kernel'], random_state=train.cleaned_data['random_seed'],
-                )
-            mdl.fit(x, y)
-            hyper_parameters = {'c': mdl.C, 'degree': mdl.degree, 'kernel': mdl.kernel}
+            mdl, hyper_parameters = fit_svc(
+                train.cleaned_data, cache, np.exp(optimizer.max['params']['c']),
+                round(optimizer.max['params'].get('degree', 3)), x, y
+            )
             algorithm_.hyper_parameters = json.dumps(hyper_parameters, ensure_ascii=False)
-            intermediate_paper_handle = ContentFile(pickle.dumps(mdl))
+            intermediate_paper_handle = dump_paper(mdl, 3)
             new_paper = Paper(user=req.user, role=3, name=f'SVM Classifier #{algorithm_.id} Model')
-            new_paper.file.save(f'svm_classifier_{algorithm_.id}_model.pkl', intermediate_paper_handle)
+            new_paper.file.save(f'svm_classifier_{algorithm_.id}_model.joblib', intermediate_paper_handle)
             new_paper.save()
             algorithm_.model = new_paper
             algorithm_.training_history = json.dumps(history, ensure_ascii=False)
@@ -420,12 +428,12 @@ def train_model(req):
     except Exception as e:
         step.status = 4
         step.error_message = str(e)
-        step.save()
+        step.save(update_fields=['status', 'error_message'])
         context = {"color": "danger", "content": "Interrupted.",
                    "refresh": f"/algo_svm_classifier/{algorithm_.id}"}
         return render(req, "task_manager/hint_widget.html", context)
     step.status = 3
-    step.save()
+    step.save(update_fields=['status'])
     context = {"color": "success", "content": "The model has been trained and evaluated.",
                "refresh": f"/algo_svm_classifier/{algorithm_.id}"}
     return render(req, "task_manager/hint_widget.html", context)
@@ -478,10 +486,9 @@ def predict(req):
         context = {"color": "danger", "content": "This step doesn't have a trained model."}
         return render(req, "task_manager/hint_widget.html", context)
     step.status = 2
-    step.save()
+    step.save(update_fields=['status'])
     try:
-        with open(algorithm_.model.file.path, "rb") as f:
-            model = pickle.load(f)
+        model = load_paper(algorithm_.model)
         x_col = [x.name for x in Column.objects.filter(algorithm=algorithm_, x_column=True)]
         y_col = Column.objects.filter(algorithm=algorithm_, y_column=True).first().name
         x = table[x_col].values
@@ -496,7 +503,7 @@ def predict(req):
             table.to_excel(f, index=False)
     except Exception as e:
         step.status = 4
-        step.save()
+        step.save(update_fields=['status'])
         context = {"color": "warning", "content": f"Interrupted. {e}"}
         return render(req, "task_manager/hint_widget.html", context)
     new_paper = Paper(user=req.user, role=4, name=f"Random Forest Classifier #{algorithm_.id} Predict")
@@ -504,7 +511,7 @@ def predict(req):
     new_paper.save()
     step.predicted_data = new_paper
     step.status = 3
-    step.save()
+    step.save(update_fields=['predicted_data', 'status'])
     context = {"color": "success", "content": "Prediction completed.",
                "refresh": f"/algo_svm_classifier/{algorithm_.id}"}
     return render(req, "task_manager/hint_widget.html", context=context)
@@ -1,5 +1,5 @@
 from django.db import models
-from task_manager.models import Step
+from task_manager.models import AlgorithmManager, Step
 from library.models import Paper
 
 
@@ -15,6 +15,8 @@ class BayesSvmRegressor(models.Model):
                             blank=True, max_length=10)
     hyper_parameters = models.TextField(blank=True)
 
+    objects = AlgorithmManager('training_history', 'error_measure', 'hyper_parameters')
+
 
 class Column(models.Model):
     algorithm = models.ForeignKey(BayesSvmRegressor, models.CASCADE)
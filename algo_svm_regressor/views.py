@@ -1,21 +1,23 @@
 import io
 import json
-import pickle
 
 import numpy as np
 import pandas as pd
 from django import forms
 from django.contrib.auth.decorators import permission_required
-from django.core.files.base import ContentFile
 from django.shortcuts import render, redirect
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST
-from sklearn.svm import SVR
+from sklearn.pipeline import Pipeline
+from sklearn.svm import SVR, LinearSVR
 from sklearn.metrics import mean_absolute_error, mean_squared_error
 from sklearn.model_selection import KFold, train_test_split
 
+from library.serialization import dump_paper, load_paper
 import task_manager.views
 from bayes_opt import BayesianOptimization
+from task_manager.columns import flag_columns, replace_columns, unflag_columns
+from task_manager.kernels import kernel_modes, search_cache
 from task_manager.models import OpenedTask
 from .models import *
 
@@ -88,6 +90,20 @@ class Train(PublicAlgorithm):
                   '(Integer no smaller than 2)',
         required=False, min_value=2,
     )
+    kernel_mode = forms.ChoiceField(
+        widget=forms.Select({'class': 'form-select'}), choices=kernel_modes, initial='exact',
+        help_text='Approximate modes map samples to features approximating the kernel function and train a linear '
+                  'SVM, whose time cost is linear in the number of samples.'
+    )
+    n_components = forms.IntegerField(
+        min_value=16, initial=256, widget=forms.NumberInput({'class': 'form-control'}),
+        help_text='Number of features to approximate the kernel function. Required only in approximate modes.'
+    )
+    kernel_cache_mb = forms.IntegerField(
+        min_value=16, initial=1024, widget=forms.NumberInput({'class': 'form-control'}),
+        help_text='Memory (MB) to cache kernel matrices. The kernel matrix is computed once and shared by all trials '
+                  'of C if it fits in this budget; otherwise, it is the cache size of each trial.'
+    )
     bayes_init_try_times = forms.IntegerField(
         min_value=16, widget=forms.NumberInput({'class': 'form-control'}),
         help_text='At least 16. How many steps of random exploration you want to perform. '
@@ -124,7 +140,7 @@ def add_svm_regressor(req):
 def view_svm_regressor(req, algo_id):
     # ---------- Algorithm Ownership Navigator START ----------
     try:
-        algorithm_ = BayesSvmRegressor.objects.get(id=algo_id)
+        algorithm_ = BayesSvmRegressor.objects.with_heavy_fields().get(id=algo_id)
     except BayesSvmRegressor.DoesNotExist:
         return redirect("/task/retrieve?message=This instance doesn't exist.&color=danger")
     if not algorithm_.step.open_permission(req.user):
@@ -168,28 +184,24 @@ def import_data(req):
     algorithm_ = BayesSvmRegressor.objects.get(step=step)
     try:
         # ---------- Asynchronous Algorithm START   ----------
-        intermediate_paper_handle = ContentFile(pickle.dumps(table))
+        intermediate_paper_handle = dump_paper(table, 2)
         new_paper = Paper(user=req.user, role=2,
                           name=f"SVM Regression #{algorithm_.id} Parsed Data")
-        new_paper.file.save(f"svm_regressor_{algorithm_.id}_parsed_data.pkl", intermediate_paper_handle)
+        new_paper.file.save(f"svm_regressor_{algorithm_.id}_parsed_data.joblib", intermediate_paper_handle)
         new_paper.save()
         algorithm_.dataframe = new_paper
         algorithm_.save()
-        for column in Column.objects.filter(algorithm=algorithm_):
-            column.delete()
-        for col in table.columns:
-            new_column = Column(algorithm=algorithm_, name=col)
-            new_column.save()
+        replace_columns(Column, algorithm_, table.columns)
         # ---------- Asynchronous Algorithm END   ----------
     except Exception as e:
         step.status = 4
         step.error_message = str(e)
-        step.save()
+        step.save(update_fields=['status', 'error_message'])
         context = {"color": "danger", "content": "Interrupted.",
                    "refresh": f"/algo_svm_regressor/{algorithm_.id}"}
         return render(req, "task_manager/hint_widget.html", context)
     step.status = 3
-    step.save()
+    step.save(update_fields=['status'])
     context = {"color": "success", "content": "The file is successfully parsed.",
                "refresh": f"/algo_svm_regressor/{algorithm_.id}"}
     return render(req, "task_manager/hint_widget.html", context)
@@ -210,12 +222,8 @@ def set_variables(req):
         context = {"color": "danger", "content": "Submission is not valid."}
         return render(req, "task_manager/hint_widget.html", context)
     # ---------- Algorithm Ownership Validator v2 END   ----------
-    for column in variable_picker.cleaned_data['Independent_Variables_X']:
-        column.x_column = True
-        column.save()
-    column = variable_picker.cleaned_data['Dependent_Variable_Y']
-    column.y_column = True
-    column.save()
+    flag_columns(Column, algorithm_, x_column=variable_picker.cleaned_data['Independent_Variables_X'],
+                 y_column=[variable_picker.cleaned_data['Dependent_Variable_Y']])
     context = {"color": "success", "content": "Set variables successfully.",
                "refresh": f"/algo_svm_regressor/{algorithm_.id}"}
     return render(req, "task_manager/hint_widget.html", context)
@@ -234,12 +242,48 @@ def clear_variables(req, algo_id):
     # ---------- Algorithm Ownership Navigator END   ----------
     if algorithm_.step.status == 2:
         return redirect("/task/retrieve?message=Cannot start because this algorithm is busy.&color=warning")
-    for column in Column.objects.filter(algorithm=algorithm_):
-        column.x_column = column.y_column = False
-        column.save()
+    unflag_columns(Column, algorithm_, 'x_column', 'y_column')
     return redirect(f"/algo_svm_regressor/{algorithm_.id}")
 
 
+def svr_trial(config, cache, c, degree, y):
+    """
+    Fit a model of one trial in Bayesian search, on the cached kernel matrix in exact mode, or on the cached features in
+    approximate modes.
+
+    :return: prediction of the training set.
+    """
+    if config['kernel_mode'] == 'exact':
+        kernel_params, k = cache.design(degree)
+        svr = SVR(C=c, max_iter=5000, **kernel_params)
+        svr.fit(k, y)
+        return svr.predict(k)
+    _, z = cache.design(degree)
+    svr = LinearSVR(C=c, loss='squared_epsilon_insensitive', dual=False, max_iter=5000,
+                    random_state=config['random_seed'])
+    svr.fit(z, y)
+    return svr.predict(z)
+
+
+def fit_svr(config, cache, c, degree, x, y):
+    """
+    Fit the model of the best hyper-parameters. It takes the original samples as input, so that predicting doesn't
+    require the training set.
+
+    :return: the model, and its hyper-parameters.
+    """
+    if config['kernel_mode'] == 'exact':
+        mdl = SVR(C=c, kernel=config['kernel'], degree=degree, max_iter=5000)
+        mdl.fit(x, y)
+        return mdl, {'c': mdl.C, 'degree': mdl.degree, 'kernel': mdl.kernel}
+    feature_map, z = cache.design(degree)
+    svr = LinearSVR(C=c, loss='squared_epsilon_insensitive', dual=False, max_iter=5000,
+                    random_state=config['random_seed'])
+    svr.fit(z, y)
+    mdl = Pipeline([('features', feature_map), ('svm', svr)])
+    return mdl, {'c': c, 'degree': degree, 'kernel': config['kernel'], 'approximation': cache.describe()}
+
+
 @permission_required("algo_svm_regressor.change_BayesSvmRegressor")
 @csrf_exempt
 @require_POST
@@ -267,12 +311,14 @@ def train_model(req):
     if train.cleaned_data['min_ln_c'] >= train.cleaned_data['max_ln_c']:
         context = {"color": "warning", "content": "The interval of ln(C) is not valid."}
         return render(req, "task_manager/hint_widget.html", context)
+    if train.cleaned_data['kernel_mode'] == 'rff' and train.cleaned_data['kernel'] != 'rbf':
+        context = {"color": "warning", "content": "Random Fourier features only approximate the RBF kernel."}
+        return render(req, "task_manager/hint_widget.html", context)
     step.status = 2
-    step.save()
+    step.save(update_fields=['status'])
     try:
         # ---------- Asynchronous Algorithm START ----------
-        with open(algorithm_.dataframe.file.path, "rb") as f:
-            dataframe = pickle.load(f)
+        dataframe = load_paper(algorithm_.dataframe)
         x_col = [x.name for x in Column.objects.filter(algorithm=algorithm_, x_column=True)]
         y_col = [Column.objects.filter(algorithm=algorithm_, y_column=True).first().name]
         mode = train.cleaned_data['running_mode']
@@ -295,22 +341,11 @@ def train_model(req):
             for (train_index, valid_index), k in zip(k_fold.split(x), range(5)):
                 x_train, x_valid, y_train, y_valid = x[train_index], x[valid_index], y[train_index], y[valid_index]
 
-                if train.cleaned_data['kernel'] == 'poly':
-                    def bayes_svr_5_fold(c, degree):
-                        svr = SVR(
-                            C=np.exp(c), kernel=train.cleaned_data['kernel'], degree=round(degree),
-                            max_iter=5000, random_state=train.cleaned_data['random_seed']
-                        )
-                        svr.fit(x_train, y_train.ravel())
-                        y_train_hat = svr.predict(x_train)
-                        return func_error(y_train_hat, y_train)
-                else:
-                    def bayes_svr_5_fold(c):
-                        svr = SVR(C=np.exp(c), kernel=train.cleaned_data['kernel'], max_iter=5000,
-                                  random_state=train.cleaned_data['random_seed'])
-                        svr.fit(x_train, y_train.ravel())
-                        y_train_hat = svr.predict(x_train)
-                        return func_error(y_train_hat, y_train)
+                cache = search_cache(train.cleaned_data, x_train)
+
+                def bayes_svr_5_fold(c, degree=3):
+                    y_train_hat = svr_trial(train.cleaned_data, cache, np.exp(c), round(degree), y_train.ravel())
+                    return func_error(y_train_hat, y_train)
 
                 optimizer = BayesianOptimization(f=bayes_svr_5_fold, pbounds=hyper_parameters,
                                                  random_state=train.cleaned_data['random_seed'])
@@ -318,25 +353,17 @@ def train_model(req):
                                    n_iter=train.cleaned_data['bayes_iteration_times'])
                 history = {i: res for i, res in enumerate(optimizer.res)}
                 histories.append(history)
-                if train.cleaned_data['kernel'] == 'poly':
-                    mdl = SVR(
-                        C=np.exp(optimizer.max['params']['c']), max_iter=5000,
-                        kernel=train.cleaned_data['kernel'], random_state=train.cleaned_data['random_seed'],
-                        degree=round(optimizer.max['params']['degree'])
-                    )
-                else:
-                    mdl = SVR(
-                        C=np.exp(optimizer.max['params']['c']), max_iter=5000,
-                        kernel=train.cleaned_data['kernel'], random_state=train.cleaned_data['random_seed']
-                    )
-                mdl.fit(x_train, y_train.ravel())
+                mdl, hyper_parameters_fold = fit_svr(
+                    train.cleaned_data, cache, np.exp(optimizer.max['params']['c']),
+                    round(optimizer.max['params'].get('degree', 3)), x_train, y_train.ravel()
+                )
                 models_.append(mdl)
                 y_valid_hat = mdl.predict(x_valid)
-                hyper_parameters_list.append({'c': mdl.C, 'degree': mdl.degree, 'kernel': mdl.kernel})
+                hyper_parameters_list.append(hyper_parameters_fold)
                 error_measure['value'].append(func_error(y_valid, y_valid_hat))
-            intermediate_paper_handle = ContentFile(pickle.dumps(models_))
+            intermediate_paper_handle = dump_paper(models_, 3)
             new_paper = Paper(user=req.user, role=3, name=f'SVM Regression #{algorithm_.id} Model')
-            new_paper.file.save(f'svm_regressor_{algorithm_.id}_model.pkl', intermediate_paper_handle)
+            new_paper.file.save(f'svm_regressor_{algorithm_.id}_model.joblib', intermediate_paper_handle)
             new_paper.save()
             algorithm_.model = new_paper
             algorithm_.training_history = json.dumps(histories, ensure_ascii=False)
@@ -346,91 +373,54 @@ def train_model(req):
             x_train, x_valid, y_train, y_valid = train_test_split(
                 x, y, train_size=0.8, shuffle=True, random_state=train.cleaned_data['random_seed'])
 
-            if train.cleaned_data['kernel'] == 'poly':
-                def bayes_svm_split(c, degree):
-                    svr = SVR(
-                        C=np.exp(c), kernel=train.cleaned_data['kernel'], degree=round(degree),
-                        max_iter=5000, random_state=train.cleaned_data['random_seed']
-                    )
-                    svr.fit(x_train, y_train.ravel())
-                    y_train_hat = svr.predict(x_train)
-                    return func_error(y_train_hat, y_train)
-            else:
-                def bayes_svm_split(c):
-                    svr = SVR(C=np.exp(c), kernel=train.cleaned_data['kernel'], max_iter=5000,
-                              random_state=train.cleaned_data['random_seed'])
-                    svr.fit(x_train, y_train.ravel())
-                    y_train_hat = svr.predict(x_train)
-                    return func_error(y_train_hat, y_train)
+            cache = search_cache(train.cleaned_data, x_train)
+
+            def bayes_svm_split(c, degree=3):
+                y_train_hat = svr_trial(train.cleaned_data, cache, np.exp(c), round(degree), y_train.ravel())
+                return func_error(y_train_hat, y_train)
 
             optimizer = BayesianOptimization(f=bayes_svm_split, pbounds=hyper_parameters,
                                              random_state=train.cleaned_data['random_seed'])
             optimizer.maximize(init_points=train.cleaned_data['bayes_init_try_times'],
                                n_iter=train.cleaned_data['bayes_iteration_times'])
             history = {i: res for i, res in enumerate(optimizer.res)}
-            if train.cleaned_data['kernel'] == 'poly':
-                mdl = SVR(
-                    C=np.exp(optimizer.max['params']['c']), max_iter=5000,
-                    kernel=train.cleaned_data['kernel'], random_state=train.cleaned_data['random_seed'],
-                    degree=round(optimizer.max['params']['degree'])
-                )
-            else:
-                mdl = SVR(
-                    C=np.exp(optimizer.max['params']['c']), max_iter=5000,
-                    kernel=train.cleaned_data['kernel'], random_state=train.cleaned_data['random_seed']
-                )
-            mdl.fit(x_train, y_train.ravel())
+            mdl, hyper_parameters = fit_svr(
+                train.cleaned_data, cache, np.exp(optimizer.max['params']['c']),
+                round(optimizer.max['params'].get('degree', 3)), x_train, y_train.ravel()
+            )
             y_valid_hat = mdl.predict(x_valid)
-            hyper_parameters = {'c': mdl.C, 'degree': mdl.degree, 'kernel': mdl.kernel}
             algorithm_.hyper_parameters = json.dumps(hyper_parameters, ensure_ascii=False)
             algorithm_.error_measure = json.dumps(
                 {'type': train.cleaned_data['criterion'], 'value': func_error(y_valid, y_valid_hat)},
                 ensure_ascii=False
             )
-            intermediate_paper_handle = ContentFile(pickle.dumps(mdl))
+            intermediate_paper_handle = dump_paper(mdl, 3)
             new_paper = Paper(user=req.user, role=3, name=f'SVM Regression #{algorithm_.id} Model')
-            new_paper.file.save(f'svm_regressor_{algorithm_.id}_model.pkl', intermediate_paper_handle)
+            new_paper.file.save(f'svm_regressor_{algorithm_.id}_model.joblib', intermediate_paper_handle)
             new_paper.save()
             algorithm_.model = new_paper
             algorithm_.training_history = json.dumps(history, ensure_ascii=False)
 
         else:  # mode == "full_train"
-            if train.cleaned_data['kernel'] == 'poly':
-                def bayes_svm_full_train(c, degree):
-                    svr = SVR(C=np.exp(c), kernel=train.cleaned_data['kernel'], degree=round(degree), max_iter=5000,
-                              random_state=train.cleaned_data['random_seed'])
-                    svr.fit(x, y.ravel())
-                    y_hat = svr.predict(x)
-                    return func_error(y_hat, y)
-            else:
-                def bayes_svm_full_train(c):
-                    svr = SVR(C=np.exp(c), kernel=train.cleaned_data['kernel'], max_iter=5000,
-                              random_state=train.cleaned_data['random_seed'])
-                    svr.fit(x, y.ravel())
-                    y_hat = svr.predict(x)
-                    return func_error(y_hat, y)
+            cache = search_cache(train.cleaned_data, x)
+
+            def bayes_svm_full_train(c, degree=3):
+                y_hat = svr_trial(train.cleaned_data, cache, np.exp(c), round(degree), y.ravel())
+                return func_error(y_hat, y)
+
             optimizer = BayesianOptimization(f=bayes_svm_full_train, pbounds=hyper_parameters,
                                              random_state=train.cleaned_data['random_seed'])
             optimizer.maximize(init_points=train.cleaned_data['bayes_init_try_times'],
                                n_iter=train.cleaned_data['bayes_iteration_times'])
             history = {i: res for i, res in enumerate(optimizer.res)}
-            if train.cleaned_data['kernel'] == 'poly':
-                mdl = SVR(
-                    C=np.exp(optimizer.max['params']['c']), max_iter=5000,
-                    kernel=train.cleaned_data['kernel'],
-                    degree=round(optimizer.max['params']['degree']), random_state=train.cleaned_data['random_seed']
-                )
-            else:
-                mdl = SVR(
-                    C=np.exp(optimizer.max['params']['c']), max_iter=5000,
-                    kernel=train.cleaned_data['kernel'], random_state=train.cleaned_data['random_seed']
-                )
-            mdl.fit(x, y.ravel())
-            hyper_parameters = {'c': mdl.C, 'degree': mdl.degree, 'kernel': mdl.kernel}
+            mdl, hyper_parameters = fit_svr(
+                train.cleaned_data, cache, np.exp(optimizer.max['params']['c']),
+                round(optimizer.max['params'].get('degree', 3)), x, y.ravel()
+            )
             algorithm_.hyper_parameters = json.dumps(hyper_parameters, ensure_ascii=False)
-            intermediate_paper_handle = ContentFile(pickle.dumps(mdl))
+            intermediate_paper_handle = dump_paper(mdl, 3)
             new_paper = Paper(user=req.user, role=3, name=f'SVM Regression #{algorithm_.id} Model')
-            new_paper.file.save(f'svm_regressor_{algorithm_.id}_model.pkl', intermediate_paper_handle)
+            new_paper.file.save(f'svm_regressor_{algorithm_.id}_model.joblib', intermediate_paper_handle)
             new_paper.save()
             algorithm_.model = new_paper
             algorithm_.training_history = json.dumps(history, ensure_ascii=False)
@@ -441,12 +431,12 @@ def train_model(req):
     except Exception as e:
         step.status = 4
         step.error_message = str(e)
-        step.save()
+        step.save(update_fields=['status', 'error_message'])
         context = {"color": "danger", "content": "Interrupted.",
                    "refresh": f"/algo_svm_regressor/{algorithm_.id}"}
         return render(req, "task_manager/hint_widget.html", context)
     step.status = 3
-    step.save()
+    step.save(update_fields=['status'])
     context = {"color": "success", "content": "The model has been trained and evaluated.",
                "refresh": f"/algo_svm_regressor/{algorithm_.id}"}
     return render(req, "task_manager/hint_widget.html", context)
@@ -492,10 +482,9 @@ def predict(req):
         context = {"color": "danger", "content": "This step doesn't have a trained model."}
         return render(req, "task_manager/hint_widget.html", context)
     step.status = 2
-    step.save()
+    step.save(update_fields=['status'])
     try:
-        with open(algorithm_.model.file.path, "rb") as f:
-            model = pickle.load(f)
+        model = load_paper(algorithm_.model)
         x_col = [x.name for x in Column.objects.filter(algorithm=algorithm_, x_column=True)]
         y_col = Column.objects.filter(algorithm=algorithm_, y_column=True).first().name
         x = table[x_col].values
@@ -509,7 +498,7 @@ def predict(req):
             table.to_excel(f, index=False)
     except Exception as e:
         step.status = 4
-        step.save()
+        step.save(update_fields=['status'])
         context = {"color": "warning", "content": f"Interrupted. {e}"}
         return render(req, "task_manager/hint_widget.html", context)
     new_paper = Paper(user=req.user, role=4, name=f"SVM Regression #{algorithm_.id} Predict")
@@ -517,7 +506,7 @@ def predict(req):
     new_paper.save()
     step.predicted_data = new_paper
     step.status = 3
-    step.save()
+    step.save(update_fields=['predicted_data', 'status'])
     context = {"color": "success", "content": "Prediction completed.",
                "refresh": f"/algo_svm_regressor/{algorithm_.id}"}
     return render(req, "task_manager/hint_widget.html", context=context)
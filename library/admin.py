@@ -4,7 +4,8 @@ from .models import *
 
 @admin.register(UserStorage)
 class UserStorageAdmin(admin.ModelAdmin):
-    list_display = ['user', 'specific_storage']
+    list_display = ['user', 'specific_storage', 'used_bytes']
+    readonly_fields = ['used_bytes']
     autocomplete_fields = ['user']
 
 
@@ -16,6 +17,13 @@ class PermittedStorageAdmin(admin.ModelAdmin):
 
 @admin.register(Paper)
 class PaperAdmin(admin.ModelAdmin):
-    list_display = ['user', 'role', 'file']
+    list_display = ['user', 'role', 'file', 'size_bytes']
+    readonly_fields = ['size_bytes']
     list_filter = ['user', 'role']
     autocomplete_fields = ['user']
+
+
+@admin.register(Schema)
+class SchemaAdmin(admin.ModelAdmin):
+    list_display = ['paper', 'modified_time']
+    raw_id_fields = ['paper']
@@ -0,0 +1,137 @@
+import mimetypes
+import re
+import zlib
+from os.path import splitext
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+from .serialization import compression_of_role
+
+block_size = 1048576
+# Spreadsheets and images are compressed already.
+compressible_suffixes = {'.pkl', '.csv', '.txt', '.json', '.svg'}
+
+
+def serve_paper(req, paper):
+    """
+    Download the file of a paper, with conditional GET and byte ranges, so that browsers and download managers can
+    revalidate the cached file and resume a broken transfer. If the client accepts gzip and the file is worth
+    compressing, the whole file is compressed while it's sent.
+
+    With ``settings.PAPER_DOWNLOAD_MODE`` "x-accel" (nginx) or "x-sendfile" (Apache, lighttpd), the permission is
+    checked here but the file is sent by the front-end server, which also handles ranges, so the worker is released
+    at once.
+    """
+    compressible = settings.PAPER_GZIP_DOWNLOADS and settings.PAPER_DOWNLOAD_MODE == 'django' and is_compressible(paper)
+    gzipped = compressible and 'Range' not in req.headers and 'gzip' in req.headers.get('Accept-Encoding', '')
+    version = f"{paper.id}-{paper.size_bytes}-{paper.modified_time.timestamp():.6f}"
+    etag = quote_etag(version + '-gzip' if gzipped else version)
+    last_modified = int(paper.modified_time.timestamp())
+
+    response = get_conditional_response(req, etag=etag, last_modified=last_modified)
+    if response is None:
+        if settings.PAPER_DOWNLOAD_MODE == 'x-accel':
+            response = HttpResponse(content_type=content_type(paper.name))
+            response['X-Accel-Redirect'] = quote(settings.PAPER_ACCEL_PREFIX + paper.file.name)
+        elif settings.PAPER_DOWNLOAD_MODE == 'x-sendfile':
+            response = HttpResponse(content_type=content_type(paper.name))
+            response['X-Sendfile'] = paper.file.path
+        elif gzipped:
+            response = StreamingHttpResponse(gzip_blocks(paper.file.open('rb')), content_type=content_type(paper.name))
+            response['Content-Encoding'] = 'gzip'
+        else:
+            response = file_response(req, paper, etag, last_modified)
+        response['Content-Disposition'] = content_disposition(paper.name)
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Cache-Control'] = 'private, no-cache'
+    if compressible:
+        patch_vary_headers(response, ['Accept-Encoding'])
+    return response
+
+
+def is_compressible(paper):
+    """Papers written by "dump_paper" are compressed already if their role is, e.g. models."""
+    suffix = splitext(paper.file.name)[1].lower()
+    return suffix in compressible_suffixes or suffix == '.joblib' and not compression_of_role[paper.role]
+
+
+def file_response(req, paper, etag, last_modified):
+    """The whole file, or the byte range requested if "If-Range" (when sent) matches the current version."""
+    size = paper.file.size
+    if_range = req.headers.get('If-Range')
+    byte_range = None
+    if 'Range' in req.headers and if_range in (None, etag, http_date(last_modified)):
+        try:
+            byte_range = parse_range(req.headers['Range'], size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+    if byte_range is None:
+        response = FileResponse(paper.file.open('rb'), content_type=content_type(paper.name))
+        response.block_size = block_size
+    else:
+        start, stop = byte_range
+        response = StreamingHttpResponse(range_blocks(paper.file.open('rb'), start, stop), status=206,
+                                         content_type=content_type(paper.name))
+        response['Content-Range'] = f'bytes {start}-{stop - 1}/{size}'
+        response['Content-Length'] = stop - start
+    response['Accept-Ranges'] = 'bytes'
+    return response
+
+
+def parse_range(header, size):
+    """
+    :return: (start, stop) of a single byte range, or None if the whole file should be sent, for a malformed header
+        or multiple ranges.
+    :raise ValueError: the range isn't satisfiable.
+    """
+    match = re.fullmatch(r'bytes=(\d*)-(\d*)', header.strip())
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if not first:  # The last bytes.
+        if int(last) == 0 or size == 0:
+            raise ValueError
+        return max(size - int(last), 0), size
+    if last and int(last) < int(first):
+        return None
+    if int(first) >= size:
+        raise ValueError
+    return int(first), min(int(last) + 1, size) if last else size
+
+
+def range_blocks(f, start, stop):
+    with f:
+        f.seek(start)
+        while start < stop:
+            block = f.read(min(block_size, stop - start))
+            if not block:
+                break
+            start += len(block)
+            yield block
+
+
+def gzip_blocks(f):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31 writes the gzip header.
+    with f:
+        while block := f.read(block_size):
+            yield compressor.compress(block)
+    yield compressor.flush()
+
+
+def content_type(name):
+    return mimetypes.guess_type(name)[0] or 'application/octet-stream'
+
+
+def content_disposition(name):
+    try:
+        name.encode('ascii')
+        return 'inline; filename="{}"'.format(name.replace('\\', '\\\\').replace('"', r'\"'))
+    except UnicodeEncodeError:
+        return f"inline; filename*=utf-8''{quote(name)}"
@@ -0,0 +1,41 @@
+import os
+
+from django.core.management.base import BaseCommand
+
+from library.models import Paper
+from library.storage import file_digest, paper_storage
+
+
+class Command(BaseCommand):
+    help = "Link paper files stored before blob storage to their blobs, merging duplicates, and remove blobs which " \
+           "no paper links any more."
+
+    def handle(self, *args, **options):
+        linked, freed = 0, 0
+        for name in Paper.objects.exclude(file='').values_list('file', flat=True).distinct().iterator():
+            path = paper_storage.path(name)
+            try:
+                if os.stat(path).st_nlink > 1:
+                    continue
+            except FileNotFoundError:
+                continue
+            blob_name = paper_storage.blob_name(file_digest(path))
+            blob = paper_storage.path(blob_name)
+            if os.path.exists(blob):
+                # Replace the file by a link of the blob atomically, so the paper is never missing.
+                os.link(blob, path + '.link')
+                os.replace(path + '.link', path)
+                freed += os.path.getsize(blob)
+            else:
+                paper_storage.add_blob(blob_name, path)
+            linked += 1
+
+        collected = 0
+        for directory, _, files in os.walk(paper_storage.path('blobs')):
+            for file in files:
+                path = os.path.join(directory, file)
+                if os.stat(path).st_nlink == 1:
+                    freed += os.path.getsize(path)
+                    os.remove(path)
+                    collected += 1
+        self.stdout.write(f"Linked {linked} paper files, removed {collected} unused blobs, freed {freed} bytes.")
@@ -0,0 +1,23 @@
+# Generated by Django 4.0.4 on 2026-10-19 17:17
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0003_alter_paper_name'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Schema',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('modified_time', models.DateTimeField()),
+                ('columns', models.TextField()),
+                ('paper', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, to='library.paper')),
+            ],
+        ),
+    ]
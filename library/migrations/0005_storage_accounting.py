@@ -0,0 +1,43 @@
+# Generated by Django 4.0.4 on 2026-10-19 17:49
+
+from django.db import migrations, models
+
+
+def count_sizes(apps, schema_editor):
+    Paper = apps.get_model('library', 'Paper')
+    UserStorage = apps.get_model('library', 'UserStorage')
+    for paper in Paper.objects.all():
+        try:
+            paper.size_bytes = paper.file.size
+        except (OSError, ValueError):
+            continue
+        paper.save(update_fields=['size_bytes'])
+    for storage in UserStorage.objects.all():
+        papers = Paper.objects.filter(user=storage.user_id, role=1)
+        storage.used_bytes = papers.aggregate(total=models.Sum('size_bytes'))['total'] or 0
+        storage.save(update_fields=['used_bytes'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0004_schema'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='paper',
+            name='size_bytes',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='userstorage',
+            name='used_bytes',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='paper',
+            index=models.Index(fields=['user', 'role'], name='library_pap_user_id_50f9d2_idx'),
+        ),
+        migrations.RunPython(count_sizes, migrations.RunPython.noop),
+    ]
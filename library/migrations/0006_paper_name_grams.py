@@ -0,0 +1,41 @@
+# Generated by Django 4.0.4 on 2026-10-19 17:51
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+from library.models import name_grams
+
+
+def index_names(apps, schema_editor):
+    Paper = apps.get_model('library', 'Paper')
+    PaperNameGram = apps.get_model('library', 'PaperNameGram')
+    for paper in Paper.objects.only('id', 'user', 'name').iterator():
+        PaperNameGram.objects.bulk_create(
+            [PaperNameGram(paper_id=paper.id, user_id=paper.user_id, gram=gram) for gram in name_grams(paper.name)]
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('library', '0005_storage_accounting'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaperNameGram',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('gram', models.CharField(max_length=3)),
+                ('paper', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='library.paper')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='papernamegram',
+            index=models.Index(fields=['user', 'gram'], name='library_pap_user_id_32d627_idx'),
+        ),
+        migrations.RunPython(index_names, migrations.RunPython.noop),
+    ]
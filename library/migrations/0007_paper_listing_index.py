@@ -0,0 +1,21 @@
+# Generated by Django 4.0.4 on 2026-10-19 17:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0006_paper_name_grams'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='paper',
+            name='library_pap_user_id_50f9d2_idx',
+        ),
+        migrations.AddIndex(
+            model_name='paper',
+            index=models.Index(fields=['user', 'role', 'modified_time'], name='library_pap_user_id_e9da75_idx'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.0.4 on 2026-10-19 17:58
+
+from django.db import migrations, models
+import library.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0008_upload'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='paper',
+            name='file',
+            field=models.FileField(storage=library.storage.BlobStorage(), upload_to='papers/'),
+        ),
+    ]
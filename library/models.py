@@ -1,8 +1,17 @@
+import json
+import os
 from os.path import join
 
 from django.conf.global_settings import MEDIA_ROOT
 from django.contrib.auth.models import Group, User
-from django.db import models
+from django.core.files.storage import default_storage
+from django.db import models, transaction
+from django.db.models import Case, Count, F, Sum, When
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from .serialization import load_paper
+from .storage import paper_storage
 
 
 class GroupStorage(models.Model):
@@ -16,21 +25,45 @@ class GroupStorage(models.Model):
 class UserStorage(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     specific_storage = models.IntegerField(verbose_name="User Storage (MB)", default=0)
+    # Total size of the user's data papers, kept by saving and deleting papers.
+    used_bytes = models.BigIntegerField(default=0)
 
     def total_storage_bytes(self):
-        storages = GroupStorage.objects.filter(group__in=self.user.groups.all())
-        storage_mb = sum([x.user_init_storage for x in storages]) + self.specific_storage
-        return storage_mb * 1048576
+        storages = GroupStorage.objects.filter(group__user=self.user_id).aggregate(mb=Sum('user_init_storage'))
+        return ((storages['mb'] or 0) + self.specific_storage) * 1048576
 
     def __str__(self):
         return self.user.username
 
-    def upload_permission(self, new_file):
-        return self.used_storage_bytes() + new_file.size <= self.total_storage_bytes()
+    def upload_permission(self, size_bytes, upload=None):
+        """
+        Sizes of unfinished uploads are reserved, so they're counted as used.
+        :param upload: the upload being committed, whose reservation isn't counted again.
+        """
+        reserved = Upload.objects.filter(user=self.user_id).exclude(id=getattr(upload, 'id', None)) \
+            .aggregate(total=Sum('size_bytes'))['total'] or 0
+        return self.used_storage_bytes() + reserved + size_bytes <= self.total_storage_bytes()
 
     def used_storage_bytes(self):
-        users_papers = Paper.objects.filter(user=self.user, role=1)
-        return sum([x.file.size for x in users_papers])
+        return self.used_bytes
+
+    def recount(self):
+        """Recompute the usage from the sizes of papers, if the counter is doubted."""
+        self.used_bytes = counted_bytes_of(self.user_id)
+        self.save()
+
+
+def counted_bytes_of(user_id):
+    return Paper.objects.filter(user=user_id, role=1).aggregate(total=Sum('size_bytes'))['total'] or 0
+
+
+def storage_of(user):
+    return UserStorage.objects.get_or_create(user=user, defaults={'used_bytes': counted_bytes_of(user.id)})[0]
+
+
+def counted_bytes(role, size_bytes):
+    """Only data papers, uploaded by users, are counted in the storage quota."""
+    return size_bytes if role == 1 else 0
 
 
 class Paper(models.Model):
@@ -38,7 +71,161 @@ class Paper(models.Model):
     modified_time = models.DateTimeField(auto_now=True)
     role = models.IntegerField(choices=[(1, "Data"), (2, "Intermediate"), (3, "Model"), (4, "Result")], default=1)
     name = models.CharField(max_length=256)
-    file = models.FileField(upload_to=join(MEDIA_ROOT, 'papers/'))
+    file = models.FileField(upload_to=join(MEDIA_ROOT, 'papers/'), storage=paper_storage)
+    size_bytes = models.BigIntegerField(default=0)
+
+    class Meta:
+        indexes = [models.Index(fields=['user', 'role', 'modified_time'])]
+
+    def __str__(self):
+        return self.name
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or {'file', 'role'} & set(update_fields):
+            try:
+                self.size_bytes = self.file.size if self.file else 0
+            except OSError:  # The file is missing, keep the recorded size.
+                pass
+            if update_fields is not None:
+                kwargs['update_fields'] = set(update_fields) | {'size_bytes'}
+        with transaction.atomic():
+            before = Paper.objects.filter(pk=self.pk).values_list('role', 'size_bytes', 'name').first() \
+                if self.pk else None
+            super().save(*args, **kwargs)
+            delta = counted_bytes(self.role, self.size_bytes) - (counted_bytes(*before[:2]) if before else 0)
+            if delta:
+                UserStorage.objects.filter(user=self.user_id).update(used_bytes=F('used_bytes') + delta)
+            if before is None or before[2] != self.name:
+                index_name(self)
+
+
+class PaperNameGram(models.Model):
+    """
+    Trigram index of paper names, used to search papers by a part of the name without scanning every name. Rows of a
+    paper are replaced when it's saved with a new name, and deleted with the paper.
+    """
+    paper = models.ForeignKey(Paper, on_delete=models.CASCADE)
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    gram = models.CharField(max_length=3)
+
+    class Meta:
+        indexes = [models.Index(fields=['user', 'gram'])]
+
+
+def name_grams(name):
+    """
+    Every position of the lowercase name starts a gram, and the name is padded at the end so that the last positions
+    also have one, so a query shorter than 3 characters matches the prefix of some gram.
+    """
+    padded = name.lower() + '  '
+    return {padded[i:i + 3] for i in range(len(name))}
+
+
+def index_name(paper):
+    PaperNameGram.objects.filter(paper=paper).delete()
+    PaperNameGram.objects.bulk_create(
+        [PaperNameGram(paper=paper, user_id=paper.user_id, gram=gram) for gram in name_grams(paper.name)]
+    )
+
+
+def search_papers(user, text, **filters):
+    """
+    Papers of the user whose names contain ``text``, case-insensitive. Papers whose names start with ``text`` are
+    ranked first (annotated "rank" 0), and then recently modified ones.
+
+    :param filters: other conditions of papers, such as role.
+    """
+    papers = Paper.objects.filter(user=user, **filters)
+    if not text:
+        return papers.order_by('-modified_time')
+    text = text.lower()
+    grams = {text[i:i + 3] for i in range(len(text) - 2)}
+    if grams:
+        # Candidates have all trigrams of the text, and the final filter checks their order.
+        candidates = PaperNameGram.objects.filter(user=user, gram__in=grams).values('paper') \
+            .annotate(matched=Count('gram', distinct=True)).filter(matched=len(grams)).values('paper')
+    else:
+        # A range of the index covers grams starting with the text.
+        candidates = PaperNameGram.objects.filter(user=user, gram__gte=text, gram__lt=text + '\uffff') \
+            .values('paper')
+    return papers.filter(id__in=candidates, name__icontains=text) \
+        .annotate(rank=Case(When(name__istartswith=text, then=0), default=1, output_field=models.IntegerField())) \
+        .order_by('rank', '-modified_time')
+
+
+@receiver(post_delete, sender=Paper)
+def uncount_paper(sender, instance, **kwargs):
+    """Also runs for papers deleted in bulk or by cascade."""
+    delta = counted_bytes(instance.role, instance.size_bytes)
+    if delta:
+        UserStorage.objects.filter(user=instance.user_id).update(used_bytes=F('used_bytes') - delta)
+
+
+class Upload(models.Model):
+    """
+    A file uploaded to the library by chunks, which are appended to a part file in order. The paper is created when
+    all bytes are received, and the part file is deleted with the upload.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    name = models.CharField(max_length=256)
+    size_bytes = models.BigIntegerField()
+    received_bytes = models.BigIntegerField(default=0)
+    modified_time = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.name
+
+    def part_path(self):
+        return default_storage.path(f'uploads/{self.id}.part')
+
+
+@receiver(post_delete, sender=Upload)
+def remove_part(sender, instance, **kwargs):
+    try:
+        os.remove(instance.part_path())
+    except FileNotFoundError:
+        pass
+
+
+class Schema(models.Model):
+    """
+    Column statistics of a parsed dataset, cached for its minimal profile. Each import parses the data into a new
+    paper, so a row belongs to one step's dataset; the per-algorithm Column tables still hold the variables.
+    """
+    paper = models.OneToOneField(Paper, on_delete=models.CASCADE)
+    modified_time = models.DateTimeField()
+    columns = models.TextField()
+
+    def __str__(self):
+        return self.paper.name
+
+
+def describe_columns(table):
+    null_count = table.isna().sum()
+    stats = table.select_dtypes(include='number').agg(['mean', 'std', 'min', 'max'])
+    return [
+        {
+            'name': str(col), 'dtype': str(table[col].dtype), 'null_count': int(null_count[col]),
+            **({k: float(v) for k, v in stats[col].items()} if col in stats.columns else {}),
+        }
+        for col in table.columns
+    ]
+
+
+def load_schema(paper):
+    """
+    Get the column names, data types, null counts and basic statistics of a dataset. The result is cached per paper
+    and recomputed only after the paper is modified, so a profile generated again doesn't load the dataset.
+    """
+    try:
+        schema = Schema.objects.get(paper=paper)
+        if schema.modified_time == paper.modified_time:
+            return json.loads(schema.columns)
+    except Schema.DoesNotExist:
+        schema = Schema(paper=paper)
+    columns = describe_columns(load_paper(paper))
+    schema.modified_time = paper.modified_time
+    schema.columns = json.dumps(columns)
+    schema.save()
+    return columns
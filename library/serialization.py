@@ -0,0 +1,47 @@
+import io
+from os.path import basename, splitext
+
+import joblib
+from django.core.files.base import ContentFile
+
+try:
+    import lz4  # noqa: F401 Models are compressed by lz4 if it's installed, which decompresses faster than zlib.
+    model_compression = ('lz4', 3)
+except ImportError:
+    model_compression = ('zlib', 3)
+
+# Parsed data is loaded by every training and prediction, so it's left uncompressed to be memory-mapped.
+compression_of_role = {1: 0, 2: 0, 3: model_compression, 4: model_compression}
+
+
+def dump_paper(obj, role):
+    """
+    Serialize an object to the content of a paper of ``role``. NumPy arrays, including the columns of dataframes and
+    the trees of forests, are written after the pickle stream as raw aligned buffers (joblib format, pickle protocol
+    5) instead of being copied into it.
+
+    The content is not a plain pickle (and models are compressed), so it should be read by "joblib.load" and the
+    file named "*.joblib". Papers named "*.pkl" are plain pickles uploaded by users or written by former versions.
+    """
+    f = io.BytesIO()
+    joblib.dump(obj, f, compress=compression_of_role[role], protocol=5)
+    return ContentFile(f.getvalue())
+
+
+def load_paper(paper):
+    """
+    Load a paper written by "dump_paper", or a plain pickle uploaded by users or written by former versions. Arrays
+    of an uncompressed paper are memory-mapped copy-on-write, so they're read from disk on demand and can be modified
+    in memory without touching the file.
+    """
+    with open(paper.file.path, 'rb') as f:
+        uncompressed = f.read(1) == b'\x80'  # Compressed files start with the magic number of the compressor.
+    return joblib.load(paper.file.path, mmap_mode='c' if uncompressed else None)
+
+
+def rewrite_paper(paper, obj):
+    """
+    Replace the content of a paper. A new file is written rather than the old one overwritten, because files of
+    identical content are shared by papers, and the modified time is updated so that the cached schema expires.
+    """
+    paper.file.save(splitext(basename(paper.file.name))[0] + '.joblib', dump_paper(obj, paper.role))
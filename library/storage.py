@@ -0,0 +1,113 @@
+import errno
+import hashlib
+import os
+import shutil
+import tempfile
+
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+read_bytes = 1048576
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while block := f.read(read_bytes):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+@deconstructible
+class BlobStorage(FileSystemStorage):
+    """
+    Storage of paper files, where each file is a hard link to a blob named by the SHA-256 of the content. Papers of
+    identical content, such as the same data parsed by several steps or an upload repeated, share one blob, so the
+    copy costs no disk and isn't written again.
+
+    The number of links of a blob is its reference count: deleting a paper file (by django_cleanup) removes one link,
+    and the blob itself once no paper links it. "manage.py compact_papers" links files stored before and removes
+    blobs left unlinked.
+
+    Blobs are read-only, which their links share, so a paper can't be modified in place behind the other papers of
+    the same content; it's written again instead (see "library.serialization.rewrite_paper").
+    """
+    blob_permissions_mode = 0o444
+
+    @staticmethod
+    def blob_name(digest):
+        return f'blobs/{digest[:2]}/{digest}'
+
+    def _save(self, name, content):
+        digest = hashlib.sha256()
+        for block in content.chunks():
+            digest.update(block)
+        blob = self.blob_name(digest.hexdigest())
+        if not self.exists(blob):
+            if hasattr(content, 'temporary_file_path'):
+                self.add_blob(blob, content.temporary_file_path())
+            else:
+                written = super()._save(blob, content)
+                if written != blob:  # Another request has stored the same content meanwhile.
+                    os.remove(self.path(written))
+                else:
+                    os.chmod(self.path(blob), self.blob_permissions_mode)
+        try:
+            return self.link(blob, name)
+        except FileNotFoundError:  # The blob is collected meanwhile.
+            return super()._save(name, content)
+
+    def save_file(self, name, path):
+        """Store a local file under ``name`` without copying it, if it's in the same file system."""
+        blob = self.blob_name(file_digest(path))
+        self.add_blob(blob, path)
+        return self.link(blob, self.get_available_name(name))
+
+    def add_blob(self, blob, path):
+        """
+        Link a local file as the blob, or copy it if it's in another file system, such as a temporary upload in the
+        system's temporary directory.
+        """
+        os.makedirs(os.path.dirname(self.path(blob)), exist_ok=True)
+        try:
+            os.link(path, self.path(blob))
+        except FileExistsError:
+            return
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+            # The copy is written aside and linked when complete, so that other papers never link a partial blob.
+            fd, part = tempfile.mkstemp(dir=os.path.dirname(self.path(blob)), suffix='.part')
+            os.close(fd)
+            shutil.copyfile(path, part)
+            try:
+                os.link(part, self.path(blob))
+            except FileExistsError:
+                return
+            finally:
+                os.remove(part)
+        os.chmod(self.path(blob), self.blob_permissions_mode)
+
+    def link(self, blob, name):
+        os.makedirs(os.path.dirname(self.path(name)), exist_ok=True)
+        while True:
+            try:
+                os.link(self.path(blob), self.path(name))
+                return name
+            except FileExistsError:
+                name = self.get_available_name(name)
+
+    def delete(self, name):
+        path = self.path(name)
+        try:
+            links = os.stat(path).st_nlink
+        except FileNotFoundError:
+            return
+        if links == 2 and not name.startswith('blobs/'):  # Only the blob is left after this file.
+            blob = self.path(self.blob_name(file_digest(path)))
+            if os.path.exists(blob) and os.path.samefile(blob, path):
+                os.remove(blob)
+        super().delete(name)
+
+
+paper_storage = BlobStorage()
@@ -1,3 +1,60 @@
-from django.test import TestCase
+import errno
+import os
+import stat
+import tempfile
+from unittest import mock
 
-# Create your tests here.
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.test import SimpleTestCase
+
+from .storage import BlobStorage, file_digest
+
+
+class BlobStorageTestCase(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.storage = BlobStorage(location=self.directory.name)
+        self.content = b'paper content' * 1000
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def cross_device(self, source):
+        """Links of ``source`` fail as if it were in another file system."""
+        link = os.link
+
+        def fake_link(src, dst):
+            if os.path.abspath(src) == os.path.abspath(source):
+                raise OSError(errno.EXDEV, os.strerror(errno.EXDEV))
+            link(src, dst)
+        return mock.patch('library.storage.os.link', fake_link)
+
+    def assertBlobStored(self, name):
+        blob = self.storage.path(self.storage.blob_name(file_digest(self.storage.path(name))))
+        with open(self.storage.path(name), 'rb') as f:
+            self.assertEqual(f.read(), self.content)
+        self.assertTrue(os.path.samefile(blob, self.storage.path(name)))
+        self.assertEqual(stat.S_IMODE(os.stat(blob).st_mode), 0o444)
+        self.assertEqual([file for file in os.listdir(os.path.dirname(blob)) if file.endswith('.part')], [])
+
+    def test_save_temporary_upload_across_devices(self):
+        upload = TemporaryUploadedFile('data.csv', 'text/csv', len(self.content), None)
+        upload.write(self.content)
+        upload.seek(0)
+        with upload, self.cross_device(upload.temporary_file_path()):
+            name = self.storage.save('papers/data.csv', upload)
+        self.assertBlobStored(name)
+
+    def test_save_file_across_devices(self):
+        with tempfile.NamedTemporaryFile() as f:
+            f.write(self.content)
+            f.flush()
+            with self.cross_device(f.name):
+                name = self.storage.save_file('papers/data.csv', f.name)
+        self.assertBlobStored(name)
+
+    def test_other_link_errors_are_raised(self):
+        with tempfile.NamedTemporaryFile() as f, \
+                mock.patch('library.storage.os.link', side_effect=OSError(errno.EPERM, os.strerror(errno.EPERM))):
+            with self.assertRaises(OSError):
+                self.storage.save_file('papers/data.csv', f.name)
@@ -0,0 +1,64 @@
+import hashlib
+import os
+
+from django.db import transaction
+
+from .models import Paper, Upload
+
+chunk_bytes = 4194304
+read_bytes = 65536
+
+
+class ChunkError(Exception):
+    pass
+
+
+def create_part(upload: Upload):
+    os.makedirs(os.path.dirname(upload.part_path()), exist_ok=True)
+    open(upload.part_path(), 'wb').close()
+
+
+def append_chunk(upload: Upload, stream, offset, length, sha256):
+    """
+    Write a chunk read from ``stream`` at ``offset`` of the part file, which must be where the received bytes end.
+    The chunk is written in place, and cut off again if it's incomplete or doesn't match the checksum, so that the
+    client can send it again.
+
+    :param sha256: hex digest of the chunk computed by the client.
+    :raise ChunkError: the chunk is refused, with the reason.
+    """
+    if offset != upload.received_bytes:
+        raise ChunkError(f"The upload continues at byte {upload.received_bytes}.")
+    if not 0 < length <= chunk_bytes or offset + length > upload.size_bytes:
+        raise ChunkError("The length of the chunk is not valid.")
+    digest = hashlib.sha256()
+    with open(upload.part_path(), 'r+b') as f:
+        f.seek(offset)
+        remaining = length
+        while remaining:
+            block = stream.read(min(read_bytes, remaining))
+            if not block:
+                break
+            digest.update(block)
+            f.write(block)
+            remaining -= len(block)
+        if remaining or digest.hexdigest() != sha256.lower():
+            f.truncate(offset)
+            raise ChunkError("The chunk is incomplete or its checksum doesn't match.")
+        f.truncate(offset + length)
+    # The conditional update refuses a chunk of the same offset which is accepted by a concurrent request.
+    if not Upload.objects.filter(id=upload.id, received_bytes=offset).update(received_bytes=offset + length):
+        raise ChunkError("The chunk is appended by another request.")
+    upload.received_bytes = offset + length
+
+
+def assemble(upload: Upload):
+    """Create the paper of a complete upload. The part file is linked to the paper's path rather than copied."""
+    field = Paper._meta.get_field('file')
+    name = field.storage.save_file(field.generate_filename(None, upload.name), upload.part_path())
+    with transaction.atomic():
+        paper = Paper(user_id=upload.user_id, role=1, name=os.path.basename(name))
+        paper.file.name = name
+        paper.save()
+        upload.delete()
+    return paper
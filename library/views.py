@@ -3,11 +3,19 @@ from django.contrib.auth.decorators import permission_required
 from django.shortcuts import render, redirect
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST
-from django.http import FileResponse
+from django.http import JsonResponse
+from django.utils.timezone import now
 
 import question_go_v2.settings
+from task_manager.queries import KeysetPage
+from .downloads import serve_paper
 from .models import *
+from .uploads import ChunkError, append_chunk, assemble, chunk_bytes, create_part
 from os.path import basename
+from datetime import timedelta
+
+# Unfinished uploads are dropped after this time, and their reserved storage is released.
+upload_expiry = timedelta(days=7)
 
 
 class PublicSelectMultiplePaper(forms.Form):
@@ -29,6 +37,11 @@ class RenamePaper(PublicSelectMultiplePaper):
                                help_text="Leave blank to revoke to original filename.")
 
 
+class InitUpload(forms.Form):
+    name = forms.CharField(max_length=256)
+    size = forms.IntegerField(min_value=1)
+
+
 class SearchPaper(forms.Form):
     search = forms.CharField(max_length=256, widget=forms.TextInput({"class": "form-control"}), required=False,
                              label="")
@@ -37,18 +50,17 @@ class SearchPaper(forms.Form):
 @permission_required("library.view_paper", login_url="/main?message=No permission to view papers.&color=danger")
 def view_library(req):
     sp = SearchPaper(req.GET)
-    papers = Paper.objects.filter(user=req.user, name__contains=sp.cleaned_data['search'], role=1) \
-        if sp.is_valid() else Paper.objects.filter(user=req.user, role=1)
-    my_storage, created = UserStorage.objects.get_or_create(user=req.user)
-    if created:
-        my_storage.save()
+    search = sp.cleaned_data['search'] if sp.is_valid() else ''
+    papers = KeysetPage(req, search_papers(req.user, search, role=1),
+                        ['rank', '-modified_time'] if search else ['-modified_time'])
+    my_storage = storage_of(req.user)
     total_storage = my_storage.total_storage_bytes()
     used_storage = my_storage.used_storage_bytes()
     context = {
         "TotalStorage": total_storage,
         "UsedStorage": used_storage,
         "RateStorage": 0 if total_storage == 0 else used_storage / total_storage * 100,
-        "Papers": papers.order_by('-modified_time'),
+        "Papers": papers,
         "SearchSheet": SearchPaper(req.GET),
         "AddPaperSheet": AddPaper(),
         "timezone": question_go_v2.settings.TIME_ZONE,
@@ -63,7 +75,10 @@ def view_paper(req, paper_id):
         paper = Paper.objects.get(id=paper_id, user=req.user)
     except Paper.DoesNotExist:
         return redirect("/library?message=This paper does not exist.&color=danger")
-    return FileResponse(paper.file)
+    try:
+        return serve_paper(req, paper)
+    except FileNotFoundError:
+        return redirect("/library?message=The file of this paper is missing.&color=danger")
 
 
 @permission_required("library.add_paper", login_url="/library?message=No permission.&color=danger")
@@ -73,15 +88,94 @@ def add_paper(req):
     sheet = AddPaper(req.POST, req.FILES)
     if not sheet.is_valid():
         return redirect("/library?message=Submission is not valid.&color=danger")
-    my_storage = UserStorage.objects.get(user=req.user)
+    my_storage = storage_of(req.user)
     new_paper = Paper(user=req.user, file=sheet.cleaned_data['file'], role=1)
     new_paper.name = basename(new_paper.file.name)
-    if not my_storage.upload_permission(new_paper.file):
+    if not my_storage.upload_permission(new_paper.file.size):
         return redirect("/library?message=Your storage is used up.&color=danger")
     new_paper.save()
     return redirect("/library")
 
 
+def upload_status(upload):
+    return {'upload': upload.id, 'name': upload.name, 'size': upload.size_bytes, 'received': upload.received_bytes,
+            'chunk_size': chunk_bytes}
+
+
+@permission_required("library.add_paper", login_url="/library?message=No permission.&color=danger")
+@csrf_exempt
+@require_POST
+def init_upload(req):
+    """
+    Start a chunked upload, which is the first request of "clixove.js: chunked_upload". The size is checked against
+    the quota before any byte is sent, and reserved until the upload is committed or aborted.
+    """
+    sheet = InitUpload(req.POST)
+    if not sheet.is_valid():
+        return JsonResponse({'error': "Submission is not valid."}, status=400)
+    Upload.objects.filter(user=req.user, modified_time__lt=now() - upload_expiry).delete()
+    if not storage_of(req.user).upload_permission(sheet.cleaned_data['size']):
+        return JsonResponse({'error': "Your storage is used up."}, status=403)
+    upload = Upload.objects.create(user=req.user, name=basename(sheet.cleaned_data['name']),
+                                   size_bytes=sheet.cleaned_data['size'])
+    create_part(upload)
+    return JsonResponse(upload_status(upload))
+
+
+@permission_required("library.add_paper", login_url="/library?message=No permission.&color=danger")
+def view_upload(req, upload_id):
+    """The client resumes an interrupted upload from the received bytes."""
+    upload = Upload.objects.filter(id=upload_id, user=req.user).first()
+    if upload is None:
+        return JsonResponse({'error': "This upload does not exist."}, status=404)
+    return JsonResponse(upload_status(upload))
+
+
+@permission_required("library.add_paper", login_url="/library?message=No permission.&color=danger")
+@csrf_exempt
+@require_POST
+def append_upload(req, upload_id):
+    """
+    The chunk is the raw request body, and its offset and SHA-256 are query parameters. The body is read by blocks
+    instead of being parsed as a form.
+    """
+    upload = Upload.objects.filter(id=upload_id, user=req.user).first()
+    if upload is None:
+        return JsonResponse({'error': "This upload does not exist."}, status=404)
+    try:
+        append_chunk(upload, req, int(req.GET['offset']), int(req.META.get('CONTENT_LENGTH') or 0),
+                     req.GET['sha256'])
+    except (KeyError, ValueError):
+        return JsonResponse({'error': "Submission is not valid.", **upload_status(upload)}, status=400)
+    except ChunkError as e:
+        upload.refresh_from_db()
+        return JsonResponse({'error': str(e), **upload_status(upload)}, status=409)
+    return JsonResponse(upload_status(upload))
+
+
+@permission_required("library.add_paper", login_url="/library?message=No permission.&color=danger")
+@csrf_exempt
+@require_POST
+def commit_upload(req, upload_id):
+    upload = Upload.objects.filter(id=upload_id, user=req.user).first()
+    if upload is None:
+        return JsonResponse({'error': "This upload does not exist."}, status=404)
+    if upload.received_bytes != upload.size_bytes:
+        return JsonResponse({'error': "The upload is not complete.", **upload_status(upload)}, status=409)
+    if not storage_of(req.user).upload_permission(upload.size_bytes, upload):
+        return JsonResponse({'error': "Your storage is used up."}, status=403)
+    paper = assemble(upload)
+    return JsonResponse({'paper': paper.id})
+
+
+@permission_required("library.add_paper", login_url="/library?message=No permission.&color=danger")
+@csrf_exempt
+@require_POST
+def abort_upload(req, upload_id):
+    Upload.objects.filter(id=upload_id, user=req.user).delete()
+    return JsonResponse({})
+
+
 @csrf_exempt
 @require_POST
 @permission_required("library.delete_paper", login_url="/library?message=No permission to delete papers.&color=danger")
@@ -0,0 +1,21 @@
+# Generated by Django 4.0.4 on 2026-10-19 17:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('paypal', '0004_auto_20210907_2337'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='subscription',
+            index=models.Index(fields=['user', 'expired_time'], name='paypal_subs_user_id_bf8f70_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['created_user', 'created_time'], name='paypal_tran_created_994fa2_idx'),
+        ),
+    ]
@@ -32,6 +32,9 @@ class Subscription(models.Model):
     plan = models.ForeignKey(Plan, models.RESTRICT)
     expired_time = models.DateTimeField()
 
+    class Meta:
+        indexes = [models.Index(fields=['user', 'expired_time'])]
+
     def expired(self):
         return self.expired_time < now()
 
@@ -45,6 +48,9 @@ class Transaction(models.Model):
     token = models.CharField(max_length=32)
     paid = models.BooleanField()
 
+    class Meta:
+        indexes = [models.Index(fields=['created_user', 'created_time'])]
+
 
 class LockedGroup(models.Model):
     group = models.OneToOneField(Group, models.CASCADE)
@@ -7,6 +7,7 @@ from .models import *
 from django.contrib.auth.decorators import permission_required
 from datetime import timedelta
 from django.conf import settings
+from task_manager.queries import KeysetPage
 
 
 def view_plans(req):
@@ -69,7 +70,8 @@ def add_transaction(req):
 def view_transaction(req):
     context = {
         'timezone': settings.TIME_ZONE,
-        'transactions': Transaction.objects.filter(created_user=req.user).order_by('-created_time'),
+        'transactions': KeysetPage(req, Transaction.objects.filter(created_user=req.user).select_related('plan'),
+                                   ['-created_time']),
     }
     return render(req, 'paypal/transaction.html', context)
 
@@ -81,7 +83,8 @@ def view_transaction(req):
 def view_subscription(req):
     context = {
         'timezone': settings.TIME_ZONE,
-        'subscriptions': Subscription.objects.filter(user=req.user).order_by('-expired_time'),
+        'subscriptions': KeysetPage(req, Subscription.objects.filter(user=req.user).select_related('plan'),
+                                    ['-expired_time']),
     }
     return render(req, 'paypal/subscription.html', context)
 
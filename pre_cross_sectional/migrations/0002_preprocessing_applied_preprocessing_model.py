@@ -0,0 +1,25 @@
+# Generated by Django 4.0.4 on 2026-10-19 17:15
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0003_alter_paper_name'),
+        ('pre_cross_sectional', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='preprocessing',
+            name='applied',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='csp_applied', to='library.paper'),
+        ),
+        migrations.AddField(
+            model_name='preprocessing',
+            name='model',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='csp_model', to='library.paper'),
+        ),
+    ]
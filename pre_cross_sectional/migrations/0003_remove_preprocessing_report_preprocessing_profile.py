@@ -0,0 +1,60 @@
+# Generated by Django 4.0.4 on 2026-10-19 17:18
+
+from django.core.files.base import ContentFile
+from django.db import migrations, models
+import django.db.models.deletion
+
+from library.models import name_grams
+
+
+def store_reports(apps, schema_editor):
+    """Save each generated report as a result paper of the task's owner, and link it as the profile."""
+    Paper = apps.get_model('library', 'Paper')
+    PreProcessing = apps.get_model('pre_cross_sectional', 'PreProcessing')
+    fields = {field.name for field in Paper._meta.get_fields()}
+    for csp in PreProcessing.objects.exclude(report='').exclude(step=None).select_related('step__task'):
+        name = f"Cross-sectional Data Pre-processing #{csp.id} Profile"
+        paper = Paper(user_id=csp.step.task.user_id, role=4, name=name)
+        # Sizes and name grams are filled by the library migrations if they run after this one.
+        if 'size_bytes' in fields:
+            paper.size_bytes = len(csp.report.encode('utf-8'))
+        paper.file.save(f"csp_{csp.id}_profile.html", ContentFile(csp.report.encode('utf-8')))
+        if 'papernamegram' in fields:
+            PaperNameGram = apps.get_model('library', 'PaperNameGram')
+            PaperNameGram.objects.bulk_create(
+                [PaperNameGram(paper_id=paper.id, user_id=paper.user_id, gram=gram) for gram in name_grams(paper.name)]
+            )
+        csp.profile = paper
+        csp.save(update_fields=['profile'])
+
+
+def load_reports(apps, schema_editor):
+    PreProcessing = apps.get_model('pre_cross_sectional', 'PreProcessing')
+    for csp in PreProcessing.objects.exclude(profile=None).select_related('profile'):
+        try:
+            with csp.profile.file.open('rb') as f:
+                csp.report = f.read().decode('utf-8')
+        except OSError:
+            continue
+        csp.save(update_fields=['report'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0004_schema'),
+        ('pre_cross_sectional', '0002_preprocessing_applied_preprocessing_model'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='preprocessing',
+            name='profile',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='csp_profile', to='library.paper'),
+        ),
+        migrations.RunPython(store_reports, load_reports),
+        migrations.RemoveField(
+            model_name='preprocessing',
+            name='report',
+        ),
+    ]
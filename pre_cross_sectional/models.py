@@ -5,7 +5,9 @@ from library.models import Paper
 
 class PreProcessing(models.Model):
     step = models.ForeignKey(Step, models.CASCADE, blank=True, null=True)
-    report = models.TextField(blank=True)
+    profile = models.ForeignKey(Paper, models.SET_NULL, blank=True, null=True, related_name="csp_profile")
+    model = models.ForeignKey(Paper, models.SET_NULL, blank=True, null=True, related_name="csp_model")
+    applied = models.ForeignKey(Paper, models.SET_NULL, blank=True, null=True, related_name="csp_applied")
 
     def dataframe(self): return self.step.predicted_data
 
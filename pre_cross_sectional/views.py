@@ -1,18 +1,20 @@
-import pickle
-
 import numpy as np
 import pandas as pd
 from django import forms
 from django.contrib.auth.decorators import permission_required
 from django.core.files.base import ContentFile
-from django.http import HttpResponse
+from django.db import transaction
+from django.http import FileResponse
 from django.shortcuts import render, redirect
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST
 from pandas_profiling import ProfileReport
-from sklearn.preprocessing import OneHotEncoder
+from scipy import sparse
 
 import task_manager.views
+from library.models import load_schema
+from library.serialization import dump_paper, load_paper, rewrite_paper
+from task_manager.columns import add_columns, replace_columns
 from task_manager.models import OpenedTask
 from .models import *
 from .safe_math import safe_eval
@@ -26,7 +28,40 @@ class PublicAlgorithm(forms.Form):
 
 
 class Profile(PublicAlgorithm):
-    pass
+    mode = forms.ChoiceField(
+        choices=(
+            ('minimal', 'Minimal: data type, missing values and basic statistics of each column'),
+            ('sampled', 'Sampled: full profile of randomly sampled rows'),
+            ('full', 'Full: full profile of all rows (slow for large tables)'),
+        ),
+        initial='sampled',
+        widget=forms.Select({"class": "form-select"}),
+    )
+    max_rows = forms.IntegerField(
+        min_value=100, initial=10000, widget=forms.NumberInput({"class": "form-control"}),
+        help_text="The maximum number of rows profiled in sampled mode."
+    )
+    max_correlation_columns = forms.IntegerField(
+        min_value=0, initial=30, widget=forms.NumberInput({"class": "form-control"}),
+        help_text="Correlations are skipped if the dataset has more columns than this."
+    )
+
+
+def render_profile(config: forms.Form, paper: Paper, title: str) -> str:
+    if config.cleaned_data['mode'] == 'minimal':
+        # Column statistics are reused from the schema cache if the dataset hasn't changed.
+        columns = load_schema(paper)
+        table = pd.DataFrame(columns).set_index('name').to_html(na_rep='')
+        return f"<html><head><title>{title}</title></head><body><h1>{title}</h1>{table}</body></html>"
+    dataframe = load_paper(paper)
+    if config.cleaned_data['mode'] == 'sampled' and dataframe.shape[0] > config.cleaned_data['max_rows']:
+        dataframe = dataframe.sample(n=config.cleaned_data['max_rows'], random_state=0)
+        title += f" (sampled {config.cleaned_data['max_rows']} rows)"
+    kwargs = {}
+    if dataframe.shape[1] > config.cleaned_data['max_correlation_columns']:
+        kwargs['correlations'] = None
+    profile = ProfileReport(dataframe, title=title, plot={"dpi": 200, "image_format": "png"}, **kwargs)
+    return profile.to_html()
 
 
 @permission_required("pre_cross_sectional.add_preprocessing",
@@ -70,19 +105,24 @@ def generate_profile(req):
         context = {"color": "danger", "content": "Please parse a dataset first."}
         return render(req, "task_manager/hint_widget.html", context)
     step.status = 2
-    step.save()
+    step.save(update_fields=['status'])
     try:
-        dataframe = pd.read_pickle(step.predicted_data.file.path)
-        profile = ProfileReport(dataframe, title=f"Pre-processing Cross-sectional Data #{csp.id}",
-                                plot={"dpi": 200, "image_format": "png"})
-        csp.report = profile.to_html()
+        report = render_profile(profile_sheet, step.predicted_data, f"Pre-processing Cross-sectional Data #{csp.id}")
+        new_paper = Paper(user=req.user, role=4, name=f"Cross-sectional Data Pre-processing #{csp.id} Profile")
+        new_paper.file.save(f"csp_{csp.id}_profile.html", ContentFile(report.encode('utf-8')))
+        new_paper.save()
+        if csp.profile:
+            csp.profile.delete()
+        csp.profile = new_paper
         csp.save()
     except Exception as e:
         step.status = 4
         step.error_message = str(e)
-        step.save()
+        step.save(update_fields=['status', 'error_message'])
+        context = {"color": "danger", "content": "Interrupted.", "refresh": f"/pre_cross_sectional/{csp.id}"}
+        return render(req, "task_manager/hint_widget.html", context)
     step.status = 3
-    step.save()
+    step.save(update_fields=['status'])
     context = {"color": "success", "content": "Generate the profile successfully."}
     return render(req, "task_manager/hint_widget.html", context)
 
@@ -98,7 +138,9 @@ def view_profile(req, algo_id):
     if not algorithm_.step.open_permission(req.user):
         return redirect("/task/retrieve?message=You don't have access to this algorithm.&color=danger")
     # ---------- Algorithm Ownership Navigator END   ----------
-    return HttpResponse(algorithm_.report)
+    if not algorithm_.profile:
+        return redirect(f"/pre_cross_sectional/{algo_id}?message=Please generate the profile first.&color=warning")
+    return FileResponse(algorithm_.profile.file)
 
 
 @permission_required("pre_cross_sectional.change_preprocessing")
@@ -115,29 +157,31 @@ def import_data(req):
     algorithm_ = PreProcessing.objects.get(step=step)
     try:
         # ---------- Asynchronous Algorithm START   ----------
-        intermediate_paper_handle = ContentFile(pickle.dumps(table))
+        intermediate_paper_handle = dump_paper(table, 2)
         new_paper = Paper(user=req.user, role=2, name=f"Cross-sectional Data Pre-processing #{algorithm_.id} Parsed Data")
-        new_paper.file.save(f"csp_{algorithm_.id}_parsed_data.pkl", intermediate_paper_handle)
+        new_paper.file.save(f"csp_{algorithm_.id}_parsed_data.joblib", intermediate_paper_handle)
         new_paper.save()
         # step.linked_data = new_paper
         step.predicted_data = new_paper
-        step.save()
-        for column in Column.objects.filter(algorithm=algorithm_):
-            column.delete()
-        for col in table.columns:
-            new_column = Column(algorithm=algorithm_, name=col)
-            new_column.save()
+        step.save(update_fields=['predicted_data'])
+        # The recipe was fitted on the previous dataset.
+        for paper in [algorithm_.model, algorithm_.applied]:
+            if paper:
+                paper.delete()
+        algorithm_.model = None
+        algorithm_.applied = None
+        replace_columns(Column, algorithm_, table.columns)
     except Exception as e:
         step.status = 4
         step.error_message = str(e)
-        step.save()
+        step.save(update_fields=['status', 'error_message'])
         context = {"color": "danger", "content": "Interrupted.",
                    "refresh": f"/pre_cross_sectional/{algorithm_.id}"}
         return render(req, "task_manager/hint_widget.html", context)
     # ---------- Asynchronous Algorithm START   ----------
     algorithm_.save()
     step.status = 3
-    step.save()
+    step.save(update_fields=['status'])
     context = {"color": "success", "content": "The file is successfully parsed.",
                "refresh": f"/pre_cross_sectional/{algorithm_.id}"}
     return render(req, "task_manager/hint_widget.html", context)
@@ -159,13 +203,16 @@ class DropColumns(PublicPreProcessing):
     pass
 
 
-def pandas_drop_column(config: forms.Form, dataframe: pd.DataFrame) -> pd.DataFrame:
-    dataframe.drop(
-        columns=[x.name for x in config.cleaned_data['targeted_columns']],
-        inplace=True,
-    )
-    config.cleaned_data['targeted_columns'].delete()
-    return dataframe
+def pandas_drop_column(config: forms.Form, dataframe: pd.DataFrame) -> dict:
+    return {"columns": [x.name for x in config.cleaned_data['targeted_columns']]}
+
+
+def replay_drop_column(recipe: dict, dataframe: pd.DataFrame) -> pd.DataFrame:
+    return dataframe.drop(columns=recipe['columns'])
+
+
+def dropped_columns(recipe: dict) -> list:
+    return recipe['columns']
 
 
 class FillNa(PublicPreProcessing):
@@ -194,11 +241,10 @@ class FillNa(PublicPreProcessing):
     constant = forms.FloatField(widget=forms.NumberInput({"class": "form-control"}), required=False)
 
 
-def pandas_fill_na(config: forms.Form, dataframe: pd.DataFrame) -> pd.DataFrame:
+def pandas_fill_na(config: forms.Form, dataframe: pd.DataFrame) -> dict:
     columns = [x.name for x in config.cleaned_data['targeted_columns']]
-    if config.cleaned_data['method']:
-        dataframe[columns] = dataframe[columns].fillna(method=config.cleaned_data['method'], axis=0)
-    else:
+    recipe = {"columns": columns, "method": config.cleaned_data['method'] or None}
+    if not recipe['method']:
         if config.cleaned_data['quick_constant'] == 'average':
             na_value = dataframe[columns].mean(axis=0).to_dict()
         elif config.cleaned_data['quick_constant'] == 'average-95':
@@ -219,7 +265,16 @@ def pandas_fill_na(config: forms.Form, dataframe: pd.DataFrame) -> pd.DataFrame:
             na_value = dataframe[columns].max(axis=0).to_dict()
         else:
             na_value = config.cleaned_data['constant'] or 0
-        dataframe[columns] = dataframe[columns].fillna(value=na_value)
+        recipe['value'] = na_value
+    return recipe
+
+
+def replay_fill_na(recipe: dict, dataframe: pd.DataFrame) -> pd.DataFrame:
+    columns = recipe['columns']
+    if recipe['method']:
+        dataframe[columns] = dataframe[columns].fillna(method=recipe['method'], axis=0)
+    else:
+        dataframe[columns] = dataframe[columns].fillna(value=recipe['value'])
     return dataframe
 
 
@@ -260,24 +315,34 @@ class Cast(PublicPreProcessing):
     )
 
 
-def pandas_cast(config: forms.Form, dataframe: pd.DataFrame) -> pd.DataFrame:
-    columns = [x.name for x in config.cleaned_data['targeted_columns']]
-    if config.cleaned_data['data_type'] == 'numerical':
+def pandas_cast(config: forms.Form, dataframe: pd.DataFrame) -> dict:
+    return {
+        "columns": [x.name for x in config.cleaned_data['targeted_columns']],
+        "data_type": config.cleaned_data['data_type'],
+        "datetime_format": config.cleaned_data['datetime_format'],
+        "datetime_combined_from_multiple_columns": config.cleaned_data['datetime_combined_from_multiple_columns'],
+        "datetime_duration_unit": config.cleaned_data['datetime_duration_unit'],
+    }
+
+
+def replay_cast(recipe: dict, dataframe: pd.DataFrame) -> pd.DataFrame:
+    columns = recipe['columns']
+    if recipe['data_type'] == 'numerical':
         for col in columns:
             dataframe[col] = pd.to_numeric(dataframe[col])
-    elif config.cleaned_data['data_type'] == 'datetime':
-        if config.cleaned_data['datetime_combined_from_multiple_columns']:
+    elif recipe['data_type'] == 'datetime':
+        if recipe['datetime_combined_from_multiple_columns']:
             dataframe = pd.to_datetime \
-                (dataframe, format=config.cleaned_data['datetime_format'], infer_datetime_format=True)
+                (dataframe, format=recipe['datetime_format'], infer_datetime_format=True)
         else:
             for col in columns:
                 dataframe[col] = pd.to_datetime \
-                    (dataframe[col], format=config.cleaned_data['datetime_format'], infer_datetime_format=True)
-    elif config.cleaned_data['data_type'] == 'timedelta':
+                    (dataframe[col], format=recipe['datetime_format'], infer_datetime_format=True)
+    elif recipe['data_type'] == 'timedelta':
         for col in columns:
-            dataframe[col] = pd.to_timedelta(dataframe[col], unit=config.cleaned_data['datetime_duration_unit'])
+            dataframe[col] = pd.to_timedelta(dataframe[col], unit=recipe['datetime_duration_unit'])
     else:
-        dataframe = dataframe.astype({col: config.cleaned_data['data_type'] for col in columns})
+        dataframe = dataframe.astype({col: recipe['data_type'] for col in columns})
     return dataframe
 
 
@@ -289,28 +354,51 @@ class Encode(PublicPreProcessing):
     )
 
 
-def sklearn_encode(config: forms.Form, dataframe: pd.DataFrame) -> pd.DataFrame:
+def sklearn_encode(config: forms.Form, dataframe: pd.DataFrame) -> dict:
     columns = [x.name for x in config.cleaned_data['targeted_columns']]
+    recipe = {"columns": columns, "method": config.cleaned_data['method']}
     if config.cleaned_data['method'] == 'o':
-        this_algorithm = config.cleaned_data['targeted_columns'].first().algorithm
-        oh = OneHotEncoder()
-        for col in columns:
-            oh_matrix = oh.fit_transform(dataframe[[col]])
-            categories = [f"{col}/{col_}" for col_ in oh.categories_[0]]
-            oh_frame = pd.DataFrame(data=oh_matrix.toarray(), columns=categories)
-            dataframe = pd.concat([dataframe, oh_frame], axis=1, join='inner')
-            for col_ in categories:
-                new_column = Column(algorithm=this_algorithm, name=col_)
-                new_column.save()
+        recipe['categories'] = {col: list(pd.Categorical(dataframe[col]).categories) for col in columns}
     elif config.cleaned_data['method'] == 't':
+        recipe['frequency'] = {}
         for col in columns:
-            content, frequency = np.unique(dataframe[col], return_counts=True)
-            frequency = frequency / max(dataframe.shape[0], 1)
-            content = dict(zip(content, frequency))
-            dataframe[col] = dataframe[col].apply(lambda x: content[x], convert_dtype='float32')
+            frequency = dataframe[col].value_counts(sort=False) / max(dataframe.shape[0], 1)
+            recipe['frequency'][col] = frequency.to_dict()
+    return recipe
+
+
+def replay_encode(recipe: dict, dataframe: pd.DataFrame) -> pd.DataFrame:
+    if recipe['method'] == 'o':
+        # All one-hot columns are built as one sparse block; categories unseen in the training data are encoded as
+        # all-zero rows.
+        n = dataframe.shape[0]
+        blocks, names = [], []
+        for col in recipe['columns']:
+            codes = pd.Index(recipe['categories'][col]).get_indexer(dataframe[col])
+            rows = np.flatnonzero(codes >= 0)
+            blocks.append(sparse.csr_matrix(
+                (np.ones(rows.shape[0], dtype=np.uint8), (rows, codes[rows])),
+                shape=(n, len(recipe['categories'][col])),
+            ))
+            names += [f"{col}/{col_}" for col_ in recipe['categories'][col]]
+        oh_frame = pd.DataFrame.sparse.from_spmatrix(sparse.hstack(blocks, format='csr'), index=dataframe.index,
+                                                     columns=names)
+        dataframe = pd.concat([dataframe, oh_frame], axis=1)
+    elif recipe['method'] == 't':
+        for col in recipe['columns']:
+            # The last element is the frequency of categories unseen in the training data.
+            content = pd.Index(recipe['frequency'][col].keys())
+            frequency = np.append(np.fromiter(recipe['frequency'][col].values(), dtype='float32'), 0)
+            dataframe[col] = frequency[content.get_indexer(dataframe[col])]
     return dataframe
 
 
+def encoded_columns(recipe: dict) -> list:
+    if recipe['method'] == 'o':
+        return [f"{col}/{col_}" for col in recipe['columns'] for col_ in recipe['categories'][col]]
+    return []
+
+
 class MathOp(PublicPreProcessing):
     new_name = forms.CharField(
         widget=forms.TextInput({'class': 'form-control'}),
@@ -324,24 +412,44 @@ class MathOp(PublicPreProcessing):
     )
 
 
-def math_op(config: forms.Form, dataframe: pd.DataFrame) -> pd.DataFrame:
-    columns = [x.name for x in config.cleaned_data['targeted_columns']]
-    dataframe[config.cleaned_data['new_name']] = dataframe[columns].apply(
-        lambda x: safe_eval(config.cleaned_data['expression'], x.values))
-    new_column = Column(algorithm=config.cleaned_data['algorithm'], name=config.cleaned_data['new_name'])
-    new_column.save()
+def math_op(config: forms.Form, dataframe: pd.DataFrame) -> dict:
+    return {
+        "columns": [x.name for x in config.cleaned_data['targeted_columns']],
+        "new_name": config.cleaned_data['new_name'],
+        "expression": config.cleaned_data['expression'],
+    }
+
+
+def replay_math_op(recipe: dict, dataframe: pd.DataFrame) -> pd.DataFrame:
+    dataframe[recipe['new_name']] = dataframe[recipe['columns']].apply(
+        lambda x: safe_eval(recipe['expression'], x.values))
     return dataframe
 
 
+def math_op_columns(recipe: dict) -> list:
+    return [recipe['new_name']]
+
+
+# "function" fits an operation on the parsed dataset and returns its recipe (fill values, vocabularies, etc.);
+# "replay" applies a recipe to any dataset with the same columns; "new_columns" and "removed_columns" (optional) list
+# the columns that the recipe adds and removes. Columns of the algorithm are only changed by them, after the dataset is
+# rewritten successfully, so that they always match the stored dataset.
 preprocessing_wrapper_menu = {
-    "drop_column": {"form": DropColumns, "function": pandas_drop_column},
-    "fill_na": {"form": FillNa, "function": pandas_fill_na},
-    "cast": {"form": Cast, "function": pandas_cast},
-    "encode": {"form": Encode, "function": sklearn_encode},
-    "math_op": {"form": MathOp, "function": math_op},
+    "drop_column": {"form": DropColumns, "function": pandas_drop_column, "replay": replay_drop_column,
+                    "removed_columns": dropped_columns},
+    "fill_na": {"form": FillNa, "function": pandas_fill_na, "replay": replay_fill_na},
+    "cast": {"form": Cast, "function": pandas_cast, "replay": replay_cast},
+    "encode": {"form": Encode, "function": sklearn_encode, "replay": replay_encode, "new_columns": encoded_columns},
+    "math_op": {"form": MathOp, "function": math_op, "replay": replay_math_op, "new_columns": math_op_columns},
 }
 
 
+def replay_recipe(recipe: list, dataframe: pd.DataFrame) -> pd.DataFrame:
+    for operation in recipe:
+        dataframe = preprocessing_wrapper_menu[operation['operation']]['replay'](operation, dataframe)
+    return dataframe
+
+
 @permission_required("pre_cross_sectional.view_preprocessing",
                      login_url="/task/retrieve?message=You don't have permission to view this algorithm.&color=danger")
 def view_csp(req, algo_id):
@@ -360,6 +468,7 @@ def view_csp(req, algo_id):
         "search_data": task_manager.views.display_data_picker(algorithm_.step),
         "import_data_target": '/pre_cross_sectional/import',
         "profile": profile_sheet,
+        "apply_data": task_manager.views.display_data_picker(algorithm_.step),
     }
     for form_name, form_config in preprocessing_wrapper_menu.items():
         preprocessing_sheet = preprocessing_wrapper_menu[form_name]['form']()
@@ -392,21 +501,87 @@ def preprocessing_wrapper(req, form_name):
         context = {"color": "danger", "content": "This instance doesn't contain data and variables."}
         return render(req, "task_manager/hint_widget.html", context)
     step.status = 2
-    step.save()
+    step.save(update_fields=['status'])
     try:
         # ---------- Asynchronous Algorithm START ----------
-        dataframe = pd.read_pickle(step.predicted_data.file.path)
-        dataframe = preprocessing_wrapper_menu[form_name]['function'](preprocessing_form, dataframe)
-        dataframe.to_pickle(step.predicted_data.file.path)
+        dataframe = load_paper(step.predicted_data)
+        recipe = preprocessing_wrapper_menu[form_name]['function'](preprocessing_form, dataframe)
+        dataframe = preprocessing_wrapper_menu[form_name]['replay'](recipe, dataframe)
+        rewrite_paper(step.predicted_data, dataframe)
+        recipe['operation'] = form_name
+        if csp.model:
+            full_recipe = load_paper(csp.model)
+            full_recipe.append(recipe)
+            rewrite_paper(csp.model, full_recipe)
+        else:
+            intermediate_paper_handle = dump_paper([recipe], 3)
+            new_model = Paper(user=req.user, role=3, name=f"Cross-sectional Data Pre-processing #{csp.id} Recipe")
+            new_model.file.save(f"csp_{csp.id}_recipe.joblib", intermediate_paper_handle)
+            new_model.save()
+            csp.model = new_model
+            csp.save()
+        operation = preprocessing_wrapper_menu[form_name]
+        with transaction.atomic():
+            if 'removed_columns' in operation:
+                Column.objects.filter(algorithm=csp, name__in=operation['removed_columns'](recipe)).delete()
+            if 'new_columns' in operation:
+                add_columns(Column, csp, operation['new_columns'](recipe))
         # ---------- Asynchronous Algorithm END   ----------
     except Exception as e:
         step.status = 4
         step.error_message = str(e)
-        step.save()
+        step.save(update_fields=['status', 'error_message'])
         context = {"color": "danger", "content": "Interrupted.", "refresh": f"/pre_cross_sectional/{csp.id}"}
         return render(req, "task_manager/hint_widget.html", context)
     step.status = 3
-    step.save()
+    step.save(update_fields=['status'])
     context = {"color": "success", "content": "The dataset has been updated.",
                "refresh": f"/pre_cross_sectional/{csp.id}"}
     return render(req, "task_manager/hint_widget.html", context)
+
+
+@permission_required("pre_cross_sectional.change_preprocessing",
+                     login_url="/task/retrieve?message=You don't have permission to change this algorithm.&color=danger")
+@csrf_exempt
+@require_POST
+def apply_recipe(req):
+    # ---------- Import Data Tool V2 START ----------
+    table, step, error_message = task_manager.views.import_predicting_set_v2(req)
+    if table is None:
+        context = {'color': 'danger', 'content': error_message}
+        return render(req, 'task_manager/hint_widget.html', context)
+    # ---------- Import Data Tool V2 END   ----------
+    algorithm_ = PreProcessing.objects.get(step=step)
+    if not algorithm_.model:
+        context = {"color": "danger", "content": "This step doesn't have any pre-processing operation to apply."}
+        return render(req, "task_manager/hint_widget.html", context)
+    if step.status == 2:
+        context = {"color": "warning", "content": "Cannot start because this algorithm is busy."}
+        return render(req, "task_manager/hint_widget.html", context)
+    step.status = 2
+    step.save(update_fields=['status'])
+    try:
+        # ---------- Asynchronous Algorithm START ----------
+        recipe = load_paper(algorithm_.model)
+        table = replay_recipe(recipe, table)
+        intermediate_paper_handle = dump_paper(table, 2)
+        new_paper = Paper(user=req.user, role=2,
+                          name=f"Cross-sectional Data Pre-processing #{algorithm_.id} Applied Data")
+        new_paper.file.save(f"csp_{algorithm_.id}_applied_data.joblib", intermediate_paper_handle)
+        new_paper.save()
+        if algorithm_.applied:
+            algorithm_.applied.delete()
+        algorithm_.applied = new_paper
+        algorithm_.save()
+        # ---------- Asynchronous Algorithm END   ----------
+    except Exception as e:
+        step.status = 4
+        step.error_message = str(e)
+        step.save(update_fields=['status', 'error_message'])
+        context = {"color": "danger", "content": "Interrupted.", "refresh": f"/pre_cross_sectional/{algorithm_.id}"}
+        return render(req, "task_manager/hint_widget.html", context)
+    step.status = 3
+    step.save(update_fields=['status'])
+    context = {"color": "success", "content": "The recipe has been applied.",
+               "refresh": f"/pre_cross_sectional/{algorithm_.id}"}
+    return render(req, "task_manager/hint_widget.html", context)
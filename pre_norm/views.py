@@ -1,16 +1,16 @@
 import io
-import pickle
 
 import pandas as pd
 from django import forms
 from django.contrib.auth.decorators import permission_required
-from django.core.files.base import ContentFile
 from django.shortcuts import render, redirect
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST
 from sklearn.preprocessing import StandardScaler, MinMaxScaler
 
+from library.serialization import dump_paper, load_paper
 import task_manager.views
+from task_manager.columns import flag_columns, replace_columns
 from task_manager.models import OpenedTask
 from .models import *
 
@@ -54,26 +54,22 @@ def import_data(req):
     # ---------- Import Data Tool V2 END   ----------
     algorithm_ = Normalization.objects.get(step=step)
     try:
-        intermediate_paper_handle = ContentFile(pickle.dumps(table))
+        intermediate_paper_handle = dump_paper(table, 2)
         new_paper = Paper(user=req.user, role=2, name=f"Normalization #{algorithm_.id} Parsed Data")
-        new_paper.file.save(f"norm_{algorithm_.id}_parsed_data.pkl", intermediate_paper_handle)
+        new_paper.file.save(f"norm_{algorithm_.id}_parsed_data.joblib", intermediate_paper_handle)
         new_paper.save()
         algorithm_.dataframe = new_paper
         algorithm_.save()
-        for column in Column.objects.filter(algorithm=algorithm_):
-            column.delete()
-        for col in table.columns:
-            new_column = Column(algorithm=algorithm_, name=col)
-            new_column.save()
+        replace_columns(Column, algorithm_, table.columns)
     except Exception as e:
         step.status = 4
         step.error_message = str(e)
-        step.save()
+        step.save(update_fields=['status', 'error_message'])
         context = {"color": "danger", "content": "Interrupted.", "refresh": f"/pre_norm/{algorithm_.id}"}
         return render(req, "task_manager/hint_widget.html", context)
     # ---------- Asynchronous Algorithm END   ----------
     step.status = 3
-    step.save()
+    step.save(update_fields=['status'])
     context = {"color": "success", "content": "The file is successfully parsed.",
                "refresh": f"/pre_norm/{algorithm_.id}"}
     return render(req, "task_manager/hint_widget.html", context)
@@ -133,26 +129,23 @@ def train(req):
         context = {"color": "warning", "content": "Cannot start because this algorithm is busy."}
         return render(req, "task_manager/hint_widget.html", context)
     step.status = 2
-    step.save()
+    step.save(update_fields=['status'])
     op = StandardScaler() if config.cleaned_data['method'] == 'S' else MinMaxScaler()
-    columns = []
-    for c_model in config.cleaned_data['columns']:
-        c_model.x = True
-        columns.append(c_model.name)
-        c_model.save()
+    columns = [x.name for x in config.cleaned_data['columns']]
+    flag_columns(Column, algorithm_, x=config.cleaned_data['columns'])
     try:
         # ---------- Asynchronous Algorithm START ----------
-        dataframe = pd.read_pickle(algorithm_.dataframe.file.path)
+        dataframe = load_paper(algorithm_.dataframe)
         dataframe[columns] = op.fit_transform(dataframe[columns])
 
-        intermediate_paper_handle = ContentFile(pickle.dumps(dataframe))
+        intermediate_paper_handle = dump_paper(dataframe, 4)
         new_predict = Paper(user=req.user, role=4, name=f"Normalization #{algorithm_.id} Transformed")
-        new_predict.file.save(f"norm_{algorithm_.id}_transformed.pkl", intermediate_paper_handle)
+        new_predict.file.save(f"norm_{algorithm_.id}_transformed.joblib", intermediate_paper_handle)
         new_predict.save()
 
-        intermediate_paper_handle = ContentFile(pickle.dumps(op))
+        intermediate_paper_handle = dump_paper(op, 3)
         new_model = Paper(user=req.user, role=3, name=f"Normalization #{algorithm_.id} Model")
-        new_model.file.save(f"norm_{algorithm_.id}_model.pkl", intermediate_paper_handle)
+        new_model.file.save(f"norm_{algorithm_.id}_model.joblib", intermediate_paper_handle)
         new_model.save()
         algorithm_.transformed = new_predict
         algorithm_.model = new_model
@@ -160,13 +153,13 @@ def train(req):
         # ---------- Asynchronous Algorithm END   ----------
     except Exception as e:
         step.status = 4
-        step.save()
+        step.save(update_fields=['status'])
         algorithm_.error_message = str(e)
         algorithm_.save()
         context = {"color": "danger", "content": "Interrupted.", "refresh": f"/pre_norm/{algorithm_.id}"}
         return render(req, "task_manager/hint_widget.html", context)
     step.status = 3
-    step.save()
+    step.save(update_fields=['status'])
     context = {"color": "success", "content": "The file is successfully parsed.",
                "refresh": f"/pre_norm/{algorithm_.id}"}
     return render(req, "task_manager/hint_widget.html", context)
@@ -208,10 +201,9 @@ def transform(req):
         context = {"color": "danger", "content": "This step doesn't have a trained model."}
         return render(req, "task_manager/hint_widget.html", context)
     step.status = 2
-    step.save()
+    step.save(update_fields=['status'])
     try:
-        with open(algorithm_.model.file.path, "rb") as f:
-            model = pickle.load(f)
+        model = load_paper(algorithm_.model)
         x_col = [x.name for x in Column.objects.filter(algorithm=algorithm_, x=True)]
         table[x_col] = model.transform(table[x_col])
         table_bin = io.BytesIO()
@@ -225,7 +217,7 @@ def transform(req):
     new_paper.save()
     step.predicted_data = new_paper
     step.status = 3
-    step.save()
+    step.save(update_fields=['predicted_data', 'status'])
     context = {"color": "success", "content": "Prediction completed.", "refresh": f"/pre_norm/{algorithm_.id}"}
     return render(req, "task_manager/hint_widget.html", context=context)
 
@@ -247,10 +239,9 @@ def inverse_transform(req):
         context = {"color": "danger", "content": "This step doesn't have a trained model."}
         return render(req, "task_manager/hint_widget.html", context)
     step.status = 2
-    step.save()
+    step.save(update_fields=['status'])
     try:
-        with open(algorithm_.model.file.path, "rb") as f:
-            model = pickle.load(f)
+        model = load_paper(algorithm_.model)
         x_col = [x.name for x in Column.objects.filter(algorithm=algorithm_, x=True)]
         table[x_col] = model.inverse_transform(table[x_col])
         table_bin = io.BytesIO()
@@ -264,6 +255,6 @@ def inverse_transform(req):
     new_paper.save()
     step.predicted_data = new_paper
     step.status = 3
-    step.save()
+    step.save(update_fields=['predicted_data', 'status'])
     context = {"color": "success", "content": "Prediction completed.", "refresh": f"/pre_norm/{algorithm_.id}"}
     return render(req, "task_manager/hint_widget.html", context=context)
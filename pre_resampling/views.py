@@ -1,16 +1,15 @@
 import json
-import pickle
 
 import numpy as np
-import pandas as pd
 from django import forms
 from django.contrib.auth.decorators import permission_required
-from django.core.files.base import ContentFile
 from django.shortcuts import render, redirect
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST
 
+from library.serialization import dump_paper, load_paper
 import task_manager.views
+from task_manager.columns import flag_columns, replace_columns, unflag_columns
 from task_manager.models import OpenedTask
 from .models import *
 
@@ -105,28 +104,24 @@ def import_data(req):
     algorithm_ = Resampling.objects.get(step=step)
     try:
         # ---------- Asynchronous Algorithm START   ----------
-        intermediate_paper_handle = ContentFile(pickle.dumps(table))
+        intermediate_paper_handle = dump_paper(table, 2)
         new_paper = Paper(user=req.user, role=2,
                           name=f"Re-sampling #{algorithm_.id} Parsed Data")
-        new_paper.file.save(f"resampling_{algorithm_.id}_parsed_data.pkl", intermediate_paper_handle)
+        new_paper.file.save(f"resampling_{algorithm_.id}_parsed_data.joblib", intermediate_paper_handle)
         new_paper.save()
         algorithm_.dataframe = new_paper
         algorithm_.save()
-        for column in Column.objects.filter(algorithm=algorithm_):
-            column.delete()
-        for col in table.columns:
-            new_column = Column(algorithm=algorithm_, name=col)
-            new_column.save()
+        replace_columns(Column, algorithm_, table.columns)
         # ---------- Asynchronous Algorithm END   ----------
     except Exception as e:
         step.status = 4
         step.error_message = str(e)
-        step.save()
+        step.save(update_fields=['status', 'error_message'])
         context = {"color": "danger", "content": "Interrupted.",
                    "refresh": f"/pre_resampling/{algorithm_.id}"}
         return render(req, "task_manager/hint_widget.html", context)
     step.status = 3
-    step.save()
+    step.save(update_fields=['status'])
     context = {"color": "success", "content": "The file is successfully parsed.",
                "refresh": f"/pre_resampling/{algorithm_.id}"}
     return render(req, "task_manager/hint_widget.html", context)
@@ -148,10 +143,9 @@ def set_variables(req):
         return render(req, "task_manager/hint_widget.html", context)
     # ---------- Algorithm Ownership Validator v2 END   ----------
     column = variable_picker.cleaned_data['Dependent_Variable_Y']
-    column.y_column = True
-    column.save()
+    flag_columns(Column, algorithm_, y_column=[column])
     try:
-        dataframe = pd.read_pickle(algorithm_.dataframe.file.path)
+        dataframe = load_paper(algorithm_.dataframe)
         class_dict = {
             name: sub_df.shape[0]
             for name, sub_df in dataframe.groupby(column.name)
@@ -179,9 +173,7 @@ def clear_variables(req, algo_id):  # SPECIFIED
     # ---------- Algorithm Ownership Navigator END   ----------
     if algorithm_.step.status == 2:
         return redirect("/task/retrieve?message=Cannot start because this algorithm is busy.&color=warning")
-    for column in Column.objects.filter(algorithm=algorithm_, y_column=True):
-        column.y_column = False
-        column.save()
+    unflag_columns(Column, algorithm_, 'y_column')
     algorithm_.class_dict = str()
     algorithm_.save()
     return redirect(f"/pre_resampling/{algorithm_.id}")
@@ -205,10 +197,10 @@ def train_model(req):  # SPECIFIED
         context = {"color": "warning", "content": "Cannot start because this algorithm is busy."}
         return render(req, "task_manager/hint_widget.html", context)
     step.status = 2
-    step.save()
+    step.save(update_fields=['status'])
     try:
         # ---------- Asynchronous Algorithm START ----------
-        dataframe = pd.read_pickle(algorithm_.dataframe.file.path)
+        dataframe = load_paper(algorithm_.dataframe)
         y_col = Column.objects.get(algorithm=algorithm_, y_column=True).name
         samples_index = np.empty(shape=0, dtype=np.int32)
         for name, sub_df in dataframe.groupby(y_col):
@@ -216,21 +208,21 @@ def train_model(req):  # SPECIFIED
             samples_index = np.hstack([samples_index, sample_index])
         dataframe = dataframe.loc[samples_index, :]
 
-        intermediate_paper_handle = ContentFile(pickle.dumps(dataframe))
+        intermediate_paper_handle = dump_paper(dataframe, 4)
         new_paper = Paper(user=req.user, role=4, name=f'Re-sampling #{algorithm_.id} Predict')
-        new_paper.file.save(f'resampling_{algorithm_.id}_predict.pkl', intermediate_paper_handle)
+        new_paper.file.save(f'resampling_{algorithm_.id}_predict.joblib', intermediate_paper_handle)
         new_paper.save()
         step.predicted_data = new_paper
         # ---------- Asynchronous Algorithm END   ----------
     except Exception as e:
         step.status = 4
         step.error_message = str(e)
-        step.save()
+        step.save(update_fields=['predicted_data', 'status', 'error_message'])
         context = {"color": "danger", "content": "Interrupted.",
                    "refresh": f"/pre_resampling/{algorithm_.id}"}
         return render(req, "task_manager/hint_widget.html", context)
     step.status = 3
-    step.save()
+    step.save(update_fields=['predicted_data', 'status'])
     context = {"color": "success", "content": "The model has been trained and evaluated.",
                "refresh": f"/pre_resampling/{algorithm_.id}"}
     return render(req, "task_manager/hint_widget.html", context)
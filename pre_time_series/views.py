@@ -1,11 +1,9 @@
-import pickle
 import typing
 
 import numpy as np
 import pandas as pd
 from django import forms
 from django.contrib.auth.decorators import permission_required
-from django.core.files.base import ContentFile
 from django.core.validators import MinValueValidator
 from django.shortcuts import render, redirect
 from django.views.decorators.csrf import csrf_exempt
@@ -13,6 +11,9 @@ from django.views.decorators.http import require_POST
 from sklearn.preprocessing import MinMaxScaler
 
 import task_manager.views
+from task_manager.columns import add_columns, replace_columns, update_columns
+from library.models import search_papers
+from library.serialization import dump_paper, load_paper
 from task_manager.models import OpenedTask
 from .models import *
 
@@ -54,7 +55,7 @@ class DataPicker(forms.Form):
     paper = forms.ModelChoiceField(Paper.objects.all(), widget=forms.Select({'class': 'form-select'}), empty_label=None)
 
     def load_choices(self, user, search):
-        queryset = Paper.objects.filter(user=user, name__contains=search)
+        queryset = search_papers(user, search)
         self.fields['step'].queryset = Step.objects.filter(task__user=user, status__in=[1, 3, 4])
         self.fields['paper'].queryset = queryset
 
@@ -72,7 +73,7 @@ def import_data(req):
     step = data_picker.cleaned_data['step']
     paper = data_picker.cleaned_data['paper']
     step.linked_data = paper
-    step.save()
+    step.save(update_fields=['linked_data'])
     # ------------------------------------
 
     algorithm_ = TimeSeries.objects.get(step=step)
@@ -130,28 +131,23 @@ def select_sheet(req):
         context = {"color": "warning", "content": "Cannot start because this algorithm is busy."}
         return render(req, "task_manager/hint_widget.html", context)
     step.status = 2
-    step.save()
+    step.save(update_fields=['status'])
     try:
         # ---------- Asynchronous Algorithm START ----------
         for sheet in Sheet.objects.filter(algorithm=algorithm_):
             sheet.is_time_series = sheet == ss.cleaned_data['time_series_sheet']
             sheet.is_label = sheet == ss.cleaned_data['labels_sheet']
             sheet.save()
-        [c.delete() for c in Column.objects.filter(algorithm=algorithm_)]
         ts_sheet = pd.read_excel(step.linked_data.file.path, sheet_name=ss.cleaned_data['time_series_sheet'].name)
-        for column in ts_sheet.columns:
-            new_column = Column(algorithm=algorithm_, name=column)
-            new_column.save()
+        replace_columns(Column, algorithm_, ts_sheet.columns)
         if ss.cleaned_data['labels_sheet']:
             label_sheet = pd.read_excel(step.linked_data.file.path, sheet_name=ss.cleaned_data['labels_sheet'].name)
-            for column in label_sheet.columns:
-                new_column = Column(algorithm=algorithm_, name=column, belong_time_series=False)
-                new_column.save()
+            add_columns(Column, algorithm_, label_sheet.columns, belong_time_series=False)
         else:
             label_sheet = None
-        intermediate_paper_handle = ContentFile(pickle.dumps({'time_series': ts_sheet, 'labels': label_sheet}))
+        intermediate_paper_handle = dump_paper({'time_series': ts_sheet, 'labels': label_sheet}, 2)
         new_paper = Paper(user=req.user, role=2, name=f"Pre-processing Time Series #{algorithm_.id} Parsed Data")
-        new_paper.file.save(f"pre_ts_{algorithm_.id}_parsed_data.pkl", intermediate_paper_handle)
+        new_paper.file.save(f"pre_ts_{algorithm_.id}_parsed_data.joblib", intermediate_paper_handle)
         new_paper.save()
         algorithm_.dataframe = new_paper
         algorithm_.save()
@@ -159,11 +155,11 @@ def select_sheet(req):
     except Exception as e:
         step.status = 4
         step.error_message = str(e)
-        step.save()
+        step.save(update_fields=['status', 'error_message'])
         context = {"color": "danger", "content": "Interrupted.", "refresh": f"/pre_ts/{algorithm_.id}"}
         return render(req, "task_manager/hint_widget.html", context)
     step.status = 3
-    step.save()
+    step.save(update_fields=['status'])
     context = {"color": "success", "content": "The sheets are successfully assigned.",
                "refresh": f"/pre_ts/{algorithm_.id}"}
     return render(req, "task_manager/hint_widget.html", context)
@@ -184,9 +180,9 @@ def clear_sheet(req, algo_id):
         return redirect("/task/retrieve?message=Cannot start because this algorithm is busy.&color=warning")
     algorithm_.dataframe = None
     algorithm_.save()
-    [column.delete() for column in Column.objects.filter(algorithm=algorithm_)]
+    Column.objects.filter(algorithm=algorithm_).delete()
     algorithm_.step.status = 1
-    algorithm_.step.save()
+    algorithm_.step.save(update_fields=['status'])
     return redirect(f"/pre_ts/{algorithm_.id}")
 
 
@@ -275,7 +271,7 @@ def clear_transform(req, algo_id):
     algorithm_.save()
     step.predicted_data = None
     step.status = 1
-    step.save()
+    step.save(update_fields=['predicted_data', 'status'])
     return redirect(f"/pre_ts/{algorithm_.id}")
 
 
@@ -300,30 +296,32 @@ def transform(req):
         context = {"color": "warning", "content": "Cannot start because this algorithm is busy."}
         return render(req, "task_manager/hint_widget.html", context)
     step.status = 2
-    step.save()
+    step.save(update_fields=['status'])
     try:
         # ---------- Asynchronous Algorithm START ----------
-        columns = algorithm_.column_set.all()
+        columns = list(algorithm_.column_set.all())
+        use, log, diff, fill_na_avg = [set(sc.cleaned_data[field]) for field in ['use', 'log', 'diff', 'fill_na_avg']]
         for column in columns:
             column.is_date = column == sc.cleaned_data['date']
             column.is_index = (column == sc.cleaned_data['company_trans']) or \
                               (column == sc.cleaned_data['company_score'])
             column.is_label = column == sc.cleaned_data['score']
-            column.use = column in sc.cleaned_data['use']
-            column.log = column in sc.cleaned_data['log']
-            column.diff = column in sc.cleaned_data['diff']
-            column.fill_na_avg = column in sc.cleaned_data['fill_na_avg']
-            column.save()
+            column.use = column in use
+            column.log = column in log
+            column.diff = column in diff
+            column.fill_na_avg = column in fill_na_avg
+        update_columns(Column, columns, 'is_date', 'is_index', 'is_label', 'use', 'log', 'diff', 'fill_na_avg')
+        ts_columns = {column.name: column for column in columns if column.belong_time_series}
+        label_column = sc.cleaned_data['score']
         algorithm_.from_datetime = sc.cleaned_data['from_datetime']
         algorithm_.to_datetime = sc.cleaned_data['to_datetime']
         algorithm_.periods = sc.cleaned_data['periods']
 
-        with open(algorithm_.dataframe.file.path, 'rb') as f:
-            intermediate_data_handle = pickle.load(f)
+        intermediate_data_handle = load_paper(algorithm_.dataframe)
         x = intermediate_data_handle['time_series']
 
-        features_log = [z.name for z in columns.filter(log=True)]
-        features_use = [z.name for z in columns.filter(use=True)]
+        features_log = [z.name for z in columns if z.log]
+        features_use = [z.name for z in columns if z.use]
         x[features_log] = x[features_log].apply(lambda z: np.log(z + 1))
         mm_x = MinMaxScaler()
         x[features_use] = mm_x.fit_transform(x[features_use])
@@ -331,19 +329,19 @@ def transform(req):
         if algorithm_.sheet_set.filter(is_label=True).exists():
             y = intermediate_data_handle['labels']
             mm_y = MinMaxScaler()
-            y[[columns.get(is_label=True).name]] = mm_y.fit_transform(y[[columns.get(is_label=True).name]])
-            intermediate_paper_handle = ContentFile(pickle.dumps([mm_x, mm_y]))
+            y[[label_column.name]] = mm_y.fit_transform(y[[label_column.name]])
+            intermediate_paper_handle = dump_paper([mm_x, mm_y], 3)
         else:
-            intermediate_paper_handle = ContentFile(pickle.dumps(mm_x))
+            intermediate_paper_handle = dump_paper(mm_x, 3)
         new_paper = Paper(user=req.user, role=3, name=f"Pre-processing Time Series #{algorithm_.id} Normalizer")
-        new_paper.file.save(f"pre_ts_{algorithm_.id}_normalizer.pkl", intermediate_paper_handle)
+        new_paper.file.save(f"pre_ts_{algorithm_.id}_normalizer.joblib", intermediate_paper_handle)
         new_paper.save()
         algorithm_.normalizers = new_paper
         algorithm_.save()
 
-        x_code = columns.get(belong_time_series=True, is_index=True).name
+        x_code = next(z.name for z in columns if z.belong_time_series and z.is_index)
         if algorithm_.sheet_set.filter(is_label=True).exists():
-            y_code = columns.get(belong_time_series=False, is_index=True).name
+            y_code = next(z.name for z in columns if not z.belong_time_series and z.is_index)
             code_list = list_union(np.unique(x[x_code].values), np.unique(y[y_code].values))
         else:
             code_list = np.unique(x[x_code].values)
@@ -356,7 +354,7 @@ def transform(req):
             raise Exception('Start datetime must be earlier than end datetime.')
         scale_date = np.linspace(start_date.value, end_date.value, algorithm_.periods + 1)
         scale_date = pd.to_datetime(scale_date)
-        date_variable_name = columns.get(belong_time_series=True, is_date=True).name
+        date_variable_name = next(z.name for z in columns if z.belong_time_series and z.is_date)
         date_slicer = pd.cut(x[date_variable_name].values, scale_date, ordered=True)
         x[date_variable_name] = date_slicer.codes.astype('int32')
 
@@ -367,18 +365,18 @@ def transform(req):
                 continue
             for i in range(len(features_use)):
                 name = features_use[i]
-                if columns.get(name=name).log:
+                if ts_columns[name].log:
                     attributes[code_dict[code], week + 1, i] = np.log(np.nansum(np.exp(transaction[name]) - 1) + 1)
                 else:
                     attributes[code_dict[code], week + 1, i] = np.nanmean(transaction[name])
         for i in range(len(features_use)):
             name = features_use[i]
-            if columns.get(name=name).fill_na_avg:
+            if ts_columns[name].fill_na_avg:
                 attributes[:, :, i] = np.nan_to_num(attributes[:, :, i], nan=feat_avg[i], posinf=feat_avg[i],
                                                     neginf=feat_avg[i])
             else:
                 attributes[:, :, i] = np.nan_to_num(attributes[:, :, i], nan=0, posinf=0, neginf=0)
-            if columns.get(name=name).diff:
+            if ts_columns[name].diff:
                 attributes[:, 1:, i] = np.diff(attributes[:, :, i], axis=1)
                 attributes[:, 0, i] = np.zeros(shape=attributes.shape[0])
         if algorithm_.sheet_set.filter(is_label=True).exists():
@@ -386,27 +384,23 @@ def transform(req):
             for code, score_array in y.groupby(y_code):
                 if code not in code_list:
                     continue
-                score[code_dict[code]] = np.nanmean(score_array[columns.get(is_label=True).name])
-            intermediate_paper_handle = ContentFile(
-                pickle.dumps({'index': code_list, 'X': attributes, 'Y': score, 'columns': features_use})
-            )
+                score[code_dict[code]] = np.nanmean(score_array[label_column.name])
+            intermediate_paper_handle = dump_paper({'index': code_list, 'X': attributes, 'Y': score, 'columns': features_use}, 2)
         else:
-            intermediate_paper_handle = ContentFile(
-                pickle.dumps({'index': code_list, 'X': attributes, 'columns': features_use})
-            )
+            intermediate_paper_handle = dump_paper({'index': code_list, 'X': attributes, 'columns': features_use}, 2)
         new_paper = Paper(user=req.user, role=2, name=f"Pre-processing Time Series #{algorithm_.id} Transformed")
-        new_paper.file.save(f"pre_ts_{algorithm_.id}_transformed.pkl", intermediate_paper_handle)
+        new_paper.file.save(f"pre_ts_{algorithm_.id}_transformed.joblib", intermediate_paper_handle)
         new_paper.save()
         step.predicted_data = new_paper
         # ---------- Asynchronous Algorithm END   ----------
     except Exception as e:
         step.status = 4
         step.error_message = str(e)
-        step.save()
+        step.save(update_fields=['predicted_data', 'status', 'error_message'])
         context = {"color": "danger", "content": "Interrupted.", "refresh": f"/pre_ts/{algorithm_.id}"}
         return render(req, "task_manager/hint_widget.html", context)
     step.status = 3
-    step.save()
+    step.save(update_fields=['predicted_data', 'status'])
     context = {"color": "success", "content": "The columns are successfully configured.",
                "refresh": f"/pre_ts/{algorithm_.id}"}
     return render(req, "task_manager/hint_widget.html", context)
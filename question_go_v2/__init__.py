@@ -0,0 +1,2 @@
+# Connection setup of the database profiles in settings, connected whenever the project is loaded.
+from . import database  # noqa: F401
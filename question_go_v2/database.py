@@ -0,0 +1,20 @@
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+sqlite_pragmas = {
+    # Readers see the last commit while a job writes, instead of being blocked by the rollback journal.
+    'journal_mode': 'WAL',
+    # In WAL mode, the database stays consistent after a crash without syncing at every commit.
+    'synchronous': 'NORMAL',
+    'mmap_size': 268435456,
+}
+
+
+@receiver(connection_created)
+def tune_sqlite(sender, connection, **kwargs):
+    """Apply the PRAGMAs to every SQLite connection of the "sqlite" database profile."""
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for name, value in sqlite_pragmas.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
@@ -10,6 +10,8 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/3.2/ref/settings/
 """
 
+import json
+import os
 from pathlib import Path
 from django.shortcuts import Http404
 
@@ -103,12 +105,28 @@ WSGI_APPLICATION = 'question_go_v2.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/3.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# The profile is selected by the environment variable QUESTION_GO_DATABASE. "sqlite" (default) suits a single server,
+# where connections are tuned by "question_go_v2.database.tune_sqlite". "postgresql" reads the connection (NAME, USER,
+# PASSWORD, HOST, PORT) from token/postgresql.json, and keeps connections open across requests.
+DATABASE_PROFILE = os.environ.get('QUESTION_GO_DATABASE', 'sqlite')
+if DATABASE_PROFILE == 'postgresql':
+    with open("token/postgresql.json", "r") as f:
+        DATABASES = {
+            'default': {
+                'ENGINE': 'django.db.backends.postgresql',
+                **json.load(f),
+                'CONN_MAX_AGE': 600,
+            }
+        }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+            # A writer waits up to this many seconds for the lock instead of failing with "database is locked".
+            'OPTIONS': {'timeout': 20},
+        }
     }
-}
 
 
 # Password validation
@@ -151,6 +169,13 @@ STATIC_URL = '/static/'
 STATICFILES_DIRS = ['templates/static']
 MEDIA_ROOT = 'storage'
 
+# Papers are sent by Django ('django'), or by the front-end server after the permission check: 'x-accel' for nginx,
+# whose internal location PAPER_ACCEL_PREFIX is an alias of MEDIA_ROOT, or 'x-sendfile' for Apache and lighttpd.
+PAPER_DOWNLOAD_MODE = 'django'
+PAPER_ACCEL_PREFIX = '/protected/'
+# Compress papers of text and pickle formats while sending them, in 'django' mode.
+PAPER_GZIP_DOWNLOADS = True
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
 
@@ -65,6 +65,7 @@ urlpatterns = [
     path('step/data/delete/<int:step_id>', v2.delete_data),
     path('step/data/search', v2.search_data),
     path('step/predicted/delete/<int:step_id>', v2.delete_predicted),
+    path('figure/<str:digest>.svg', v2.view_figure),
     # paypal
     path('paypal/refund', v3.view_refund_policy),
     path('paypal/plans', v3.view_plans),
@@ -77,6 +78,11 @@ urlpatterns = [
     path('library/paper/delete', v4.delete_paper),
     path('library/paper/<int:paper_id>', v4.view_paper),
     path('library/paper/rename', v4.rename_paper),
+    path('library/upload/init', v4.init_upload),
+    path('library/upload/<int:upload_id>', v4.view_upload),
+    path('library/upload/<int:upload_id>/append', v4.append_upload),
+    path('library/upload/<int:upload_id>/commit', v4.commit_upload),
+    path('library/upload/<int:upload_id>/abort', v4.abort_upload),
     # algorithm: linear regression
     path('algo_linear_regression/add', v5.add_lr),
     path('algo_linear_regression/<int:algo_id>', v5.view_lr),
@@ -102,6 +108,7 @@ urlpatterns = [
     path('pre_cross_sectional/profile/generate', v7.generate_profile),
     path('pre_cross_sectional/profile/<int:algo_id>', v7.view_profile),
     path('pre_cross_sectional/action/<str:form_name>', v7.preprocessing_wrapper),
+    path('pre_cross_sectional/apply', v7.apply_recipe),
     # pre-processing: time series
     path('pre_ts/add', v8.add_ts),
     path('pre_ts/<int:algo_id>', v8.view_ts),
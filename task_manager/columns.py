@@ -0,0 +1,39 @@
+from django.db import transaction
+
+
+def replace_columns(model, algorithm, names, **fields):
+    """
+    Replace the columns registered for an algorithm with one DELETE and one INSERT.
+
+    :param model: the ``Column`` model of the application.
+    :param algorithm: the algorithm instance which owns the columns.
+    :param names: the new column names, usually ``dataframe.columns``.
+    :param fields: other field values shared by all new columns.
+    """
+    with transaction.atomic():
+        model.objects.filter(algorithm=algorithm).delete()
+        model.objects.bulk_create([model(algorithm=algorithm, name=name, **fields) for name in names])
+
+
+def add_columns(model, algorithm, names, **fields):
+    model.objects.bulk_create([model(algorithm=algorithm, name=name, **fields) for name in names])
+
+
+def flag_columns(model, algorithm, **selections):
+    """
+    Set boolean fields to True on the selected columns, for example ``x_column=queryset, y_column=[column]``. Each
+    field is one UPDATE, and all of them are in one transaction.
+    """
+    with transaction.atomic():
+        for field, columns in selections.items():
+            model.objects.filter(algorithm=algorithm, pk__in=[x.pk for x in columns]).update(**{field: True})
+
+
+def unflag_columns(model, algorithm, *fields):
+    model.objects.filter(algorithm=algorithm).update(**{field: False for field in fields})
+
+
+def update_columns(model, columns, *fields):
+    """Write the given fields of changed column instances with one bulk UPDATE."""
+    with transaction.atomic():
+        model.objects.bulk_update(columns, fields)
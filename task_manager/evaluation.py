@@ -0,0 +1,51 @@
+import numpy as np
+from scipy.stats import rankdata
+
+
+def roc_auc(y_1h, scores):
+    """
+    One-vs-rest ROC AUC of every class, equal to ``roc_auc_score(y_1h[:, i], scores[:, i])`` for each i. It's the
+    Mann-Whitney statistic, so all classes are ranked at once and tied scores get the average rank.
+
+    :param y_1h: one-hot labels, shape (n_samples, n_classes).
+    :param scores: probabilities or decision values of each class, of the same shape.
+    :return: AUCs, shape (n_classes,)
+    """
+    y_1h = np.asarray(y_1h, dtype=bool)
+    n_positive = y_1h.sum(axis=0)
+    n_negative = y_1h.shape[0] - n_positive
+    if np.any(n_positive == 0) or np.any(n_negative == 0):
+        raise ValueError("Only one class present in y_true. ROC AUC score is not defined in that case.")
+    ranks = rankdata(scores, axis=0)
+    rank_sum = np.where(y_1h, ranks, 0).sum(axis=0)
+    return (rank_sum - n_positive * (n_positive + 1) / 2) / (n_positive * n_negative)
+
+
+def mean_roc_auc(y_1h, scores):
+    """Objective of classifiers' hyper-parameter searches."""
+    return float(np.mean(roc_auc(y_1h, scores)))
+
+
+def roc_curves(y_1h, scores, fpr_grid):
+    """
+    One-vs-rest ROC curves of every class, interpolated on a common grid of false positive rate, equal to
+    ``np.interp(fpr_grid, *roc_curve(y_1h[:, i], scores[:, i])[:2])`` for each i. Scores of all classes are sorted
+    with one call, and the cumulative counts of true and false positives are computed for all classes together.
+
+    :return: true positive rates, shape (n_classes, len(fpr_grid))
+    """
+    y_1h = np.asarray(y_1h, dtype=np.float64)
+    scores = np.asarray(scores)
+    order = np.argsort(-scores, axis=0, kind='mergesort')
+    sorted_scores = np.take_along_axis(scores, order, axis=0)
+    tps = np.cumsum(np.take_along_axis(y_1h, order, axis=0), axis=0)
+    fps = np.arange(1, y_1h.shape[0] + 1)[:, np.newaxis] - tps
+    # The curve has a point after the last sample of each distinct score.
+    last_of_ties = np.ones_like(sorted_scores, dtype=bool)
+    last_of_ties[:-1] = sorted_scores[:-1] != sorted_scores[1:]
+
+    tpr = np.empty((y_1h.shape[1], len(fpr_grid)))
+    for i in range(y_1h.shape[1]):
+        tp, fp = tps[last_of_ties[:, i], i], fps[last_of_ties[:, i], i]
+        tpr[i] = np.interp(fpr_grid, np.r_[0, fp / fp[-1]], np.r_[0, tp / tp[-1]])
+    return tpr
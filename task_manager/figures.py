@@ -0,0 +1,62 @@
+import gzip
+import hashlib
+import io
+
+import matplotlib.pyplot as plt
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import migrations
+
+
+def figure_path(digest):
+    return f"figures/{digest}.svg.gz"
+
+
+def is_digest(text):
+    return len(text) == 64 and all(c in '0123456789abcdef' for c in text)
+
+
+def save_svg(svg: str):
+    """
+    Store a SVG figure compressed, named by the SHA-256 of its content, so that identical figures share one file and
+    the file of a name never changes.
+
+    :return: the digest, which is saved in the figure field of models and forms the URL "/figure/<digest>.svg".
+    """
+    data = svg.encode('utf-8')
+    digest = hashlib.sha256(data).hexdigest()
+    if not default_storage.exists(figure_path(digest)):
+        default_storage.save(figure_path(digest), ContentFile(gzip.compress(data, mtime=0)))
+    return digest
+
+
+def save_figure(fig):
+    """Render a matplotlib figure to SVG, close it and store it by "save_svg"."""
+    f = io.StringIO()
+    # The creation date is omitted, so that a figure has the same digest whenever it's rendered.
+    fig.savefig(f, format='svg', metadata={'Date': None})
+    plt.close(fig)
+    return save_svg(f.getvalue())
+
+
+def load_svg(digest):
+    with default_storage.open(figure_path(digest), 'rb') as f:
+        return gzip.decompress(f.read()).decode('utf-8')
+
+
+def store_inline_figures(app_label, model_name, field):
+    """
+    Migration operation, which moves SVG text saved in the TextField ``field`` to figure files and leaves the digest
+    in the field. It should run before the field is altered to hold digests only.
+    """
+    def forward(apps, schema_editor):
+        for algorithm in apps.get_model(app_label, model_name).objects.exclude(**{field: ''}).only('id', field):
+            setattr(algorithm, field, save_svg(getattr(algorithm, field)))
+            algorithm.save(update_fields=[field])
+
+    def backward(apps, schema_editor):
+        for algorithm in apps.get_model(app_label, model_name).objects.exclude(**{field: ''}).only('id', field):
+            setattr(algorithm, field, load_svg(getattr(algorithm, field)))
+            algorithm.save(update_fields=[field])
+
+    return migrations.RunPython(forward, backward)
@@ -0,0 +1,117 @@
+import numpy as np
+from sklearn.kernel_approximation import Nystroem, RBFSampler
+from sklearn.metrics.pairwise import pairwise_kernels
+
+kernel_modes = [
+    ('exact', 'Exact kernel (libsvm), suitable for up to ~10,000 samples'),
+    ('nystroem', 'Nystroem approximation with linear SVM, for large data'),
+    ('rff', 'Random Fourier features with linear SVM, for large data (RBF kernel only)'),
+]
+
+
+def scale_gamma(x):
+    """gamma='scale' of sklearn's SVM."""
+    x_var = x.var()
+    return 1 / (x.shape[1] * x_var) if x_var != 0 else 1.0
+
+
+class KernelCache:
+    """
+    Gram matrices of one training set, shared by the probes of an SVM hyper-parameter search. The kernel doesn't
+    depend on C, so all probes with the same kernel (and polynomial degree) reuse one matrix through
+    ``kernel='precomputed'``. Kernel parameters follow the defaults of sklearn's SVC/SVR (gamma='scale', coef0=0).
+
+    If one matrix exceeds the memory budget, probes fall back to libsvm's own kernel evaluation with the budget as its
+    row cache.
+    """
+
+    def __init__(self, x, kernel: str, max_mb: int):
+        self.x = np.asarray(x, dtype=np.float64)
+        self.kernel = kernel
+        self.max_mb = max_mb
+        self.gamma = scale_gamma(self.x)
+        self.matrices = {}
+
+    def matrix_bytes(self):
+        return self.x.shape[0] ** 2 * self.x.itemsize
+
+    def fits(self):
+        return self.matrix_bytes() <= self.max_mb * 1048576
+
+    def gram(self, degree: int = 3):
+        key = degree if self.kernel == 'poly' else None
+        if key not in self.matrices:
+            # Evict the oldest matrices (of other degrees) to stay in the memory budget.
+            while self.matrices and (len(self.matrices) + 1) * self.matrix_bytes() > self.max_mb * 1048576:
+                del self.matrices[next(iter(self.matrices))]
+            self.matrices[key] = pairwise_kernels(self.x, metric=self.kernel, **self.kernel_params(degree))
+        return self.matrices[key]
+
+    def kernel_params(self, degree: int = 3):
+        if self.kernel == 'rbf':
+            return {'gamma': self.gamma}
+        if self.kernel == 'poly':
+            return {'gamma': self.gamma, 'degree': degree, 'coef0': 0}
+        if self.kernel == 'sigmoid':
+            return {'gamma': self.gamma, 'coef0': 0}
+        return {}
+
+    def design(self, degree: int = 3):
+        """
+        :return: the keyword arguments of SVC/SVR and the training input for a probe. Use the same input to predict on
+            the training set.
+        """
+        if self.fits():
+            return {'kernel': 'precomputed'}, self.gram(degree)
+        return {'kernel': self.kernel, 'degree': degree, 'cache_size': self.max_mb}, self.x
+
+
+class FeatureMapCache:
+    """
+    Explicit feature maps whose inner products approximate the kernel, so a linear SVM on the mapped features
+    approximates the kernel SVM at a cost linear in the sample size. As with ``KernelCache``, the features don't depend
+    on C and are computed once per polynomial degree.
+
+    ``approximation`` is 'nystroem' (any kernel) or 'rff' (random Fourier features, rbf kernel only).
+    """
+
+    def __init__(self, x, kernel: str, approximation: str, n_components: int, random_state=None):
+        self.x = np.asarray(x, dtype=np.float64)
+        self.kernel = kernel
+        self.approximation = approximation
+        self.n_components = min(n_components, self.x.shape[0])
+        self.random_state = random_state
+        self.gamma = scale_gamma(self.x)
+        self.features = {}
+
+    def design(self, degree: int = 3):
+        """
+        :return: the fitted feature map and the mapped training set.
+        """
+        key = degree if self.kernel == 'poly' else None
+        if key not in self.features:
+            if self.approximation == 'rff':
+                feature_map = RBFSampler(gamma=self.gamma, n_components=self.n_components,
+                                         random_state=self.random_state)
+            else:
+                feature_map = Nystroem(kernel=self.kernel, gamma=self.gamma, degree=degree, coef0=0,
+                                       n_components=self.n_components, random_state=self.random_state)
+            self.features.clear()
+            self.features[key] = feature_map, feature_map.fit_transform(self.x)
+        return self.features[key]
+
+    def describe(self):
+        name = 'Random Fourier features' if self.approximation == 'rff' else 'Nystroem'
+        return f'{name}, {self.n_components} components'
+
+
+def search_cache(config: dict, x):
+    """
+    :param config: cleaned data of the train form, with "kernel", "kernel_mode", "kernel_cache_mb", "n_components" and
+        "random_seed".
+    :param x: the training set.
+    :return: ``KernelCache`` in exact mode, otherwise ``FeatureMapCache``.
+    """
+    if config['kernel_mode'] == 'exact':
+        return KernelCache(x, config['kernel'], config['kernel_cache_mb'])
+    return FeatureMapCache(x, config['kernel'], config['kernel_mode'], config['n_components'], config['random_seed'])
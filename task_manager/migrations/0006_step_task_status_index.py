@@ -0,0 +1,17 @@
+# Generated by Django 4.0.4 on 2026-10-19 17:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('task_manager', '0005_alter_step_predicted_data'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='step',
+            index=models.Index(fields=['task', 'status'], name='task_manage_task_id_0c305c_idx'),
+        ),
+    ]
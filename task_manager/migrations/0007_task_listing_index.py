@@ -0,0 +1,17 @@
+# Generated by Django 4.0.4 on 2026-10-19 17:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('task_manager', '0006_step_task_status_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['user', 'modified_time'], name='task_manage_user_id_a8bcb5_idx'),
+        ),
+    ]
@@ -3,17 +3,39 @@ from django.db import models
 from library.models import Paper
 
 
+class AlgorithmManager(models.Manager):
+    """
+    Manager of algorithm models, which leaves large text fields (training history, metrics in JSON) out of queries by
+    default, because most views only check ownership or write results. A deferred field is loaded by one query when
+    it's accessed, and saving an instance only writes loaded or assigned fields.
+    """
+
+    def __init__(self, *heavy_fields):
+        super().__init__()
+        self.heavy_fields = heavy_fields
+
+    def get_queryset(self):
+        return super().get_queryset().defer(*self.heavy_fields)
+
+    def with_heavy_fields(self):
+        """For pages that render the heavy fields, so that they're loaded together with the row."""
+        return super().get_queryset()
+
+
 class Task(models.Model):
     user = models.ForeignKey(User, models.CASCADE)
     created_time = models.DateTimeField(auto_now_add=True)
     modified_time = models.DateTimeField(auto_now=True)
     name = models.CharField(max_length=64)
 
+    class Meta:
+        indexes = [models.Index(fields=['user', 'modified_time'])]
+
     def __str__(self):
         return self.name
 
     def busy(self):
-        return any([x.status == 2 for x in self.step_set.all()])
+        return self.step_set.filter(status=2).exists()
 
 
 class OpenedTask(models.Model):
@@ -24,6 +46,26 @@ class OpenedTask(models.Model):
         return self.user.username
 
 
+def opened_task_id(user):
+    """
+    Id of the task opened by the user, or None. It's cached on the user instance, which lives as long as the request,
+    so all ownership checks of a request share one query.
+    """
+    if not user.is_authenticated:
+        return None
+    try:
+        return user.opened_task_id_cache
+    except AttributeError:
+        user.opened_task_id_cache = OpenedTask.objects.filter(user=user).values_list('task_id', flat=True).first()
+        return user.opened_task_id_cache
+
+
+def forget_opened_task(user):
+    """Call it after the user opens or closes a task in the request."""
+    if hasattr(user, 'opened_task_id_cache'):
+        del user.opened_task_id_cache
+
+
 color_picker = {1: "text-primary", 2: "text-warning", 3: "text-success", 4: "text-danger"}
 
 
@@ -39,8 +81,11 @@ class Step(models.Model):
     note = models.TextField(blank=True)
     error_message = models.TextField(blank=True)
 
+    class Meta:
+        indexes = [models.Index(fields=['task', 'status'])]
+
     def __str__(self): return self.view_link
 
     def status_color(self): return color_picker[self.status]
 
-    def open_permission(self, user): return any([x.user == user for x in self.task.openedtask_set.all()])
+    def open_permission(self, user): return self.task_id == opened_task_id(user)
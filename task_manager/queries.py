@@ -0,0 +1,108 @@
+import base64
+import functools
+import json
+import logging
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import connection
+from django.db.models import Q
+
+logger = logging.getLogger(__name__)
+
+
+def query_budget(limit):
+    """
+    Decorator of views, which counts SQL queries run by the view in debug mode, and warns if there are more than
+    ``limit``. Pages listing rows should be built by a constant number of queries, whatever the number of rows.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(req, *args, **kwargs):
+            if not settings.DEBUG:
+                return view(req, *args, **kwargs)
+            count = 0
+
+            def counter(execute, sql, params, many, context):
+                nonlocal count
+                count += 1
+                return execute(sql, params, many, context)
+
+            with connection.execute_wrapper(counter):
+                response = view(req, *args, **kwargs)
+            if count > limit:
+                logger.warning(f"{view.__name__} runs {count} queries, over its budget of {limit}.")
+            return response
+        return wrapper
+    return decorator
+
+
+class KeysetPage:
+    """
+    A page of rows that follow the last row of the former page in the ordering, found by an indexed range instead of
+    OFFSET, so that a later page costs the same as the first one. The position is carried by the "after" parameter of
+    the URL. Iterating the page gives its rows.
+    """
+
+    def __init__(self, req, queryset, ordering, page_size=50):
+        """
+        :param ordering: fields as in "order_by", which should be covered by an index together with the filters of
+            ``queryset``. The id is appended to break ties.
+        """
+        ordering = [*ordering, '-id']
+        names = [field.lstrip('-') for field in ordering]
+        queryset = queryset.order_by(*ordering)
+        values = decode_cursor(req.GET.get('after', ''), [ordering_field(queryset, name) for name in names])
+        if values is not None:
+            first_bound = {f"{names[0]}__{'lte' if ordering[0].startswith('-') else 'gte'}": values[0]}
+            condition = Q()
+            for i, field in enumerate(ordering):
+                condition |= Q(**{names[j]: values[j] for j in range(i)},
+                               **{f"{names[i]}__{'lt' if field.startswith('-') else 'gt'}": values[i]})
+            queryset = queryset.filter(Q(**first_bound) & condition)
+        rows = list(queryset[:page_size + 1])
+        self.rows = rows[:page_size]
+
+        query = req.GET.copy()
+        for name in ['after', 'message', 'color']:
+            query.pop(name, None)
+        self.first_query = query.urlencode() if values is not None else None
+        if len(rows) > page_size:
+            query['after'] = encode_cursor([getattr(self.rows[-1], name) for name in names])
+            self.next_query = query.urlencode()
+        else:
+            self.next_query = None
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def __len__(self):
+        return len(self.rows)
+
+
+def encode_cursor(values):
+    # Datetimes keep their microseconds, which the comparison with the next page relies on.
+    text = json.dumps(values, default=lambda value: value.isoformat())
+    return base64.urlsafe_b64encode(text.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor, fields):
+    """
+    Return None for the first page, or a cursor that's malformed or tampered with. Values are converted by the fields
+    they're compared with, so that a value of a wrong type gives the first page rather than a database error.
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        if not isinstance(values, list) or len(values) != len(fields):
+            return None
+        values = [field.to_python(value) for field, value in zip(fields, values)]
+    except (TypeError, ValueError, ValidationError):
+        return None
+    return None if None in values else values
+
+
+def ordering_field(queryset, name):
+    """The model field or the annotation of ``queryset`` that it's ordered by."""
+    if name in queryset.query.annotations:
+        return queryset.query.annotations[name].output_field
+    return queryset.model._meta.get_field(name)
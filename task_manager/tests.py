@@ -1,3 +1,40 @@
-from django.test import TestCase
+from django.contrib.auth.models import User
+from django.test import RequestFactory, TestCase
 
-# Create your tests here.
+from .models import OpenedTask, Step, Task
+from .views import view_instances, view_task
+
+
+class QueryCountTestCase(TestCase):
+    """Pages listing tasks and steps should run the same number of queries whatever the number of rows."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser('user', 'user@example.com', 'password')
+        tasks = Task.objects.bulk_create(Task(user=cls.user, name=f"Task {i}") for i in range(100))
+        cls.task = tasks[0]
+        OpenedTask.objects.create(user=cls.user, task=cls.task)
+        Step.objects.bulk_create(
+            Step(task=task, name=f"Step {i}", model_id=i, view_link=f"/algorithm/{i}", status=i % 4 + 1)
+            for task in tasks[:2] for i in range(100)
+        )
+
+    def request(self):
+        """A fresh user instance per request, so that the opened task isn't cached by a former request."""
+        req = RequestFactory().get('/')
+        req.user = User.objects.get(id=self.user.id)
+        return req
+
+    def test_view_task(self):
+        req = self.request()
+        with self.assertNumQueries(3):
+            response = view_task(req, self.task.id)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "Step 99")
+
+    def test_view_instances(self):
+        req = self.request()
+        with self.assertNumQueries(3):
+            response = view_instances(req)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "Task 99")
@@ -1,13 +1,21 @@
+import gzip
+
 import pandas as pd
 from django import forms
 from django.contrib.auth.decorators import permission_required
-from django.http.response import HttpResponse
+from django.core.files.storage import default_storage
+from django.db.models import Count
+from django.http.response import FileResponse, Http404, HttpResponse, HttpResponseNotModified
 from django.shortcuts import render, redirect
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST
 
+from library.models import search_papers
+from library.serialization import load_paper
 from question_go_v2.settings import TIME_ZONE
+from .figures import figure_path, is_digest
 from .models import *
+from .queries import KeysetPage, query_budget
 from .register import algorithm_registry
 
 
@@ -20,14 +28,14 @@ def view_main_page(req):
 
 
 @permission_required("task_manager.view_task", login_url=f"/main?message=No permission to view task.&color=danger")
+@query_budget(3)
 def view_instances(req):
-    try:
-        default_task = OpenedTask.objects.get(user=req.user).task
-    except OpenedTask.DoesNotExist:
-        default_task = None
+    tasks = Task.objects.filter(user=req.user).annotate(step_count=Count('step'))
+    opened_id = opened_task_id(req.user)
+    default_task = tasks.filter(id=opened_id).first() if opened_id else None
     context = {
         "opened_task": default_task,
-        "tasks": Task.objects.filter(user=req.user).exclude(openedtask__user=req.user),
+        "tasks": KeysetPage(req, tasks.exclude(id=opened_id) if opened_id else tasks, ['-modified_time']),
         "timezone": TIME_ZONE,
         "rename_task_form": RenameTask(),
     }
@@ -36,13 +44,15 @@ def view_instances(req):
 
 @permission_required("task_manager.view_task",
                      login_url="/task/instances?message=You don't have permission to view this task.&color=danger")
+@query_budget(3)
 def view_task(req, task_id):
-    try:
-        this_task = Task.objects.get(id=task_id, openedtask__user=req.user)
-    except Task.DoesNotExist:
+    if task_id != opened_task_id(req.user):
         return redirect("/task/instances?message=This task is closed or isn't published to you.&color=danger")
+    this_task = Task.objects.get(id=task_id)
     context = {
         "task": this_task,
+        # Only the columns listed by the page, without notes and error messages.
+        "steps": this_task.step_set.only('id', 'task', 'name', 'model_id', 'view_link', 'status').order_by('id'),
         "spinner_color_picker": ["primary", "warning", "success", "danger"],
         'registry': algorithm_registry,
     }
@@ -59,6 +69,7 @@ def open_task(req, task_id):
     except OpenedTask.DoesNotExist:
         open_task_ = OpenedTask(user=req.user, task_id=task_id)
         open_task_.save()
+    forget_opened_task(req.user)
     return redirect(f"/task/{task_id}?message=Opened successfully.&color=success")
 
 
@@ -72,6 +83,7 @@ def close_task(req):
     if opened_task.task.busy():
         return redirect("/task/instances?message=This task is busy, so it cannot be closed.&color=danger")
     opened_task.delete()
+    forget_opened_task(req.user)
     return redirect("/task/instances?message=Close successfully.&color=success")
 
 
@@ -123,6 +135,7 @@ def add_task(req):
         except OpenedTask.DoesNotExist:
             new_opened_task = OpenedTask(user=req.user, task=new_task)
         new_opened_task.save()
+        forget_opened_task(req.user)
         return redirect(f"/task/{new_task.id}?message=Task added successfully.&color=success")
     return redirect("/task/instances?message=Task added successfully.&color=success")
 
@@ -196,7 +209,7 @@ def change_note(req):
         context = {"color": "danger", "content": "Do not have permission to change this step."}
         return render(req, "task_manager/hint_widget.html", context)
     step.note = note.cleaned_data['note']
-    step.save()
+    step.save(update_fields=['note'])
     context = {"color": "success", "content": "Note is changed successfully."}
     return render(req, "task_manager/hint_widget.html", context)
 
@@ -210,18 +223,44 @@ def confirm_error(req, step_id):
         return redirect("/task/retrieve?message=This instance doesn't exist.&color=danger")
     step.error_message = str()
     step.status = 1
-    step.save()
+    step.save(update_fields=['error_message', 'status'])
     return redirect(step.view_link)
 
 
+@permission_required("task_manager.view_task", login_url="/main?message=No permission to view tasks.&color=danger")
+def view_figure(req, digest):
+    """
+    Figures are named by the digest of their content, so they can be cached by the browser without revalidation, and
+    a figure which is shown repeatedly is not transferred again.
+    """
+    if not (is_digest(digest) and default_storage.exists(figure_path(digest))):
+        raise Http404
+    etag = f'"{digest}"'
+    if req.headers.get('If-None-Match') == etag:
+        response = HttpResponseNotModified()
+    elif 'gzip' in req.headers.get('Accept-Encoding', ''):
+        # Without the filename, the stored name "*.svg.gz" would be offered when the figure is saved.
+        response = FileResponse(default_storage.open(figure_path(digest)), content_type='image/svg+xml',
+                                filename=f"{digest}.svg")
+        response['Content-Encoding'] = 'gzip'
+    else:
+        with default_storage.open(figure_path(digest)) as f:
+            response = HttpResponse(gzip.decompress(f.read()), content_type='image/svg+xml')
+        response['Content-Disposition'] = f'inline; filename="{digest}.svg"'
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, max-age=31536000, immutable'
+    response['Vary'] = 'Accept-Encoding'
+    return response
+
+
 class DataPicker(forms.Form):
     step = forms.ModelChoiceField(Step.objects.all(), widget=forms.HiddenInput())
     paper = forms.ModelChoiceField(Paper.objects.all(), widget=forms.Select({'class': 'form-select'}), empty_label=None)
-    data_format = forms.ChoiceField(choices=[(1, "Spreadsheet [*.xlsx]"), (2, "Binary [*.pkl]")],
+    data_format = forms.ChoiceField(choices=[(1, "Spreadsheet [*.xlsx]"), (2, "Binary [*.joblib, *.pkl]")],
                                     widget=forms.Select({"class": "form-select"}))
 
     def load_choices(self, user, search):
-        queryset = Paper.objects.filter(user=user, name__contains=search)
+        queryset = search_papers(user, search)
         self.fields['step'].queryset = Step.objects.filter(task__user=user)
         self.fields['paper'].queryset = queryset
 
@@ -268,16 +307,16 @@ def import_training_set_v2(req):
     step = data_picker.cleaned_data['step']
     step.linked_data = paper
     step.status = 2
-    step.save()
+    step.save(update_fields=['linked_data', 'status'])
     try:
         if data_picker.cleaned_data['data_format'] == '1':
             table = pd.read_excel(paper.file.path, sheet_name=0)
             table.columns = [x.__str__() for x in table.columns]
         else:
-            table = pd.read_pickle(paper.file.path)
+            table = load_paper(paper)
     except Exception as e:
         step.status = 4
-        step.save()
+        step.save(update_fields=['status'])
         return None, step, e.__str__()
     return table, step, None
 
@@ -298,7 +337,7 @@ def import_predicting_set_v2(req):
             table = pd.read_excel(paper.file.path, sheet_name=0)
             table.columns = [x.__str__() for x in table.columns]
         else:
-            table = pd.read_pickle(paper.file.path)
+            table = load_paper(paper)
     except Exception as e:
         return None, step, e.__str__()
     return table, step, None
@@ -313,7 +352,7 @@ def delete_data(req, step_id):
         return redirect('/task/retrieve?message=You don\'t have access change this step.&color=danger')
     step.status = 1
     step.linked_data = None
-    step.save()
+    step.save(update_fields=['status', 'linked_data'])
     return redirect(step.view_link)
 
 
@@ -326,5 +365,5 @@ def delete_predicted(req, step_id):
         return redirect('/task/retrieve?message=You don\'t have access change this step.&color=danger')
     step.status = 1
     step.predicted_data = None
-    step.save()
+    step.save(update_fields=['status', 'predicted_data'])
     return redirect(step.view_link)
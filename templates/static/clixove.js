@@ -68,3 +68,49 @@ function scale_svg(container_id, max_width=400, height_ratio=1) {
         this_svg.setAttribute('height', proper_height_.toString() + 'px')
     }
 }
+async function sha256_hex(buffer) {
+    const digest = new Uint8Array(await crypto.subtle.digest('SHA-256', buffer));
+    return Array.from(digest, (b) => b.toString(16).padStart(2, '0')).join('');
+}
+async function chunked_upload(file, on_progress) {
+    // Upload a file to the library by chunks. The upload of an interrupted file is resumed if the same file is chosen
+    // again. Return null if the paper is added, otherwise the error message.
+    const key = ['upload', file.name, file.size, file.lastModified].join(':');
+    let status = null;
+    if (localStorage.getItem(key) !== null) {
+        const response = await fetch('/library/upload/' + localStorage.getItem(key));
+        if (response.ok) status = await response.json();
+    }
+    if (status === null) {
+        const form = new FormData();
+        form.append('name', file.name);
+        form.append('size', file.size);
+        const response = await fetch('/library/upload/init', {method: 'POST', body: form});
+        status = await response.json();
+        if (!response.ok) return status.error;
+        localStorage.setItem(key, status.upload);
+    }
+    let refused = 0;
+    while (status.received < status.size) {
+        on_progress(status.received, status.size);
+        const chunk = await file.slice(status.received, status.received + status.chunk_size).arrayBuffer();
+        const url = `/library/upload/${status.upload}/append?offset=${status.received}&sha256=${await sha256_hex(chunk)}`;
+        const response = await fetch(url, {method: 'POST', body: chunk,
+                                           headers: {'Content-Type': 'application/octet-stream'}});
+        const result = await response.json();
+        // A refused chunk (409) is sent again from where the server has received. If the same chunk is refused
+        // repeatedly, e.g. the file is modified during the upload, the upload is aborted.
+        if (!response.ok && response.status !== 409) return result.error;
+        refused = response.ok || result.received !== status.received ? 0 : refused + 1;
+        if (refused >= 3) {
+            await fetch(`/library/upload/${status.upload}/abort`, {method: 'POST'});
+            localStorage.removeItem(key);
+            return result.error;
+        }
+        status = result;
+    }
+    on_progress(status.size, status.size);
+    const response = await fetch(`/library/upload/${status.upload}/commit`, {method: 'POST'});
+    localStorage.removeItem(key);
+    return response.ok ? null : (await response.json()).error;
+}